@@ -10,33 +10,71 @@ class ChatCommunity:
 
     users: list[Chatuser]
     pending_users: list[Chatuser]
-    pending_operations: list[PendingOperation]
 
     def __init__(self):
         self.users = []
         self.pending_users = []
-        self.pending_operations = []
+        self._build_index()
+
+    def _build_index(self, pending_operations: list[PendingOperation] = None) -> None:
+        """indexes by user id and user name, the set of admins and pending operations by (user id, operation code)"""
+        self._by_id = {}
+        self._by_name = {}
+        self._admins = {}
+        for user in self.users:
+            self._index(user)
+        self._pending = {}
+        for o in pending_operations or []:
+            self._pending[(o.user_id, o.operation)] = o
+
+    def _index(self, user: Chatuser) -> None:
+        self._by_id[user.user_id] = user
+        if user.name:
+            self._by_name[user.name] = user
+        if user.status == Chatuser.ADMIN:
+            self._admins[user.user_id] = user
+        else:
+            self._admins.pop(user.user_id, None)
+
+    def __getstate__(self):
+        return {'users': self.users, 'pending_users': self.pending_users, 'pending_operations': self.pending_operations}
+
+    def __setstate__(self, state):
+        self.users = state['users']
+        self.pending_users = state['pending_users']
+        self._build_index(state['pending_operations'])
+
+    @property
+    def pending_operations(self) -> list[PendingOperation]:
+        return list(self._pending.values())
+
+    @pending_operations.setter
+    def pending_operations(self, value: list[PendingOperation]):
+        self._pending = {(o.user_id, o.operation): o for o in value}
 
     def empty(self) -> bool:
         return not self.users
-    
+
     def find_user(self, userid: int, effective_user = None) -> Chatuser:
-        user = next((x for x in self.users if x.user_id == userid), None)
+        user = self._by_id.get(userid, None)
         if user and effective_user:
             if hasattr(effective_user, "username"):
-                user.name = effective_user.username
+                self.rename(user, effective_user.username)
             if hasattr(effective_user, "full_name"):
                 user.full_name = effective_user.full_name
             if hasattr(effective_user, "language_code"):
                 user.language_code = effective_user.language_code
         return user
-    
+
+    def find_user_by_name(self, name: str) -> Chatuser:
+        return self._by_name.get(name, None)
+
     def trusted(self, userid: int):
-        user_object = self.find_user(userid)
+        user_object = self._by_id.get(userid, None)
         return user_object.status in {Chatuser.TRUSTED, Chatuser.ADMIN} if user_object else False
-    
+
     def find_or_add(self, userid, username, full_name, status = None, language_code = None) -> Chatuser:
-        user = next((x for x in self.users if x.user_id == userid), None)
+        user = self._by_id.get(userid, None)
         #hack: Telegram may report the system OS language to the server for the current user, but not the UI language set in the client
         #if language_code == 'en':
         #    language_code = credentials["telegram"]["chat"]["language"]
@@ -44,28 +82,58 @@ class ChatCommunity:
             if not status:
                 status = Chatuser.NEW
             user = Chatuser(username, userid, status, full_name, language_code)
-            self.users.append(user)
+            self.add(user)
         else:
             user.full_name = full_name
             user.language_code = language_code
         return user
-    
+
     def add(self, user: Chatuser) -> None:
         self.users.append(user)
+        self._index(user)
+
+    def add_or_replace(self, user: Chatuser) -> None:
+        existing = self._by_id.get(user.user_id, None)
+        if not existing:
+            self.add(user)
+            return
+        #by identity: Chatuser equality compares the names
+        self.users[next(i for i, u in enumerate(self.users) if u is existing)] = user
+        if existing.name and self._by_name.get(existing.name, None) is existing:
+            del self._by_name[existing.name]
+        self._index(user)
+
+    def clear(self) -> None:
+        self.users.clear()
+        self._build_index(self.pending_operations)
 
     def add_pending(self, user: Chatuser) -> None:
         self.pending_users.append(user)
 
+    def update_user(self, user: Chatuser, name: str, full_name:str, language_code:str) -> None:
+        self.rename(user, name)
+        user.update(name, full_name, language_code)
+
+    def rename(self, user: Chatuser, name: str) -> None:
+        if user.name != name:
+            if self._by_name.get(user.name, None) is user:
+                del self._by_name[user.name]
+            user.name = name
+        if name and user.user_id in self._by_id:
+            self._by_name[name] = user
+
+    def set_status(self, user: Chatuser, status: range) -> None:
+        user.status = status
+        if user.user_id in self._by_id:
+            self._index(user)
+
     def add_pending_operation(self, user: Chatuser, seconds: int, code: int, message_to_remove: int) -> None:
-        self.pending_operations.append(PendingOperation(user.user_id, code, datetime.now() + timedelta(seconds=seconds), message_to_remove))
+        self._pending[(user.user_id, code)] = \
+            PendingOperation(user.user_id, code, datetime.now() + timedelta(seconds=seconds), message_to_remove)
 
     def remove_pending_operation(self, user_id: int, code: int) -> PendingOperation:
-        operation = next((x for x in self.pending_operations if x.user_id == user_id and x.operation == code), None)
-        if operation:
-            self.pending_operations.remove(operation)
-            return operation
-        return None
+        return self._pending.pop((user_id, code), None)
 
     def get_admins(self):
-        admins = list(filter(lambda u: u.status is Chatuser.ADMIN, self.users))
+        admins = [u for u in self._admins.values() if u.status == Chatuser.ADMIN]
         return ','.join(map(lambda user: '@' + user.name, admins)) if len(admins) > 1 else ( ('@' + admins[0].name) if len(admins) == 1 else '(not found)')
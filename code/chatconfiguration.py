@@ -27,7 +27,8 @@ class ChatConfiguration:
         except Exception as e:
             self.logger.info("Assuming all new users (%s) as trusted, cannot read their messages", str(len(chat.pending_users)))
             if chat.pending_users:
-                chat.users.extend(chat.pending_users)
+                for u in chat.pending_users:
+                    chat.add(u)
                 chat.pending_users.clear()
 
     def _get_phone_callback(self) -> str:
@@ -38,15 +39,15 @@ class ChatConfiguration:
             if not user.bot:
                 if user.deleted:
                     if (chatuser:=chat.find_user(user.id)):
-                        chatuser.status = Chatuser.REMOVED
+                        chat.set_status(chatuser, Chatuser.REMOVED)
                 elif user.restricted or user.scam:
                     if (chatuser:=chat.find_user(user.id)):
-                        chatuser.status = Chatuser.RESTRICTED
+                        chat.set_status(chatuser, Chatuser.RESTRICTED)
                 else:
                     #print("id:", user.id, "username:", user.username, str(status))
                     full_name = user.first_name if not user.last_name else f"{user.first_name} {user.last_name}"
                     if (chatuser:=chat.find_user(user.id)):
-                        chatuser.update(user.username, full_name, user.lang_code)
+                        chat.update_user(chatuser, user.username, full_name, user.lang_code)
                     else:
                         if status == Chatuser.ADMIN:
                             self.logger.debug("User %s: ADMIN", full_name)
@@ -1,5 +1,4 @@
 """Telegram Chat bot logic."""
-from copy import deepcopy
 import sys
 from os import path
 import threading
@@ -7,7 +6,7 @@ from typing import Sequence, Optional, Tuple
 from datetime import datetime, timedelta
 import asyncio
 from gameevent import GameEvent
-from translate import _
+from translate import _a, catalog
 import logging
 import inspect
 from telegram import ChatPermissions, InlineKeyboardButton, InlineKeyboardMarkup, Update, ChatMember, ChatMemberUpdated
@@ -30,6 +29,7 @@ from str2bool import str2bool
 from player import Player
 from chatuser import Chatuser
 from competition import Competition
+from demandforecast import slots_from_config, VELOCITY_HOURS, CANCELLATION_HOURS
 from datamodel import DataModel
 from config import credentials, registration, schedule, messages, preferences
 from notifier import ChatNotifier, RegistrationNotifier
@@ -40,6 +40,9 @@ from identifiable import Identifiable
 from menuitem import MenuItem
 from maineventloop import run_in_main_event_loop
 from pendingoperation import PendingOperation
+from updatedispatcher import UpdateDispatcher
+from conversationsession import ConversationSession, EditDraft
+from webhookserver import WebhookServer
 
 class ChatConversation(RegistrationNotifier):
     """Telegram bot logic class"""
@@ -82,9 +85,11 @@ class ChatConversation(RegistrationNotifier):
         GAME_STATUS,
         GAME_PARTICIPANTS,
 
-        PENDING_REMOVE_USER
+        PENDING_REMOVE_USER,
 
-    ) = range(10, 42)
+        SESSION_STATE
+
+    ) = range(10, 43)
 
     REGISTRATION_ENTRY_START = 100
 
@@ -227,16 +232,6 @@ class ChatConversation(RegistrationNotifier):
         ],
     ]
 
-    (BTN_HIDE_IF_STATUS_IN, BTN_PREFIX, BTN_DISABLE) = range(3)
-
-    conditional_button_traits = [
-        {'text':'(hide if registered)', 'action':BTN_HIDE_IF_STATUS_IN, 'user_status_match':(Chatuser.TRUSTED, Chatuser.ADMIN)},
-        {'text':'(hide if not registered)', 'action':BTN_HIDE_IF_STATUS_IN, 'user_status_match':(Chatuser.NEW, Chatuser.REMOVED, Chatuser.RESTRICTED)},
-        {'text':'(enable if value)', 'action':BTN_DISABLE},
-        {'text':'(forward)', 'action':BTN_PREFIX, 'prefix':'[Forward]'},
-        {'text':'(backward)', 'action':BTN_PREFIX, 'prefix':'[Backward]'}
-    ]
-
     (PUBLIC, PRIVATE, OTHER) = map(chr, range(1, 4))
 
     # Utility methods
@@ -265,6 +260,13 @@ class ChatConversation(RegistrationNotifier):
             self.logger.error("No user id set in the context: %s", inspect.stack()[0][3])
             return None
     
+    def get_session(self, context: ContextTypes.DEFAULT_TYPE) -> ConversationSession:
+        """render state and edit drafts of the user of the update"""
+        session = context.user_data.get(ChatConversation.SESSION_STATE, None)
+        if not session:
+            session = context.user_data[ChatConversation.SESSION_STATE] = ConversationSession()
+        return session
+
     def is_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         user = self.get_user(update, context)
         if not user:
@@ -302,21 +304,17 @@ class ChatConversation(RegistrationNotifier):
         l = self.get_user_language(user)
 
         if status == Chatuser.ADMIN:
-            text = _(messages["greetings"]["admin"], l) + "\n\n" + self.get_upcoming_events_summary(l)
-            buttons = MenuHelper.get_menu(l, ChatConversation.admin_menu_top, "admin_menu_top")
-            if self.data.get_open_or_full_competitions_number() < 1:
-                buttons = deepcopy(buttons)
-                buttons.pop(1)
+            text = await _a(messages["greetings"]["admin"], l) + "\n\n" + self.get_upcoming_events_summary(l)
+            keyboard = MenuHelper.get_keyboard(l, ChatConversation.admin_menu_top, "admin_menu_top",
+                                               (1,) if self.data.get_open_or_full_competitions_number() < 1 else ())
         elif status == Chatuser.TRUSTED or not self.chat_registration_mandatory:
-            text = _(messages["greetings"]["trusted"], l) + "\n\n" + self.get_upcoming_events_summary(l)
-            buttons = MenuHelper.get_menu(l, ChatConversation.user_menu_top_trusted, "user_menu_top_trusted")
-            if self.data.get_open_or_full_competitions_number() < 1:
-                buttons = deepcopy(buttons)[1:]
+            text = await _a(messages["greetings"]["trusted"], l) + "\n\n" + self.get_upcoming_events_summary(l)
+            keyboard = MenuHelper.get_keyboard(l, ChatConversation.user_menu_top_trusted, "user_menu_top_trusted",
+                                               (0,) if self.data.get_open_or_full_competitions_number() < 1 else ())
         else:
-            text = _(registration["start"]["message"], l)
-            buttons = MenuHelper.get_menu(l, ChatConversation.user_menu_top_new, "user_menu_top_new")
+            text = await _a(registration["start"]["message"], l)
+            keyboard = MenuHelper.get_keyboard(l, ChatConversation.user_menu_top_new, "user_menu_top_new")
 
-        keyboard = InlineKeyboardMarkup(buttons)
         # If we're starting over we don't need to send a new message
         start_over = context.user_data.get(ChatConversation.START_OVER)
         if reply_privately:
@@ -342,8 +340,8 @@ class ChatConversation(RegistrationNotifier):
             if c.is_in_the_future() and c.status in (Competition.OPEN, Competition.FULL, Competition.CONFIRMED):
                 result += "\n---\n" + c.get_report(language, True, include_players)
         if not result:
-            return _(messages["view"]["no_competition_open"], language)
-        return _(messages["view"]["summary"], language) + result
+            return catalog(language).get(messages["view"]["no_competition_open"])
+        return catalog(language).get(messages["view"]["summary"]) + result
 
     async def end(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
         """End conversation from InlineKeyboardButton."""
@@ -353,7 +351,7 @@ class ChatConversation(RegistrationNotifier):
         self.logger.debug("end: initiated by %s", user.get_fqn_name())
         context.user_data[ChatConversation.SESSION_ID] = 0
         l = self.get_user_language(user)
-        await update.callback_query.answer(_(messages["greetings"]["bye"], l))
+        await update.callback_query.answer(catalog(l).get(messages["greetings"]["bye"]))
         await update.callback_query.delete_message()
 
     async def back(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -367,8 +365,7 @@ class ChatConversation(RegistrationNotifier):
             pass
         self.logger.debug("back: stack is empty, restarting menu")
         context.user_data[ChatConversation.START_OVER] = True
-        self.keyboard = None
-        self.headline = ""
+        self.get_session(context).reset()
         await self.start(update, context)
 
     # Second level conversation callbacks
@@ -384,39 +381,32 @@ class ChatConversation(RegistrationNotifier):
             if s.auto_registration and s.registration_start > datetime.now():
                 c = self.data.get_competition_by_start_date_and_location(s.date, s.location)
                 if not c:
-                    self.data.competitions.append(Competition(s))
-        self.data.competitions.sort(key=lambda x: datetime.strftime(x.date, "%y%m%d%H%M") if x.date else "X")
+                    self.data.competitions.add(Competition(s))
         custom_noncomplete_exists = False
         for c in self.data.competitions:
             text = ''
             if c.is_in_the_future() and c.duration and c.location:
                 if c.is_open_or_full():
-                    text = _(messages["schedule"]["select_open"],l) % c.get_location(l)
+                    text = await _a(messages["schedule"]["select_open"],l) % c.get_location(l)
                 elif c.status == Competition.SCHEDULED:
-                    text = _(messages["schedule"]["select_scheduled"],l) % c.get_location(l)
+                    text = await _a(messages["schedule"]["select_scheduled"],l) % c.get_location(l)
                 elif c.status == Competition.CONFIRMED:
-                    text = _(messages["schedule"]["select_confirmed"],l) % c.get_location(l)
+                    text = await _a(messages["schedule"]["select_confirmed"],l) % c.get_location(l)
                 elif c.status == Competition.CANCELLED:
-                    text = _(messages["schedule"]["select_cancelled"],l) % c.get_location(l)
+                    text = await _a(messages["schedule"]["select_cancelled"],l) % c.get_location(l)
             elif c.status == Competition.SCHEDULED:
-                text = _(messages["schedule"]["select_custom_noncomplete"],l) % c.get_location(l)
+                text = await _a(messages["schedule"]["select_custom_noncomplete"],l) % c.get_location(l)
                 custom_noncomplete_exists = True
             if text:
                 data = self.get_competition_id(c)
-                opened.append({'text': text, 'callback_data' : data})
+                opened.append((MenuHelper.button(text, data),))
         menu_template = ChatConversation.admin_menu_manage_competition_select
         menu_name = "admin_menu_manage_competition_select"
-        buttons = deepcopy(MenuHelper.get_menu(l, menu_template, menu_name))
-        if custom_noncomplete_exists:
-            buttons.pop(0)  #do not have more than one custom at a time
-        if scheduled:
-            for b in reversed(scheduled):
-                buttons.insert(0, [b])
-        if opened:
-            for b in reversed(opened):
-                buttons.insert(0, [b])
+        #do not have more than one custom at a time
+        buttons = MenuHelper.compose(MenuHelper.get_keyboard(l, menu_template, menu_name, (0,) if custom_noncomplete_exists else ()),
+                                     opened + scheduled)
         summary = self.get_upcoming_events_summary(l)
-        self.headline = text = _(messages["game"]["manage_detailed"], l)
+        self.get_session(context).headline = text = await _a(messages["game"]["manage_detailed"], l)
         if summary:
             text += "\n\n" + summary
         await self.reply(update, context, buttons, text, '')
@@ -428,16 +418,17 @@ class ChatConversation(RegistrationNotifier):
             return
         l = self.get_user_language(user)
         n = self.data.get_open_or_full_competitions_number()
-        menu = deepcopy(MenuHelper.get_menu(l, ChatConversation.menu_back, "menu_back"))
+        games = []
         if n == 0:
-            status = _(messages["join"]["no_open_games"], l)
+            status = catalog(l).get(messages["join"]["no_open_games"])
         else:
-            for x in reversed(self.data.competitions):
+            for x in self.data.competitions:
                 if x.status in (Competition.OPEN, Competition.FULL) and x.date and x.date > datetime.now() and x.capacity_max > 0:
                     cbd = str(ChatConversation.GAME_JOIN_SELECT) + "#" + x.id
-                    menu.insert(0, [{'text': x.get_location(l), 'callback_data' : cbd}])
-            status = _(messages["join"]["select"], l)
-        self.headline = text = _(messages["game"]["join"], l) + "\n\n" + status
+                    games.append((MenuHelper.button(x.get_location(l), cbd),))
+            status = catalog(l).get(messages["join"]["select"])
+        menu = MenuHelper.compose(MenuHelper.get_keyboard(l, ChatConversation.menu_back, "menu_back"), games)
+        self.get_session(context).headline = text = catalog(l).get(messages["game"]["join"]) + "\n\n" + status
         await self.reply(update, context, menu, text, '')
 
     async def game_join_select(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -449,21 +440,21 @@ class ChatConversation(RegistrationNotifier):
         c = self.data.get_competition_by_id(arg)
         context.user_data[ChatConversation.GAME_SELECTED] = c.id
         dt = c.get_date()
-        buttons = MenuHelper.get_menu(l, ChatConversation.menu_back, "menu_back")
+        buttons = MenuHelper.get_keyboard(l, ChatConversation.menu_back, "menu_back")
         headline = ""
         if dt and dt > datetime.now() and c.capacity_max > 0:
-            status = _(messages["view"]["summary_competition"], l) % \
+            status = catalog(l).get(messages["view"]["summary_competition"]) % \
                 (c.get_location(l), str(c.capacity_max), str(c.capacity)) + \
                 "\n" + c.get_report(l)
             if c.is_open_or_full():
                 registered = c.find(user.user_id)[0]
                 if registered in (Competition.PLAYER_REGISTERED_MAIN, Competition.PLAYER_REGISTERED_SPARE):
-                    buttons = MenuHelper.get_menu(l, ChatConversation.menu_join_deregister, "menu_join_deregister")
-                    headline = _(messages["game"]["joined"], l) + "\n\n"
+                    buttons = MenuHelper.get_keyboard(l, ChatConversation.menu_join_deregister, "menu_join_deregister")
+                    headline = catalog(l).get(messages["game"]["joined"]) + "\n\n"
                 elif c.status == Competition.OPEN:
-                    buttons = MenuHelper.get_menu(l, ChatConversation.menu_join_register, "menu_join_register")
-                    headline = _(messages["game"]["join"], l) + "\n\n"
-        self.headline = text = headline + status
+                    buttons = MenuHelper.get_keyboard(l, ChatConversation.menu_join_register, "menu_join_register")
+                    headline = catalog(l).get(messages["game"]["join"]) + "\n\n"
+        self.get_session(context).headline = text = headline + status
         await self.reply(update, context, buttons, text, str(ChatConversation.GAME_JOIN))
 
     async def game_view_participants(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -472,52 +463,55 @@ class ChatConversation(RegistrationNotifier):
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
         l = self.get_user_language(user)
-        text=self.headline + "\n\n" + _(messages["view"]["participants_list"], l) + "\n" + c.get_report(l, True)
+        session = self.get_session(context)
+        text=session.headline + "\n\n" + catalog(l).get(messages["view"]["participants_list"]) + "\n" + c.get_report(l, True)
         await update.callback_query.answer()
-        await update.callback_query.edit_message_text(text=text, reply_markup=self.keyboard)
+        await update.callback_query.edit_message_text(text=text, reply_markup=session.keyboard)
 
     async def game_schedule_select(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
         if not self.is_admin(update, context):
             return
         c = self.data.get_competition_by_id(arg)
-        c.start_editing()
+        self.get_session(context).start_editing(c)
         await self.game_schedule_reply(c, update, context, '')
 
     async def game_schedule_select_custom(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
         if not self.is_admin(update, context):
             return
         c = Competition(None)
-        c.start_editing()
-        self.data.competitions.append(c)
+        self.get_session(context).start_editing(c)
+        self.data.competitions.add(c)
         await self.game_schedule_reply(c, update, context, str(ChatConversation.GAME_MANAGE_SCHEDULE_SELECT_CUSTOM))
 
     async def game_schedule_reply(self, c: Competition, update: Update, context: ContextTypes.DEFAULT_TYPE, current_feature:str) -> None:
         user = self.get_user(update, context)
         l = self.get_user_language(user)
         context.user_data[ChatConversation.GAME_SELECTED] = c.id
-        buttons = deepcopy(MenuHelper.get_menu(l, ChatConversation.admin_menu_manage_competition, "admin_menu_manage_competition"))
+        #without the edit and cancel rows for a cancelled game
+        keyboard = MenuHelper.get_keyboard(l, ChatConversation.admin_menu_manage_competition, "admin_menu_manage_competition",
+                                           (0, 1, 2, 3) if not c.is_open_or_full() and c.status == Competition.CANCELLED else ())
+        registration_button = None     #button in front of the cancel row
         can_delete_entry = False
         if c.is_open_or_full():
-            buttons[3].insert(0, {'text': _(messages["game"]["registration_close"],l), 'callback_data' : str(ChatConversation.GAME_MANAGE_REGISTRATION_CLOSE)})
-            self.headline = text = _(messages["game"]["manage_open"], l)
+            registration_button = MenuHelper.button(catalog(l).get(messages["game"]["registration_close"]), str(ChatConversation.GAME_MANAGE_REGISTRATION_CLOSE))
+            self.get_session(context).headline = text = catalog(l).get(messages["game"]["manage_open"])
         else:
             if c.status == Competition.CANCELLED:
-                buttons.pop(0)  #remove edit menu row
-                buttons.pop(0)  #remove edit menu row
-                buttons.pop(0)  #remove edit menu row
-                buttons.pop(0)  #remove cancel menu row
                 can_delete_entry = c.capacity == 0
-                self.headline = text = _(messages["game"]["manage_cancelled"], l)
+                self.get_session(context).headline = text = catalog(l).get(messages["game"]["manage_cancelled"])
             elif c.location and c.date:
                 if c.status == Competition.SCHEDULED: #not to show the button for confirmed
                     can_delete_entry = True
-                    buttons[3].insert(0, {'text': _(messages["game"]["registration_open"],l), 'callback_data' : str(ChatConversation.GAME_MANAGE_REGISTRATION_OPEN)})
-                self.headline = text = _(messages["game"]["manage_scheduled"], l)
+                    registration_button = MenuHelper.button(catalog(l).get(messages["game"]["registration_open"]), str(ChatConversation.GAME_MANAGE_REGISTRATION_OPEN))
+                self.get_session(context).headline = text = catalog(l).get(messages["game"]["manage_scheduled"])
             else:
                 can_delete_entry = True
-                self.headline = text = _(messages["game"]["manage_custom"], l)
-        if can_delete_entry:
-            buttons.insert(-1, [{'text': _(messages["game"]["delete_entry"],l), 'callback_data' : str(ChatConversation.GAME_MANAGE_DELETE)}])
+                self.get_session(context).headline = text = catalog(l).get(messages["game"]["manage_custom"])
+        if registration_button:
+            rows = keyboard.inline_keyboard
+            keyboard = InlineKeyboardMarkup(rows[:3] + ((registration_button,) + rows[3],) + rows[4:])
+        buttons = MenuHelper.compose(keyboard, (), [(MenuHelper.button(catalog(l).get(messages["game"]["delete_entry"]), str(ChatConversation.GAME_MANAGE_DELETE)),)]
+                                     if can_delete_entry else ())
         text += "\n\n" + c.get_report(l, True)
         await self.reply(update, context, buttons, text, str(ChatConversation.GAME_MANAGE), current_feature)
 
@@ -543,7 +537,7 @@ class ChatConversation(RegistrationNotifier):
         l = self.get_chat_language()
         main, spare, reply = await c.deregister(user, notifier, participants)
         if main and c.get_date().day == datetime.now().day:
-            await self.send_admin_message(update, _(messages["admin"]["user_deregistered_in_the_day"], l) % str(user))
+            await self.send_admin_message(update, catalog(l).get(messages["admin"]["user_deregistered_in_the_day"]) % str(user))
         await self.notify_registration_change(c, user, main, spare, reply)
 
     async def notify_registration_change(self, c: Competition, user:Chatuser, main:bool, spare:bool, reply:str):
@@ -551,9 +545,9 @@ class ChatConversation(RegistrationNotifier):
             await self.send_user_message(user, reply)
         l = self.get_chat_language()
         if main or spare:
-            self.data.save_competitions()
-            text=_(messages["announcement"]["participants_list_updated"] if c.status == Competition.OPEN else
-                   messages["announcement"]["participants_list_final"], l) \
+            self.data.save_competition(c)
+            text=catalog(l).get(messages["announcement"]["participants_list_updated"] if c.status == Competition.OPEN else
+                                messages["announcement"]["participants_list_final"]) \
                 % (c.get_location(l)) + "\n" + c.get_report(l)
             await self.send_chat_message(text, ChatConversation.GAME_PARTICIPANTS, True, c)
 
@@ -565,10 +559,10 @@ class ChatConversation(RegistrationNotifier):
         if not user:
             return
         l = self.get_user_language(user)
-        self.headline = text = _(messages["join"]["deregister_confirm"], l) + "\n" + c.get_location(l)
+        self.get_session(context).headline = text = catalog(l).get(messages["join"]["deregister_confirm"]) + "\n" + c.get_location(l)
         if c.get_date().day == datetime.now().day:
-            text += "\n\n" + _(messages["join"]["deregister_confirm_paid"], l)
-        menu = MenuHelper.get_menu(l, ChatConversation.menu_join_deregister_confirm, "menu_join_deregister_confirm")
+            text += "\n\n" + catalog(l).get(messages["join"]["deregister_confirm_paid"])
+        menu = MenuHelper.get_keyboard(l, ChatConversation.menu_join_deregister_confirm, "menu_join_deregister_confirm")
         await self.reply(update, context, menu, text, str(ChatConversation.GAME_JOIN))
 
     async def game_join_deregister_confirm(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -586,8 +580,7 @@ class ChatConversation(RegistrationNotifier):
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
         assert (not c.date and not c.location and not c.duration) or c.capacity == 0
-        self.data.competitions.remove(c)
-        self.data.save_competitions()
+        self.data.remove_competition(c)
         await self.game_manage(update, context)
 
     async def game_set_max_participants(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -599,12 +592,10 @@ class ChatConversation(RegistrationNotifier):
         l = self.get_user_language(user)
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
-        status = _(messages["view"]["summary_competition_participants_stress"], l) % \
+        status = catalog(l).get(messages["view"]["summary_competition_participants_stress"]) % \
                 (c.get_location(l), str(c.capacity_max), str(c.capacity)) + "\n\n" + \
-                _(messages["facility"]["update_number_detailed"], l)
-        self.headline = text = status
-        menu = deepcopy(MenuHelper.get_menu(l, ChatConversation.menu_back, "menu_back"))
-        menu.insert(0,[])
+                catalog(l).get(messages["facility"]["update_number_detailed"])
+        self.get_session(context).headline = text = status
         facility_name = c.location
         facility = schedule["facility"].get(facility_name, None)
         possible_range = facility.get("capacity_options", []) if facility else []
@@ -613,9 +604,9 @@ class ChatConversation(RegistrationNotifier):
                 o = f["capacity_options"]
                 possible_range.extend(o)
         possible_range = sorted(set(possible_range))
-        for r in possible_range:
-            data = str(ChatConversation.GAME_MANAGE_SET_MAX_PARTICIPANTS_VALUE) + "#" + str(r)
-            menu[0].append({'text': str(r), 'callback_data' : data})
+        options = tuple(MenuHelper.button(str(r), str(ChatConversation.GAME_MANAGE_SET_MAX_PARTICIPANTS_VALUE) + "#" + str(r))
+                        for r in possible_range)
+        menu = MenuHelper.compose(MenuHelper.get_keyboard(l, ChatConversation.menu_back, "menu_back"), [options])
         await self.reply(update, context, menu, text, self.get_competition_id(c),
                          str(ChatConversation.GAME_MANAGE_SET_MAX_PARTICIPANTS))
 
@@ -628,17 +619,14 @@ class ChatConversation(RegistrationNotifier):
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
         facility = schedule["facility"].get(c.location, None)
-        full_location = facility.get("address", None) if facility else _("Not set", l)
-        status = _(messages["view"]["summary_competition_location_stress"], l) % \
+        full_location = facility.get("address", None) if facility else catalog(l).get("Not set")
+        status = catalog(l).get(messages["view"]["summary_competition_location_stress"]) % \
                 (c.get_location(l), str(c.capacity_max), str(c.capacity), full_location) + "\n\n" + \
-                _(messages["facility"]["update_address_detailed"], l)
-        self.headline = text = status
-        menu = deepcopy(MenuHelper.get_menu(l, ChatConversation.menu_back, "menu_back"))
-        menu.insert(0,[])
-        for key, value in schedule["facility"].items():
-            a = value["address"]
-            data = str(ChatConversation.GAME_MANAGE_SET_LOCATION_VALUE) + "#" + key
-            menu[0].append({'text': f"{key}({a})", 'callback_data' : data})
+                catalog(l).get(messages["facility"]["update_address_detailed"])
+        self.get_session(context).headline = text = status
+        locations = tuple(MenuHelper.button(f"{key}({value['address']})", str(ChatConversation.GAME_MANAGE_SET_LOCATION_VALUE) + "#" + key)
+                          for key, value in schedule["facility"].items())
+        menu = MenuHelper.compose(MenuHelper.get_keyboard(l, ChatConversation.menu_back, "menu_back"), [locations])
         await self.reply(update, context, menu, text, self.get_competition_id(c))
 
     async def game_set_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -649,23 +637,24 @@ class ChatConversation(RegistrationNotifier):
         l = self.get_user_language(user)
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
-        status = _(messages["view"]["summary_competition"], l) % \
-                (self.get_competition_datetime_tmp(c, l), str(c.capacity_max), str(c.capacity)) + "\n\n" + \
-                _(messages["facility"]["update_datetime_detailed"], l)
-        self.headline = text = status
-        menu = MenuHelper.get_menu(l, ChatConversation.menu_apply_time_back, "menu_apply_time_back")
-        if not c.date_tmp or not c.duration_tmp:
-            menu = deepcopy(menu)
-            menu.pop(0)
+        session = self.get_session(context)
+        draft = session.draft(c)
+        status = catalog(l).get(messages["view"]["summary_competition"]) % \
+                (self.get_competition_datetime_tmp(c, draft, l), str(c.capacity_max), str(c.capacity)) + "\n\n" + \
+                catalog(l).get(messages["facility"]["update_datetime_detailed"])
+        session.headline = text = status
+        menu = MenuHelper.get_keyboard(l, ChatConversation.menu_apply_time_back, "menu_apply_time_back",
+                                       (0,) if not draft.date or not draft.duration else ())
         await self.reply(update, context, menu, text, self.get_competition_id(c),
                          str(ChatConversation.GAME_MANAGE_SET_TIME))
 
-    def get_competition_datetime_tmp(self, c: Competition, l: str) -> str:
-        location = c.location if c.location else _("Location not set",l)
-        dt = (_(datetime.strftime(c.date_tmp, '%A'), l) + ', ' + datetime.strftime(c.date_tmp, '%d.%m.%Y %H:%M')) \
-            if c.date_tmp is not None else _(messages["join"]["game_status"]["not_scheduled"], l)
-        duration = _("%s minutes", l) % str(c.duration_tmp) if c.duration_tmp else _("not set",l)
-        return f"{location}, {dt} ({_('duration',l)}: {duration})"
+    def get_competition_datetime_tmp(self, c: Competition, draft: EditDraft, l: str) -> str:
+        texts = catalog(l)
+        location = c.location if c.location else texts.get("Location not set")
+        dt = (texts.weekday(draft.date) + ', ' + datetime.strftime(draft.date, '%d.%m.%Y %H:%M')) \
+            if draft.date is not None else texts.get(messages["join"]["game_status"]["not_scheduled"])
+        duration = texts.get("%s minutes") % str(draft.duration) if draft.duration else texts.get("not set")
+        return f"{location}, {dt} ({texts.get('duration')}: {duration})"
 
     async def apply(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
         f = self.get_current_feature(context)
@@ -675,10 +664,11 @@ class ChatConversation(RegistrationNotifier):
                 l = self.get_user_language(user)
                 d = context.user_data[ChatConversation.GAME_SELECTED]
                 c = self.data.get_competition_by_id(d)
-                text=_(messages["facility"]["datetime_changed"], l) % \
-                    (c.get_location(l), self.get_competition_datetime_tmp(c, l))
-                c.apply_editing()
-                self.data.save_competitions()
+                session = self.get_session(context)
+                text=catalog(l).get(messages["facility"]["datetime_changed"]) % \
+                    (c.get_location(l), self.get_competition_datetime_tmp(c, session.draft(c), l))
+                session.apply_editing(c)
+                self.data.save_competition(c)
                 if c.status in (Competition.OPEN, Competition.FULL, Competition.CONFIRMED):
                     await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
                 return
@@ -689,13 +679,18 @@ class ChatConversation(RegistrationNotifier):
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
         c.capacity_max = int(arg)
+        notifier = TelegramNotifier(self, update, context)
         if c.capacity > c.capacity_max:
             await self.truncate_participants(c, update, context)
-        text=_(messages["facility"]["number_changed"], l) % \
+        elif c.is_open_or_full():
+            await c.promote(notifier)
+        if c.update_status():
+            await notifier.competition_status_changed(c.id)
+        text=catalog(l).get(messages["facility"]["number_changed"]) % \
             (c.get_location(l), str(c.capacity_max))
         if c.is_open_or_full():
             await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
-        self.data.save_competitions()
+        self.data.save_competition(c)
         await self.game_set_max_participants(update, context)
 
     async def game_set_location_value(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg: str = None) -> None:
@@ -704,12 +699,12 @@ class ChatConversation(RegistrationNotifier):
         c = self.data.get_competition_by_id(d)
         facility = schedule["facility"][arg]
         full_location = f'{arg}({facility["address"]})'
-        text=_(messages["facility"]["address_changed"], l) % \
+        text=catalog(l).get(messages["facility"]["address_changed"]) % \
             (c.get_location(l), full_location)
         if c.is_open_or_full():
             await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
         c.location = arg
-        self.data.save_competitions()
+        self.data.save_competition(c)
         await self.game_set_location(update, context)
 
     async def game_confirm_and_close_registration(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg: str = None) -> None:
@@ -722,9 +717,9 @@ class ChatConversation(RegistrationNotifier):
             self.logger.error("Registration of Competition %s cannot be closed, wrong status %s", c.get_location(None), c.status)
             return
         c.confirm_and_close_registration()
-        self.data.save_competitions()
+        self.data.save_competition(c)
         l = self.get_chat_language()
-        text=_(messages["announcement"]["registration_closed"], l) % \
+        text=catalog(l).get(messages["announcement"]["registration_closed"]) % \
             (c.get_location(l)) + "\n\n" + c.get_report(l)
         await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
         await self.game_manage(update, context)
@@ -738,11 +733,12 @@ class ChatConversation(RegistrationNotifier):
         user = self.get_user(update, context)
         l = self.get_user_language(user)
         if c.capacity_max == 0 or not c.location or not c.date:
-            text = self.headline + "\n\n" + _(messages["schedule"]["cannot_open"], l)
-            await update.callback_query.edit_message_text(text=text, reply_markup=self.keyboard)
+            session = self.get_session(context)
+            text = session.headline + "\n\n" + catalog(l).get(messages["schedule"]["cannot_open"])
+            await update.callback_query.edit_message_text(text=text, reply_markup=session.keyboard)
             return
         c.open_registration(c.capacity_max)
-        self.data.save_competitions()
+        self.data.save_competition(c)
         s = "Registration for the Game %s is open, status %s" % (c.get_location("en"), c.get_status("en"))
         self.logger.info(s)
         await self.notify_users_registration_open(c)
@@ -753,19 +749,20 @@ class ChatConversation(RegistrationNotifier):
 
     async def notify_users_registration_open(self, c:Competition):
         l = self.get_chat_language()
-        text=_(messages["announcement"]["registration_open_line_1"], l) % (c.get_location(l)) + "\n" + \
-            _(messages["announcement"]["registration_open_line_2"],l) % str(c.capacity_max) + "\n\n" + \
-            _(messages["announcement"]["registration_open_line_3"], l) % (self.get_bot_mention_html())
+        #the texts missing in the translations are requested at once
+        line_1, line_2, line_3, question, option_1, option_2, option_3 = await asyncio.gather(
+            *(_a(m, l) for m in (messages["announcement"]["registration_open_line_1"], messages["announcement"]["registration_open_line_2"],
+                                 messages["announcement"]["registration_open_line_3"], messages["poll"]["join"]["question"],
+                                 messages["poll"]["join"]["option_1"], messages["poll"]["join"]["option_2"], messages["poll"]["join"]["option_3"])))
+        text = line_1 % (c.get_location(l)) + "\n" + line_2 % str(c.capacity_max) + "\n\n" + line_3 % (self.get_bot_mention_html())
         await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
         poll =  await self.application.bot.send_poll(chat_id=self.chat_id, 
-            question = _(messages["poll"]["join"]["question"],l) % c.get_location(l), 
-            options = (_(messages["poll"]["join"]["option_1"], l), 
-                       _(messages["poll"]["join"]["option_2"], l), 
-                       _(messages["poll"]["join"]["option_3"], l)), 
+            question = question % c.get_location(l), 
+            options = (option_1, option_2, option_3), 
             is_anonymous=False)
         c.poll_id = poll.poll.id
         c.poll_message_id = poll.message_id
-        self.data.save_competitions()
+        self.data.save_competition(c)
         self.append_message_cache(c.id, poll.message_id)
         
     def append_message_cache(self, code: str, id:str):
@@ -783,11 +780,11 @@ class ChatConversation(RegistrationNotifier):
         l = self.get_user_language(user)
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)
-        status = _(messages["schedule"]["cancel_confirm"], l) % (c.get_location(l)) + \
+        status = catalog(l).get(messages["schedule"]["cancel_confirm"]) % (c.get_location(l)) + \
                     "\n\n" + c.get_report(l)
-        self.headline = text = status
+        self.get_session(context).headline = text = status
         await self.reply(update, context,
-                    MenuHelper.get_menu(l, ChatConversation.admin_menu_game_cancel, "admin_menu_game_cancel"),
+                    MenuHelper.get_keyboard(l, ChatConversation.admin_menu_game_cancel, "admin_menu_game_cancel"),
                     text, self.get_competition_id(c))
 
     async def game_cancel_confirm(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
@@ -799,13 +796,13 @@ class ChatConversation(RegistrationNotifier):
         if c.status in (Competition.OPEN, Competition.FULL):
             for player in c.players:
                 l = self.get_user_language(player.owner)
-                text=_(messages["announcement"]["game_cancelled_pm"], l) % (player.owner.get_name(), c.get_location(l))
+                text=catalog(l).get(messages["announcement"]["game_cancelled_pm"]) % (player.owner.get_name(), c.get_location(l))
                 await self.send_user_message(player.owner, text)
             l = self.get_chat_language()
-            text=_(messages["announcement"]["game_cancelled_chat"], l) % (c.get_location(l))
+            text=catalog(l).get(messages["announcement"]["game_cancelled_chat"]) % (c.get_location(l))
             await self.send_chat_message(text, ChatConversation.GAME_STATUS, True, c)
         c.cancel_registration()
-        self.data.save_competitions()
+        self.data.save_competition(c)
         await self.start(update, context)
 
     async def send_user_message(self, user: Chatuser, text: str) -> bool:
@@ -851,16 +848,20 @@ class ChatConversation(RegistrationNotifier):
         if type(bcd) is list:
             bcd.append(back_callback_data)
             context.user_data[ChatConversation.CURRENT_FEATURE] = current_feature
-        self.keyboard = InlineKeyboardMarkup(buttons) if (buttons and len(buttons) != 0) else None
+        if isinstance(buttons, InlineKeyboardMarkup):
+            keyboard = buttons if buttons.inline_keyboard else None
+        else:
+            keyboard = InlineKeyboardMarkup(buttons) if (buttons and len(buttons) != 0) else None
+        self.get_session(context).keyboard = keyboard
         try:
             if update.callback_query is not None:
                 await update.callback_query.answer()
-                await update.callback_query.edit_message_text(text=text, reply_markup=self.keyboard, parse_mode=ParseMode.HTML)
+                await update.callback_query.edit_message_text(text=text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
             else:
                 await context.bot.send_message(
                     chat_id=update.effective_message.chat_id,
                     text=text,
-                    reply_markup=self.keyboard,
+                    reply_markup=keyboard,
                     parse_mode=ParseMode.HTML
                 )
         except Exception as e:
@@ -872,32 +873,17 @@ class ChatConversation(RegistrationNotifier):
 
     async def truncate_participants(self, competition: Competition, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """cut the amount of participants"""
-        while competition.capacity > competition.capacity_max:
-            #remove first guys who came with friends
-            diff = competition.capacity - competition.capacity_max
-            removed = False
-            for p in reversed(competition.players):
-                if p.participants == diff:
-                    competition.capacity -= diff
-                    competition.players.remove(p)
-                    competition.spare_players.insert(0, p)
-                    await self.notify_removed(competition, update, context, p)
-                    removed = True
-                    break
-            if not removed:
-                p = competition.players.pop()
-                competition.spare_players.insert(0, p)
-                await self.notify_removed(competition, update, context, p)
-                competition.capacity -= 1
+        demoted = competition.demote_overflow()
+        await asyncio.gather(*(self.notify_removed(competition, update, context, p) for p in demoted))
 
     async def notify_removed(self, c: Competition, update: Update, context: ContextTypes.DEFAULT_TYPE, p: Player):
         """notify the player privately that he/she has denied to play"""
         user = p.owner
         l = self.get_user_language(user)
         try:
-            text = _(messages["join"]["kicked_line_1"], l) % \
+            text = catalog(l).get(messages["join"]["kicked_line_1"]) % \
                     (c.get_location(l)) + \
-                "\n" + _(messages["join"]["kicked_line_1"], l)
+                "\n" + catalog(l).get(messages["join"]["kicked_line_2"])
             await self.send_user_message(p.owner, text)
         except ValueError:
             pass #may be OK because of Telegram bot chatting rules
@@ -911,11 +897,11 @@ class ChatConversation(RegistrationNotifier):
         try:
             number = int(text)
         except ValueError:
-            await self.send_user_message(user, _("Expected to get a numeric value", l))
+            await self.send_user_message(user, catalog(l).get("Expected to get a numeric value"))
             return
         max_number = schedule["planning"]["max_capacity"]
         if number <=0 or number > max_number:
-            await self.send_user_message(user, _("Number of participants must be positive number up to %s", l) % str(max_number))
+            await self.send_user_message(user, catalog(l).get("Number of participants must be positive number up to %s") % str(max_number))
             return
         self.logger.debug('Number of participants entered: %s', text)
         await self.game_set_max_participants_value(update, context, text)
@@ -927,6 +913,7 @@ class ChatConversation(RegistrationNotifier):
         user = self.get_user(update, context)
         d = context.user_data[ChatConversation.GAME_SELECTED]
         c = self.data.get_competition_by_id(d)     
+        draft = self.get_session(context).draft(c)
         l = self.get_user_language(user)
         try:
             for item in text.split():
@@ -935,21 +922,21 @@ class ChatConversation(RegistrationNotifier):
                     date = datetime.strptime(item, '%d.%m.%Y')
                     ahead_days = schedule["planning"]["planning_window_days"]
                     if date < datetime.now() or (date - datetime.now()).days > ahead_days:
-                        await self.send_user_message(user, _("Allowed game date is up to %s days ahead", l) % str(ahead_days))
+                        await self.send_user_message(user, catalog(l).get("Allowed game date is up to %s days ahead") % str(ahead_days))
                         return
-                    c.date_tmp = c.date_tmp.replace(year = date.year, month = date.month, day = date.day) if c.date_tmp else date
+                    draft.date = draft.date.replace(year = date.year, month = date.month, day = date.day) if draft.date else date
                 elif item.find(':') != -1:
                     date = datetime.strptime(item, '%H:%M')
-                    c.date_tmp = c.date_tmp.replace(hour = date.hour, minute = date.minute) if c.date_tmp else date
+                    draft.date = draft.date.replace(hour = date.hour, minute = date.minute) if draft.date else date
                 else:
                     minutes = int(item)
                     max_minutes = schedule["planning"]["max_duration"]
                     if minutes <=0 or minutes > max_minutes:
-                        await self.send_user_message(user, _("Game duration must be positive number up to %s minutes", l) % str(max_minutes))
+                        await self.send_user_message(user, catalog(l).get("Game duration must be positive number up to %s minutes") % str(max_minutes))
                         return
-                    c.duration_tmp = minutes
+                    draft.duration = minutes
         except ValueError:
-            await self.send_user_message(user, _("Unrecognized date or time or duration", l))
+            await self.send_user_message(user, catalog(l).get("Unrecognized date or time or duration"))
             return
         self.logger.debug('Start date/time or duration changed: %s', text)
         await self.game_set_time(update, context, text)
@@ -973,82 +960,31 @@ class ChatConversation(RegistrationNotifier):
         if menu.command:
             self.user_registraton_command(user, menu)
         l = self.get_user_language(user)
-        self.headline = text = menu.caption.get_text(l)
+        session = self.get_session(context)
+        session.headline = text = menu.caption.get_text(l)
         if menu.message:
             text += "\n\n" + menu.message.get_text(l)
-        buttons = []
-        if menu.parameter:
-            target_button_group = []
-            for value in menu.values:
-                item = {'text': value.get_text(l), 'callback_data' : menu.parameter + "#" + value.text}
-                target_button_group.append(item)
-            buttons.append(target_button_group)
-        target_button_group = []
-        disabled_button_exists = False
-        for item in menu.buttons:
-            if type(item) is list:
-                target_button_group = []
-                for button_name in item:
-                    b, t = self.get_button(user, button_name, menu.parameter)
-                    if b:
-                        target_button_group.append(b)
-                        if t == ChatConversation.BTN_TYPE_DISABLED:
-                            disabled_button_exists = True
-                if target_button_group:
-                    buttons.append(target_button_group)
-                target_button_group = []
-            elif type(item) is str:
-                b, t = self.get_button(user, item, menu.parameter)
-                if b:
-                    target_button_group.append(b)
-                    if t == ChatConversation.BTN_TYPE_DISABLED:
-                        disabled_button_exists = True
-            else:
-                self.logger.error("configuration is wrong: %s", str(item))
-        if target_button_group:
-            buttons.append(target_button_group)
-        self.headline = text
+        #the layout is compiled once per language and user status, only the value of the user is applied here
+        layout = self.registration.get_layout(menu.key, l, user.status)
+        pv = self.get_parameter_value(user, menu.parameter)
+        buttons = layout.keyboard(pv)
+        session.headline = text
         if menu.parameter:
-            pv = self.get_parameter_value(user,menu.parameter)
-            pvt = _(registration["messages"]["value"], l) % _(pv,l) if pv else \
-                _(registration["messages"]["enter_value_to_move_forward"], l) if disabled_button_exists else \
-                _(registration["messages"]["no_value"], l)
+            pvt = catalog(l).get(registration["messages"]["value"]) % catalog(l).get(pv) if pv else \
+                catalog(l).get(registration["messages"]["enter_value_to_move_forward"]) if layout.conditional else \
+                catalog(l).get(registration["messages"]["no_value"])
             text += "\n\n" + pvt
         await self.reply(update, context, buttons, text, menu.parameter)
 
     def user_registraton_command(self, user: Chatuser, menu: MenuItem):
         if menu.command == "register":
             if user.status == Chatuser.RESTRICTED:
-                user.status = Chatuser.TRUSTED
+                self.data.chat.set_status(user, Chatuser.TRUSTED)
                 self.set_pending_registration(user, False)
             return
         self.logger.error("invalid command or user status: %s, %s", menu.command, str(user.status))
         assert False
         
-    (BTN_TYPE_NORMAL, BTN_TYPE_DISABLED) = range(2)
-
-    def get_button(self, user: Chatuser, button_text:str, parameter_name:str, parameter_value:str = None) -> ({},int):
-        button_enabled = True  
-        prefix = ""
-        l = self.get_user_language(user)
-        for t in self.conditional_button_traits:
-            template = t['text']
-            if button_text.find(template) != -1:
-                action = t['action']
-                if action == ChatConversation.BTN_HIDE_IF_STATUS_IN:
-                    if user.status in t['user_status_match']:
-                        return None, None
-                elif action == ChatConversation.BTN_DISABLE:
-                    value = parameter_value if parameter_value else self.get_parameter_value(user, parameter_name)
-                    button_enabled = True if value else False
-                elif action == ChatConversation.BTN_PREFIX:
-                    prefix = _(t["prefix"], l) + " "
-                button_text = button_text.replace(template,"").strip()
-        button = self.registration.get_menu_by_name(button_text)
-        t = prefix + button.caption.get_text(l)
-        cb = button.key if button_enabled else -1
-        return {'text': t, 'callback_data' : cb}, ChatConversation.BTN_TYPE_NORMAL if button_enabled else ChatConversation.BTN_TYPE_DISABLED
-
     def get_parameter_value(self, user: Chatuser, parameter: str) -> str:
         if parameter:
             v = user.registration_info.get(parameter, None)
@@ -1064,8 +1000,6 @@ class ChatConversation(RegistrationNotifier):
         self.logger.debug("entered parameter %s=%s", parameter, value)
         user.registration_info[parameter] = value
         await self.handle_user_registration(update, context, context.user_data[ChatConversation.CURRENT_LEVEL])
-        #text = self.headline + self.get_parameter_value(user, parameter)
-        #await update.callback_query.edit_message_text(text=text, reply_markup=self.keyboard)
         return True
 
     async def get_pinned_message(self) -> str:
@@ -1087,19 +1021,70 @@ class ChatConversation(RegistrationNotifier):
             if update.message:
                 await context.bot.delete_message(chat_id = context._chat_id, message_id=update.message.message_id)
             l = self.get_user_language(user) if user else update.message.from_user.language_code
-            text = help_text if help_text else _(messages["greetings"]["help"], l) % self.data.chat.get_admins()
-            await context.bot.send_message(chat_id=context._user_id, text=_(text, l), parse_mode=ParseMode.HTML)
+            text = help_text if help_text else catalog(l).get(messages["greetings"]["help"]) % self.data.chat.get_admins()
+            await context.bot.send_message(chat_id=context._user_id, text=await _a(text, l), parse_mode=ParseMode.HTML)
         else:
             l = self.get_user_language(user)
-            text = help_text if help_text else _(messages["greetings"]["help"], l) % self.data.chat.get_admins()
+            text = help_text if help_text else catalog(l).get(messages["greetings"]["help"]) % self.data.chat.get_admins()
             await self.reply(update, context, None, text)
 
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handles the /stats command: registration statistics of the past games, or of the user given as an argument"""
+        user = self.get_user(update, context, False)
+        if not user or user.status != Chatuser.ADMIN:
+            return
+        l = self.get_user_language(user)
+        if context.args:
+            name = context.args[0].lstrip('@')
+            target = self.data.chat.find_user_by_name(name)
+            s = await self.data.history.user_statistics(target.user_id) if target else None
+            if not target:
+                text = catalog(l).get(messages["stats"]["user_not_found"]) % name
+            elif not s:
+                text = catalog(l).get(messages["stats"]["no_data"])
+            else:
+                text = catalog(l).get(messages["stats"]["user"]) % (target.get_fqn_name(), str(s.attended), str(s.games),
+                    str(s.late_cancellations), f"{s.late_cancel_rate:.0%}", str(s.guest_games), f"{s.guest_frequency:.0%}")
+        else:
+            games = await self.data.history.recent_games(int(preferences["history"]["stats_games"]))
+            lines = []
+            for g in games:
+                date = datetime.strftime(g.game, '%d.%m.%Y %H:%M')
+                if g.time_to_full is not None:
+                    lines.append(catalog(l).get(messages["stats"]["game"]) % (g.location, date, str(g.attendees), str(g.capacity),
+                        f"{g.fill_rate:.0%}", str(g.time_to_full).split('.', maxsplit=1)[0]))
+                else:
+                    lines.append(catalog(l).get(messages["stats"]["game_not_full"]) % (g.location, date, str(g.attendees),
+                        str(g.capacity) if g.capacity else '?', f"{g.fill_rate:.0%}"))
+            text = (catalog(l).get(messages["stats"]["games"]) + "\n" + "\n".join(lines)) if lines else catalog(l).get(messages["stats"]["no_data"])
+        await context.bot.send_message(chat_id=user.user_id, text=text, parse_mode=ParseMode.HTML)
+
+    async def forecast(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handles the /forecast command: demand of the weekly games and the recommended capacity and registration opening"""
+        user = self.get_user(update, context, False)
+        if not user or user.status != Chatuser.ADMIN:
+            return
+        l = self.get_user_language(user)
+        lines = []
+        for f in await self.data.history.forecast(slots_from_config(schedule)):
+            s = f.slot
+            if not f.games:
+                lines.append(catalog(l).get(messages["forecast"]["no_data"]) % s.name)
+                continue
+            in_the_day = sum(f.cancellations[0:CANCELLATION_HOURS.index(24)])
+            lines.append(catalog(l).get(messages["forecast"]["slot"]) % (s.name, str(f.games), f"{f.fill:.0%}",
+                f"{f.velocity[VELOCITY_HOURS.index(2)]:.0%}", f"{f.velocity[VELOCITY_HOURS.index(24)]:.0%}",
+                f"{f.spare_depth:g}", f"{in_the_day:.1f}", f"{f.demand:g}",
+                str(s.capacity), str(f.recommended_capacity), str(s.open_days_before), str(f.recommended_open_days_before)))
+        text = catalog(l).get(messages["forecast"]["title"]) + "\n\n" + "\n\n".join(lines)
+        await context.bot.send_message(chat_id=user.user_id, text=text, parse_mode=ParseMode.HTML)
+
     async def show_rules(self, update: Update, context: ContextTypes.DEFAULT_TYPE, arg:str = None) -> None:
         chat = await update.get_bot().get_chat(self.chat_id)
         l = self.get_chat_language()
-        text = chat.pinned_message.text if chat.pinned_message else _(messages["greetings"]["help"], l) % self.data.chat.get_admins()
+        text = chat.pinned_message.text if chat.pinned_message else catalog(l).get(messages["greetings"]["help"]) % self.data.chat.get_admins()
         await update.callback_query.delete_message()
-        await context.bot.send_message(chat_id=context._user_id, text=_(text, l), parse_mode=ParseMode.HTML)
+        await context.bot.send_message(chat_id=context._user_id, text=await _a(text, l), parse_mode=ParseMode.HTML)
 
     async def generic_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """A generic callback, routing all inside; replacement for numerous callbacks in Telegram driven by patterns"""
@@ -1153,9 +1138,9 @@ class ChatConversation(RegistrationNotifier):
         self.logger.debug("pool id=%s: %s answered %s", update.poll_answer.poll_id, user.get_fqn_name(), str(order))
         l = self.get_user_language(user)
         if not user or user.status in (Chatuser.NEW, Chatuser.RESTRICTED, Chatuser.REMOVED):
-            if not await self.send_user_message(user, _(messages["poll"]["register_first_pm"], l)):
+            if not await self.send_user_message(user, catalog(l).get(messages["poll"]["register_first_pm"])):
                 l = self.get_chat_language()
-                self.send_chat_message(_(messages["poll"]["register_first_chat"], l), user.status, True, user)
+                self.send_chat_message(catalog(l).get(messages["poll"]["register_first_chat"]), user.status, True, user)
             self.logger.info("pool id=%s: %s is not allowed to join as %s, missing registration", 
                              update.poll_answer.poll_id, user.get_fqn_name(), str(order))
             return
@@ -1186,14 +1171,14 @@ class ChatConversation(RegistrationNotifier):
 
         if not was_member and is_member and user.status == Chatuser.NEW:
             l = self.get_user_language(user)
-            msg = _(messages["greetings"]["newbie_line_1"], l) + "\n" + \
-                _(messages["greetings"]["newbie_line_2"],l)
+            msg = catalog(l).get(messages["greetings"]["newbie_line_1"]) + "\n" + \
+                catalog(l).get(messages["greetings"]["newbie_line_2"])
             if registration["access"]["registration_window_minutes"] and registration["access"]["registration_missing_ban_hours"]:
                 msg += "\n" + \
-                _(messages["greetings"]["newbie_line_3"], l)
+                catalog(l).get(messages["greetings"]["newbie_line_3"])
             elif registration["access"]["registration_window_minutes"]:
                 msg += "\n" + \
-                _(messages["greetings"]["newbie_line_3_alt"], l)
+                catalog(l).get(messages["greetings"]["newbie_line_3_alt"])
 
             m = await update.effective_chat.send_message(
                 msg % (update.chat_member.new_chat_member.user.mention_html(),
@@ -1215,8 +1200,9 @@ class ChatConversation(RegistrationNotifier):
         if value:
             self.data.chat.add_pending_operation(user, registration["access"]["registration_window_minutes"]*60, ChatConversation.PENDING_REMOVE_USER, message_id)
         else:
-            await self.cancel_pending_operation(user.user_id, ChatConversation.PENDING_REMOVE_USER)
-        self.data.save_chat()
+            await self.cancel_pending_operation(user, ChatConversation.PENDING_REMOVE_USER)
+        self.data.save_user(user)
+        self.data.save_pending_operations()
     
     async def cancel_pending_operation(self, user: Chatuser, code: int):
         o = self.data.chat.remove_pending_operation(user.user_id, code)
@@ -1326,9 +1312,9 @@ class ChatConversation(RegistrationNotifier):
             return  #auto-open will not work then
         if not c:
             c = Competition(event)
-            self.data.competitions.append(c)
+            self.data.competitions.add(c)
         c.open_registration()
-        self.data.save_competitions()
+        self.data.save_competition(c)
         asyncio.run(self.notify_users_registration_open(c))
 
     # Message loop run
@@ -1341,25 +1327,63 @@ class ChatConversation(RegistrationNotifier):
         """pooling procedure to handle incoming events"""
         self.logger.info("Starting events pooling..")
         if not getattr(self, "que", None):
-            self.que = asyncio.Queue()
+            ingestion = preferences["ingestion"]
+            self.que = asyncio.Queue(int(ingestion["queue_size"]))
+            d = preferences["dispatch"]
+            self.dispatcher = UpdateDispatcher(self.application.process_update, int(d["max_concurrent_updates"]),
+                                               float(d["slow_wait_seconds"]), int(d["metrics_log_updates"]),
+                                               int(d["max_pending_updates"]))
             await self.application.initialize()
-            self.updater = Updater(self.application.bot, update_queue=self.que)
-            await self.updater.initialize()
-            await self.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+            if ingestion["mode"] == "webhook":
+                await self.start_webhook(ingestion)
+            else:
+                self.updater = Updater(self.application.bot, update_queue=self.que)
+                await self.updater.initialize()
+                await self.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         processed = 0
         proceed = True
         while proceed:
+            #updates wait in the bounded queue while the dispatcher is full
+            await self.dispatcher.wait_room()
             if processed < min_events:
                 update = await self.que.get()
                 #self.logger.debug("process_events: +1 (waiting queue)")
-                await self.application.process_update(update)
+                self.dispatcher.submit(update)
                 processed = processed + 1
             else:
                 if (proceed := not self.que.empty()):
                     #self.logger.debug("process_events: +1 (nowaiting queue)")
                     update = self.que.get_nowait()
-                    await self.application.process_update(update)
+                    self.dispatcher.submit(update)
                     processed = processed + 1
+        await self.dispatcher.join()
+
+    async def start_webhook(self, ingestion: dict) -> None:
+        """receives the updates posted by Telegram into the queue, and registers the public URL of the endpoint"""
+        secret = credentials["telegram"]["bot"]["webhook_secret"]
+        self.webhook = WebhookServer(ingestion["listen"], int(ingestion["port"]), ingestion["path"], secret, self.que,
+                                     lambda data: Update.de_json(data, self.application.bot),
+                                     float(ingestion["put_timeout_seconds"]))
+        await self.webhook.start()
+        if ingestion["public_url"]:
+            await self.application.bot.set_webhook(ingestion["public_url"], allowed_updates=Update.ALL_TYPES,
+                                                   secret_token=secret, max_connections=int(ingestion["max_connections"]))
+        else:
+            self.logger.warning("webhook public_url is not set, the webhook is not registered in Telegram")
+
+    async def stop(self) -> None:
+        """stops receiving the updates, and processes those already received"""
+        if self.webhook:
+            await self.webhook.stop()
+        if self.updater:
+            if self.updater.running:
+                await self.updater.stop()
+            await self.updater.shutdown()
+        if self.dispatcher:
+            await self.process_events(0)
+            self.logger.info("updates processed: %s", str(self.dispatcher.metrics))
+        #writes the conversation data into the persistence file
+        await self.application.shutdown()
 
     def add_callback_handler(self, method, key) -> None:
         self.callback_handlers[key] = method
@@ -1380,7 +1404,9 @@ class ChatConversation(RegistrationNotifier):
                     assert False
                 processed.append(o)   
         for o in processed:
-            self.data.chat.pending_operations.remove(o)
+            self.data.chat.remove_pending_operation(o.user_id, o.operation)
+        if processed:
+            self.data.save_pending_operations()
         self.pending_operation_in_progress = False
 
     def get_user_language(self, user: Chatuser) -> str:
@@ -1398,10 +1424,10 @@ class ChatConversation(RegistrationNotifier):
         self.override_user_language = preferences["language"]["override_user_language"]
         self.chat_registration_mandatory = str2bool(registration["access"]["registration_mandatory"])
 
-        self.keyboard = None
-        self.headline = ""
         self.que = None
         self.updater = None
+        self.dispatcher = None
+        self.webhook = None
 
         self.chat_messages_cache = {}
         self.callback_date = []
@@ -1418,11 +1444,14 @@ class ChatConversation(RegistrationNotifier):
         # Create the Application and pass it your bot's token.
         builder = Application.builder()
         telegram_persistence = PicklePersistence(filepath=path.join(".", "data", 'telegram-bot.pickle'))
-        self.application = builder.token(bot_token).persistence(telegram_persistence).concurrent_updates(False).build()
+        self.application = builder.token(bot_token).persistence(telegram_persistence) \
+            .concurrent_updates(int(preferences["dispatch"]["max_concurrent_updates"])).build()
 
         #generic command handlers
         self.application.add_handler(CommandHandler("start", self.start))
         self.application.add_handler(CommandHandler("help", self.help))
+        self.application.add_handler(CommandHandler("stats", self.stats))
+        self.application.add_handler(CommandHandler("forecast", self.forecast))
         # on non command i.e message - register to the game if open, and receive text input if needed
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.user_message))
         #dispatchable callback handlers - top level menu
@@ -1465,11 +1494,11 @@ class TelegramNotifier(ChatNotifier):
         self.context = context
 
     async def notify_user(self, user:Chatuser, text:str, translate:bool = False):
-        final_text = _(text, self.conversation.get_user_language(user)) if translate else text
+        final_text = await _a(text, self.conversation.get_user_language(user)) if translate else text
         await self.conversation.send_user_message(user, final_text)
 
     async def notify_chat(self, text:str, message_code:int, delete_older_messages: bool, translate:bool = False):
-        final_text = _(text, self.conversation.chat_language) if translate else text
+        final_text = await _a(text, self.conversation.chat_language) if translate else text
         await self.conversation.send_chat_message(final_text, message_code, delete_older_messages)
 
     async def competition_status_changed(self, c_id:str):
@@ -1477,11 +1506,11 @@ class TelegramNotifier(ChatNotifier):
         l = self.conversation.chat_language
         if c.status == Competition.FULL:
             await self.notify_chat(
-                _(messages["join"]["game_status"]["full"],self.conversation.chat_language) % c.get_location(l), 
+                catalog(l).get(messages["join"]["game_status"]["full"]) % c.get_location(l), 
                 ChatConversation.GAME_STATUS, True)
             if c.poll_message_id:
                 await self.conversation.stop_poll(c.poll_message_id)
         elif c.status == Competition.OPEN:
             await self.notify_chat(
-                _(messages["join"]["game_status"]["open"],self.conversation.chat_language) % c.get_location(l),
+                catalog(l).get(messages["join"]["game_status"]["open"]) % c.get_location(l),
                 ChatConversation.GAME_STATUS, True)
@@ -8,11 +8,13 @@ from chatuser import Chatuser
 from myexception import LogicException
 from notifier import ChatNotifier
 from config import credentials, registration, schedule, messages
-from translate import _
+from translate import catalog
 from history import History
 from historyevent import RegistrationEvent
 from gameevent import GameEvent
 from identifiable import Identifiable
+from playerlist import PlayerList
+from waitlist import Waitlist
 
 class Competition(Identifiable):
     """competition class, to keep info about competition status, date, and players registered"""
@@ -26,23 +28,31 @@ class Competition(Identifiable):
     description: GameEvent
     poll_id: str
     poll_message_id: int
-    players: list[Player]
-    spare_players: list[Player]
+    players: PlayerList
+    spare_players: Waitlist
     capacity: int
     capacity_max: int
     location: str
     date: datetime
     duration: int       #minutes
 
-    date_tmp: datetime  #temporary values for editing
-    duration_tmp: int   #minutes
-
     duration_default = int(schedule["schedule"]["game_duration_minutes"])
+
+    #fields indexed by the competition registry
+    INDEXED_FIELDS = frozenset(('status', 'poll_id', 'date'))
     
     @property
     def id(self):
         return self.id_value
     
+    @property
+    def lock(self) -> asyncio.Lock:
+        """serializes the changes of the registrations made by updates processed concurrently"""
+        lock = self.__dict__.get('_lock', None)
+        if not lock:
+            lock = self._lock = asyncio.Lock()
+        return lock
+
     @property
     def capacity_spare(self):
         return sum(x.participants for x in self.spare_players) if self.spare_players else 0
@@ -55,12 +65,50 @@ class Competition(Identifiable):
         self.date = description.date if description else None
         self.duration = description.duration if description else 0
         self.capacity = 0
-        self.players = []
-        self.spare_players = []
+        self._registry = None
+        self._index = {}
+        self.players = PlayerList(self._index)
+        self.spare_players = Waitlist(self._index)
         self.poll_id = ''
         self.poll_message_id = 0
         self.id_value = "C"+datetime.strftime(datetime.now(), '%Y%m%d%H%M%S')+"."+str(next(Competition.id_obj))
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_index']
+        state.pop('_registry', None)
+        state.pop('_lock', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        #earlier versions kept the edited date and duration in the competition
+        self.__dict__.pop('date_tmp', None)
+        self.__dict__.pop('duration_tmp', None)
+        self._registry = None
+        self._index = {}
+        #earlier versions kept the players in plain lists
+        if isinstance(self.players, list):
+            self.players = PlayerList(self._index, self.players)
+        if not isinstance(self.spare_players, Waitlist):
+            self.spare_players = Waitlist(self._index, list(self.spare_players))
+        self.players.attach(self._index)
+        self.spare_players.attach(self._index)
+
+    def __setattr__(self, name, value):
+        registry = self.__dict__.get('_registry', None)
+        if registry and name in Competition.INDEXED_FIELDS:
+            old = self.__dict__.get(name, None)
+            super().__setattr__(name, value)
+            if old != value:
+                registry.competition_changed(self, name, old)
+            return
+        super().__setattr__(name, value)
+
+    def attach_registry(self, registry) -> None:
+        """the registry is notified on changes of the indexed fields"""
+        self._registry = registry
+
     def open_registration(self, capacity_max = -1):
         if self.status not in (Competition.SCHEDULED, Competition.CONFIRMED, Competition.CANCELLED) or not self.date:
             raise LogicException("Opening a competition with wrong status!")
@@ -81,14 +129,6 @@ class Competition(Identifiable):
         self.spare_players.clear()
         self.capacity = 0
 
-    def start_editing(self):
-        self.date_tmp = self.date
-        self.duration_tmp = self.duration
-
-    def apply_editing(self):
-        self.date = self.date_tmp
-        self.duration = self.duration_tmp
-
     def is_open_or_full(self) -> bool:
         return self.status in (Competition.OPEN, Competition.FULL)
     
@@ -111,146 +151,212 @@ class Competition(Identifiable):
                 s = "confirmed, go play!" if self.date > datetime.now() else "past, was confirmed"
             case Competition.CANCELLED:
                 s = "cancelled"
-        return _(s, language)
+        return catalog(language).get(s)
 
     def get_report(self, language:str, include_header:bool = False, include_players:bool = True):
-        result = (_(messages["report"]["title"], language) % \
+        texts = catalog(language)
+        result = (texts.get(messages["report"]["title"]) % \
                   (self.get_location(language), str(self.capacity), str(self.capacity_max), self.get_status(language))) if include_header else ""
         if include_players:
             if not self.players and not self.spare_players:
-                result += "\n" + _(messages["report"]["empty"], language)
+                result += "\n" + texts.get(messages["report"]["empty"])
             else:            
                 if self.players:
-                    result += "\n" + _(messages["report"]["active"], language) % str(self.capacity)
+                    result += "\n" + texts.get(messages["report"]["active"]) % str(self.capacity)
                     i = 1
                     for player in self.players:
                         result += f"\n\t{i}: {str(player)}"
                         i = i + 1
                 if self.spare_players:
-                    result += "\n" + _(messages["report"]["queue"], language) % str(self.capacity_spare)
+                    result += "\n" + texts.get(messages["report"]["queue"]) % str(self.capacity_spare)
                     i = 1
                     for player in self.spare_players:
                         result += f"\n\t{i}: {str(player)}"
                         i = i + 1
         return result
 
-    def find(self, userid:int) -> (int, Player, list[Player]):
-        if (p := self.find_player(userid)):
-            return Competition.PLAYER_REGISTERED_MAIN, p, self.players
-        if (p := self.find_spare_player(userid)):
-            return Competition.PLAYER_REGISTERED_SPARE, p, self.spare_players
-        return Competition.PLAYER_NOT_REGISTERED, None, None
+    def find(self, userid:int) -> (int, Player, PlayerList):
+        entry = self._index.get(userid, None)
+        if not entry:
+            return Competition.PLAYER_NOT_REGISTERED, None, None
+        p, storage = entry
+        if storage is self.players:
+            return Competition.PLAYER_REGISTERED_MAIN, p, storage
+        return Competition.PLAYER_REGISTERED_SPARE, p, storage
     
     def find_player(self, userid: int) -> Player:
-        return next((x for x in self.players if x.owner.user_id == userid), None)
+        return self.players.get(userid)
 
     def find_spare_player(self, userid: int) -> Player:
-        return next((x for x in self.spare_players if x.owner.user_id == userid), None)
+        return self.spare_players.get(userid)
     
     def get_role(self, status, l) -> str:
-        return _(messages["role"]["main"] if status == Competition.PLAYER_REGISTERED_MAIN else messages["role"]["spare"], l)
+        return catalog(l).get(messages["role"]["main"] if status == Competition.PLAYER_REGISTERED_MAIN else messages["role"]["spare"])
 
     def on_event(self, user_id: int, attendees_claimed: int, attendees_final: int, code: int):
         di[History].add_event(
-            RegistrationEvent(datetime.now(), user_id, self.date, self.location, attendees_claimed, attendees_final, code))
+            RegistrationEvent(datetime.now(), user_id, self.date, self.location, attendees_claimed, attendees_final, code,
+                              self.capacity_max))
 
     async def register(self, user: Chatuser, notifier:ChatNotifier, participants:int = -1, order:int = 0) -> (bool, bool, str):
+        async with self.lock:
+            return await self._register(user, notifier, participants, order)
+
+    async def _register(self, user: Chatuser, notifier:ChatNotifier, participants:int = -1, order:int = 0) -> (bool, bool, str):
         l = user.language_code
+        texts = catalog(l)
         if self.status not in (Competition.OPEN, Competition.FULL):
-            return False, False, _(messages["join"]["game_status"]["not_open"], l) % self.get_location(l)
+            return False, False, texts.get(messages["join"]["game_status"]["not_open"]) % self.get_location(l)
         status, player = self.find(user.user_id)[0:2]
         if status != Competition.PLAYER_NOT_REGISTERED:
             if participants == -1:
-                return False, False, _(messages["join"]["already_joined"], l) % (self.get_location(l), self.get_role(status, l))
+                return False, False, texts.get(messages["join"]["already_joined"]) % (self.get_location(l), self.get_role(status, l))
             if status == Competition.PLAYER_REGISTERED_MAIN:
                 if self.capacity + participants > self.capacity_max:
-                    return False, False, _(messages["join"]["joined_cannot_extend"], l) % (self.get_location(l), self.get_role(status, l))
+                    return False, False, texts.get(messages["join"]["joined_cannot_extend"]) % (self.get_location(l), self.get_role(status, l))
                 player.participants += participants
                 self.on_event(user.user_id, participants, player.participants, RegistrationEvent.UPDATE_ATTENDEES)
                 self.capacity += participants
                 if self.capacity == self.capacity_max:
                     self.status = Competition.FULL
                     await notifier.competition_status_changed(self.id)
-                return True, False , _(messages["join"]["joined_updated"], l) % \
+                return True, False , texts.get(messages["join"]["joined_updated"]) % \
                     (self.get_location(l), self.get_role(status, l), str(player.participants))
             player.participants += participants
             self.on_event(user.user_id, participants, player.participants, RegistrationEvent.UPDATE_ATTENDEES_SPARE)
-            return False, True, _(messages["join"]["joined_updated"], l) % \
+            return False, True, texts.get(messages["join"]["joined_updated"]) % \
                 (self.get_location(l), self.get_role(status, l), str(player.participants))
         if participants == -1:
             participants = 1
         if self.status == Competition.OPEN and order == 0:
             if self.capacity + participants > self.capacity_max:
-                return False, False, _(messages["join"]["cannot_join_need_reduce"], l) % (self.get_location(l), str(participants))
+                return False, False, texts.get(messages["join"]["cannot_join_need_reduce"]) % (self.get_location(l), str(participants))
             self.capacity += participants
             self.players.append(Player(user, participants))
             self.on_event(user.user_id, participants, participants, RegistrationEvent.REGISTER)
             if self.capacity == self.capacity_max:
                 self.status = Competition.FULL
                 await notifier.competition_status_changed(self.id)
-            return True, False, _(messages["join"]["joined"], l) % self.get_location(l)
+            return True, False, texts.get(messages["join"]["joined"]) % self.get_location(l)
         if order == 1:
             self.spare_players.append(Player(user, participants))
             self.on_event(user.user_id, participants, participants, RegistrationEvent.REGISTER_SPARE)
-            return False, True, _(messages["join"]["joined_as_spare"], l) % self.get_location(l)
+            return False, True, texts.get(messages["join"]["joined_as_spare"]) % self.get_location(l)
         return False, False, None
 
     async def deregister(self, user: Chatuser, notifier:ChatNotifier, participants:int = -1)-> (bool, bool, str):
+        async with self.lock:
+            return await self._deregister(user, notifier, participants)
+
+    async def _deregister(self, user: Chatuser, notifier:ChatNotifier, participants:int = -1)-> (bool, bool, str):
         l = user.language_code
+        texts = catalog(l)
         if self.status not in (Competition.OPEN, Competition.FULL):
-            return False, False, _(messages["join"]["game_status"]["not_open"], l) % self.get_location(l)
+            return False, False, texts.get(messages["join"]["game_status"]["not_open"]) % self.get_location(l)
         status,player,storage = self.find(user.user_id)
         if status == Competition.PLAYER_NOT_REGISTERED:
-            return False, False, _(messages["join"]["cannot_deregister"], l) % self.get_location(l)
+            return False, False, texts.get(messages["join"]["cannot_deregister"]) % self.get_location(l)
         if participants == -1:
             participants = player.participants
         if participants < 0 or participants > player.participants:
-            return False, False, _(messages["join"]["cannot_deregister_more"], l) % self.get_location(l)
+            return False, False, texts.get(messages["join"]["cannot_deregister_more"]) % self.get_location(l)
         if status == Competition.PLAYER_REGISTERED_MAIN:
             event = RegistrationEvent.UNREGISTER
             self.capacity -= participants
         else:
             event = RegistrationEvent.UNREGISTER_SPARE
         player.participants -= participants
-        if player.participants <= 0:
+        removed = player.participants <= 0
+        if removed:
             storage.remove(player)
-            self.on_event(user.user_id, participants, 0, event)
+        self.on_event(user.user_id, participants, max(player.participants, 0), event)
+        promoted = 0
+        if status == Competition.PLAYER_REGISTERED_MAIN:
+            promoted = await self._promote(notifier)
+            if self.update_status():
+                await notifier.competition_status_changed(self.id)
+        if removed:
             if status == Competition.PLAYER_REGISTERED_MAIN:
-                return True, False, _(messages["join"]["deregistered"],l) % self.get_location(l)
-            return False, True, _(messages["join"]["deregistered_spare"],l) % self.get_location(l)
-        self.on_event(user.user_id, participants, player.participants, event)
-        promoted = await self.promote(notifier)
-        if self.capacity < self.capacity_max:
-            self.status = Competition.OPEN
-        return True, promoted != 0, _(messages["join"]["deregistered_updated"], l) % \
+                return True, promoted != 0, texts.get(messages["join"]["deregistered"]) % self.get_location(l)
+            return False, True, texts.get(messages["join"]["deregistered_spare"]) % self.get_location(l)
+        return True, promoted != 0, texts.get(messages["join"]["deregistered_updated"]) % \
             (self.get_location(l), 
-             (str(player.participants) if player.participants > 1 else _(messages["join"]["only_you"], l)))
-    
-    async def promote(self, notifier:ChatNotifier) -> int:
-        if self.capacity == self.capacity_max or not self.spare_players:
-            return 0
-        loop=True
-        promoted = 0
-        while self.capacity < self.capacity_max and self.spare_players and loop:
-            loop = False
-            for i in range(len(self.spare_players)):
-                if self.spare_players[i].participants <= self.capacity_max - self.capacity:
-                    user = self.spare_players.pop(i)
-                    self.players.append(user)
-                    self.on_event(user.owner.user_id, user.participants, user.participants, RegistrationEvent.PROMOTE)
-                    promoted += user.participants
-                    l = user.language_code
-                    await notifier.notify_user(user, _(messages["join"]["promoted"], l) % self.get_location(l))
-                    loop = True
-                    break
+             (str(player.participants) if player.participants > 1 else texts.get(messages["join"]["only_you"])))
+
+    def update_status(self) -> bool:
+        """switches between open and full status after the capacity change, returns True if the status changed"""
+        if not self.is_open_or_full():
+            return False
+        status = Competition.FULL if self.capacity >= self.capacity_max else Competition.OPEN
+        if status == self.status:
+            return False
+        self.status = status
+        return True
+
+    def promote_waiting(self) -> list[Player]:
+        """moves spare players into the free places of the main list, in the order of the queue"""
+        if self.capacity >= self.capacity_max or not self.spare_players:
+            return []
+        promoted = self.spare_players.take_fitting(self.capacity_max - self.capacity)
+        for p in promoted:
+            self.players.append(p)
+            self.capacity += p.participants
+            self.on_event(p.owner.user_id, p.participants, p.participants, RegistrationEvent.PROMOTE)
         return promoted
+
+    def demote_overflow(self) -> list[Player]:
+        """moves players exceeding the capacity to the head of the waiting queue, and returns them;
+        the player whose party exactly matches the overflow is taken first (the latest registered such one),
+        otherwise the latest registered players are taken, until the overflow is gone"""
+        diff = self.capacity - self.capacity_max
+        if diff <= 0:
+            return []
+        players = list(self.players)
+        by_size = {}
+        for i, p in enumerate(players):
+            by_size.setdefault(p.participants, []).append(i)
+        demoted = set()
+        last = len(players)
+        while diff > 0 and len(demoted) < len(players):
+            candidates = by_size.get(diff, [])
+            while candidates and candidates[-1] in demoted:
+                candidates.pop()
+            if candidates:
+                i = candidates.pop()
+            else:
+                while last - 1 in demoted:
+                    last -= 1
+                last -= 1
+                i = last
+            demoted.add(i)
+            diff -= players[i].participants
+        result = [players[i] for i in sorted(demoted)]
+        for p in result:
+            self.players.remove(p)
+            self.capacity -= p.participants
+            self.on_event(p.owner.user_id, p.participants, p.participants, RegistrationEvent.DEMOTE)
+        self.spare_players.prepend(result)
+        return result
+
+    async def promote(self, notifier:ChatNotifier) -> int:
+        async with self.lock:
+            return await self._promote(notifier)
+
+    async def _promote(self, notifier:ChatNotifier) -> int:
+        """promotes spare players, and then notifies all of them at once"""
+        promoted = self.promote_waiting()
+        if promoted:
+            await asyncio.gather(*(notifier.notify_user(p.owner, catalog(p.owner.language_code).get(messages["join"]["promoted"]) % \
+                                                        self.get_location(p.owner.language_code)) for p in promoted))
+        return sum(p.participants for p in promoted)
         
     def get_location(self, language:str) -> str:
         d = self.get_date()
-        s = (_(datetime.strftime(d, '%A'), language) + ', ' + datetime.strftime(d, '%d.%m.%Y %H:%M')) \
-            if d is not None else _(messages["join"]["game_status"]["not_scheduled"], language)
-        result = (self.location if self.location else _("Not set",language)) + ", " + s
+        texts = catalog(language)
+        s = (texts.weekday(d) + ', ' + datetime.strftime(d, '%d.%m.%Y %H:%M')) \
+            if d is not None else texts.get(messages["join"]["game_status"]["not_scheduled"])
+        result = (self.location if self.location else texts.get("Not set")) + ", " + s
         if self.duration != Competition.duration_default:
-            result += _(", %s minutes", language) % str(self.duration)
+            result += texts.get(", %s minutes") % str(self.duration)
         return result
     
@@ -0,0 +1,98 @@
+"""indexed registry of competitions"""
+from datetime import datetime
+from typing import Iterator
+from competition import Competition
+
+class CompetitionRegistry:
+    """keeps competitions indexed by id, poll id, and start date and location of the scheduled game,
+    grouped by status, and ordered by date (competitions without date go last);
+    competitions report the changes of indexed fields back to the registry"""
+
+    def __init__(self, competitions: list[Competition] = None):
+        self._by_id = {}
+        self._by_poll_id = {}
+        self._by_start = {}
+        self._by_status = {}
+        self._ordered = []
+        self._order_valid = True
+        for c in competitions or []:
+            self.add(c)
+
+    @staticmethod
+    def _order_key(c: Competition):
+        return (c.date is None, c.date if c.date else datetime.min)
+
+    @staticmethod
+    def _start_key(c: Competition):
+        return (c.description.date, c.description.location) if c.description else None
+
+    def add(self, c: Competition) -> None:
+        self._by_id[c.id] = c
+        if c.poll_id:
+            self._by_poll_id[c.poll_id] = c
+        if (key := CompetitionRegistry._start_key(c)):
+            self._by_start[key] = c
+        self._by_status.setdefault(c.status, {})[c.id] = c
+        self._ordered.append(c)
+        self._order_valid = False
+        c.attach_registry(self)
+
+    def remove(self, c: Competition) -> None:
+        if self._by_id.pop(c.id, None) is None:
+            raise ValueError("competition is not registered")
+        if c.poll_id and self._by_poll_id.get(c.poll_id, None) is c:
+            del self._by_poll_id[c.poll_id]
+        if (key := CompetitionRegistry._start_key(c)) and self._by_start.get(key, None) is c:
+            del self._by_start[key]
+        self._by_status.get(c.status, {}).pop(c.id, None)
+        self._ordered = [x for x in self._ordered if x is not c]
+        c.attach_registry(None)
+
+    def competition_changed(self, c: Competition, name: str, old) -> None:
+        """called by a registered competition when its indexed field is changed"""
+        if name == 'status':
+            self._by_status.get(old, {}).pop(c.id, None)
+            self._by_status.setdefault(c.status, {})[c.id] = c
+        elif name == 'poll_id':
+            if old and self._by_poll_id.get(old, None) is c:
+                del self._by_poll_id[old]
+            if c.poll_id:
+                self._by_poll_id[c.poll_id] = c
+        elif name == 'date':
+            self._order_valid = False
+
+    def get(self, id_str: str) -> Competition:
+        return self._by_id.get(id_str, None)
+
+    def get_by_poll_id(self, poll_id: str) -> Competition:
+        return self._by_poll_id.get(poll_id, None) if poll_id else None
+
+    def get_by_start(self, start: datetime, location: str) -> Competition:
+        return self._by_start.get((start, location), None)
+
+    def count(self, *statuses) -> int:
+        return sum(len(self._by_status.get(s, {})) for s in statuses)
+
+    def first(self, *statuses) -> Competition:
+        """the earliest competition having one of the statuses"""
+        found = [c for s in statuses for c in self._by_status.get(s, {}).values()]
+        return min(found, key=CompetitionRegistry._order_key) if found else None
+
+    def by_date(self) -> list[Competition]:
+        """competitions ordered by date; sorted again only when a competition was added or its date changed"""
+        if not self._order_valid:
+            self._ordered = sorted(self._ordered, key=CompetitionRegistry._order_key)
+            self._order_valid = True
+        return self._ordered
+
+    def __iter__(self) -> Iterator[Competition]:
+        return iter(self.by_date())
+
+    def __reversed__(self) -> Iterator[Competition]:
+        return reversed(self.by_date())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, c: Competition) -> bool:
+        return self._by_id.get(c.id, None) is c
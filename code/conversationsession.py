@@ -0,0 +1,43 @@
+"""state of the private conversation with one user"""
+from datetime import datetime
+from telegram import InlineKeyboardMarkup
+
+class EditDraft:
+    """date and duration of a game being edited, applied to the game when confirmed"""
+    date: datetime
+    duration: int       #minutes
+
+    def __init__(self, date: datetime, duration: int):
+        self.date = date
+        self.duration = duration
+
+class ConversationSession:
+    """kept in context.user_data, so the handlers of different users do not share it:
+    the headline and the keyboard of the last reply, and the drafts of the games edited by the user"""
+    headline: str
+    keyboard: InlineKeyboardMarkup
+    drafts: dict        #competition id: EditDraft
+
+    def __init__(self):
+        self.headline = ""
+        self.keyboard = None
+        self.drafts = {}
+
+    def reset(self) -> None:
+        self.headline = ""
+        self.keyboard = None
+
+    def start_editing(self, c) -> EditDraft:
+        draft = self.drafts[c.id] = EditDraft(c.date, c.duration)
+        return draft
+
+    def draft(self, c) -> EditDraft:
+        """the draft of the game, started from its current values if the editing has not started yet"""
+        draft = self.drafts.get(c.id, None)
+        return draft if draft else self.start_editing(c)
+
+    def apply_editing(self, c) -> None:
+        draft = self.drafts.pop(c.id, None)
+        if draft:
+            c.date = draft.date
+            c.duration = draft.duration
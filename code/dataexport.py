@@ -0,0 +1,195 @@
+"""export of the history and competitions for reports; run from the root folder:
+python code/dataexport.py events|games|competitions|players [--format csv|jsonl|parquet] [--output folder] [--incremental]"""
+from abc import ABC, abstractmethod
+import argparse
+import csv
+from datetime import datetime
+import json
+import os
+from os import path
+import pickle
+import sqlite3
+from typing import Iterator
+from chatcommunity import ChatCommunity
+from competition import Competition
+from datamodel import DataModel
+from historyevent import to_db, from_db
+from historyquery import iter_events
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+#columns of the datasets: name, type (int, str or time)
+COLUMNS = {
+    'events': [('id', 'int'), ('time', 'time'), ('user_id', 'int'), ('game', 'time'), ('location', 'str'),
+               ('attendees', 'int'), ('remaining', 'int'), ('event', 'int'), ('capacity', 'int')],
+    'games': [('game', 'time'), ('location', 'str'), ('capacity', 'int'), ('attendees', 'int'), ('spare_attendees', 'int'),
+              ('peak_attendees', 'int'), ('first_registration', 'time'), ('full_time', 'time')],
+    'competitions': [('id', 'str'), ('date', 'time'), ('location', 'str'), ('duration', 'int'), ('status', 'int'),
+                     ('capacity_max', 'int'), ('capacity', 'int'), ('capacity_spare', 'int'), ('players', 'int'), ('spare_players', 'int')],
+    'players': [('competition_id', 'str'), ('date', 'time'), ('user_id', 'int'), ('name', 'str'), ('participants', 'int'), ('spare', 'int')],
+}
+CHUNK = 5000
+
+def history_games(data_path: str, after: datetime = None) -> Iterator[tuple]:
+    """statistics of the games played after the given date (and before now)"""
+    conn = sqlite3.connect("file:" + path.join(data_path, 'history.db') + "?mode=ro", uri=True)
+    try:
+        cursor = conn.execute('''SELECT GAME,LOCATION,CAPACITY,ATTENDEES,SPARE_ATTENDEES,PEAK_ATTENDEES,FIRST_EVENT,FULL_TIME
+            FROM GAME_STATS WHERE GAME>? AND GAME<? ORDER BY GAME''', (to_db(after or datetime.min), to_db(datetime.now())))
+        while rows := cursor.fetchmany(CHUNK):
+            yield from rows
+    finally:
+        conn.close()
+
+def load_competitions(data_path: str) -> list[Competition]:
+    """all competitions kept in the storage, including the past ones not evicted yet, ordered by date"""
+    chat = ChatCommunity()
+    competitions = []
+    #the bot may be running: its files are only read
+    storage = DataModel.create_storage(data_path, lambda: chat, lambda: competitions, True)
+    chat = storage.load_chat()
+    competitions = storage.load_competitions(chat)
+    return sorted((c for c in competitions if c.date), key=lambda c: c.date)
+
+def competition_rows(data_path: str, after: datetime = None) -> Iterator[tuple]:
+    for c in load_competitions(data_path):
+        if not after or after < c.date < datetime.now():
+            yield (c.id, to_db(c.date), c.location, c.duration, c.status, c.capacity_max, c.capacity, c.capacity_spare,
+                   len(c.players), len(c.spare_players))
+
+def player_rows(data_path: str, after: datetime = None) -> Iterator[tuple]:
+    for c in load_competitions(data_path):
+        if not after or after < c.date < datetime.now():
+            for spare, players in ((0, c.players), (1, c.spare_players)):
+                for p in players:
+                    yield (c.id, to_db(c.date), p.owner.user_id, p.owner.name, p.participants, spare)
+
+class ExportWriter(ABC):
+    """writes the rows of a dataset into a file, one by one"""
+    def __init__(self, file_path: str, columns: list):
+        self.file_path = file_path
+        self.columns = columns
+    @abstractmethod
+    def write(self, row: tuple):
+        raise NotImplementedError
+    @abstractmethod
+    def close(self):
+        raise NotImplementedError
+
+class CsvExportWriter(ExportWriter):
+    extension = "csv"
+    def __init__(self, file_path: str, columns: list):
+        super().__init__(file_path, columns)
+        self._file = open(file_path, 'w', newline='', encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([c[0] for c in columns])
+    def write(self, row: tuple):
+        self._writer.writerow(row)
+    def close(self):
+        self._file.close()
+
+class JsonLinesExportWriter(ExportWriter):
+    extension = "jsonl"
+    def __init__(self, file_path: str, columns: list):
+        super().__init__(file_path, columns)
+        self._file = open(file_path, 'w', encoding="utf-8")
+        self._names = [c[0] for c in columns]
+    def write(self, row: tuple):
+        self._file.write(json.dumps(dict(zip(self._names, row)), ensure_ascii=False) + "\n")
+    def close(self):
+        self._file.close()
+
+class ParquetExportWriter(ExportWriter):
+    """columnar, zstd compressed; rows are collected into row groups of CHUNK rows"""
+    extension = "parquet"
+    TYPES = {'int': lambda: pyarrow.int64(), 'str': lambda: pyarrow.string(), 'time': lambda: pyarrow.timestamp('us')}
+    def __init__(self, file_path: str, columns: list):
+        super().__init__(file_path, columns)
+        if pyarrow is None:
+            raise RuntimeError("parquet export needs the pyarrow package")
+        self._schema = pyarrow.schema([(name, ParquetExportWriter.TYPES[t]()) for name, t in columns])
+        self._times = [i for i, c in enumerate(columns) if c[1] == 'time']
+        self._writer = pyarrow.parquet.ParquetWriter(file_path, self._schema, compression='zstd')
+        self._rows = []
+    def write(self, row: tuple):
+        if self._times:
+            row = list(row)
+            for i in self._times:
+                row[i] = from_db(row[i])
+        self._rows.append(row)
+        if len(self._rows) >= CHUNK:
+            self._flush()
+    def _flush(self):
+        if self._rows:
+            data = [[r[i] for r in self._rows] for i in range(len(self.columns))]
+            self._writer.write_batch(pyarrow.record_batch(data, schema=self._schema))
+            self._rows = []
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+WRITERS = {w.extension: w for w in (CsvExportWriter, JsonLinesExportWriter, ParquetExportWriter)}
+
+def read_watermarks(output: str) -> dict:
+    try:
+        with open(path.join(output, 'watermarks.json'), 'r', encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def write_watermarks(output: str, watermarks: dict) -> None:
+    tmp = path.join(output, 'watermarks.json.tmp')
+    with open(tmp, 'w', encoding="utf-8") as f:
+        json.dump(watermarks, f, indent=2)
+    os.replace(tmp, path.join(output, 'watermarks.json'))
+
+def export(data_path: str, dataset: str, file_format: str, output: str, incremental: bool) -> int:
+    """writes the dataset into a new file in the output folder, returns the number of rows;
+    with incremental, only the rows after the watermark of the previous incremental export are written:
+    events after the last exported ID, games and competitions played after the last exported date"""
+    os.makedirs(output, exist_ok=True)
+    watermarks = read_watermarks(output) if incremental else {}
+    mark = watermarks.get(dataset, None)
+    if dataset == 'events':
+        rows = iter_events(path.join(data_path, 'history.db'), mark or 0)
+    elif dataset == 'games':
+        rows = history_games(data_path, from_db(mark))
+    elif dataset == 'competitions':
+        rows = competition_rows(data_path, (from_db(mark) or datetime.min) if incremental else None)
+    else:
+        rows = player_rows(data_path, (from_db(mark) or datetime.min) if incremental else None)
+    file_path = path.join(output, dataset + "-" + datetime.now().strftime("%Y%m%d-%H%M%S") + "." + file_format)
+    writer = WRITERS[file_format](file_path + ".tmp", COLUMNS[dataset])
+    count = 0
+    try:
+        for row in rows:
+            writer.write(row)
+            count += 1
+            mark = row[0] if dataset in ('events', 'games') else row[1]
+    finally:
+        writer.close()
+    if count == 0:
+        os.remove(file_path + ".tmp")
+        print("%s: nothing to export" % dataset)
+        return 0
+    os.replace(file_path + ".tmp", file_path)
+    if incremental:
+        watermarks[dataset] = mark
+        write_watermarks(output, watermarks)
+    print("%s: %s rows exported into %s" % (dataset, str(count), file_path))
+    return count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="exports the bot history and competitions")
+    parser.add_argument("dataset", choices=COLUMNS.keys())
+    parser.add_argument("--format", choices=WRITERS.keys(), default="csv")
+    parser.add_argument("--output", default=path.join(".", "export"))
+    parser.add_argument("--incremental", action="store_true", help="export only the rows after the previous incremental export")
+    args = parser.parse_args()
+    try:
+        export(path.join(".", "data"), args.dataset, args.format, args.output, args.incremental)
+    except (sqlite3.Error, pickle.UnpicklingError, IOError, RuntimeError) as e:
+        print("export failed: " + str(e))
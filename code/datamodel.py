@@ -1,30 +1,46 @@
 """Main data storage"""
 from datetime import datetime
 import pickle
+import sqlite3
 from os import path
+from typing import Callable
 from kink import di
+from config import preferences
 from competition import Competition
 from chatcommunity import ChatCommunity
+from competitionregistry import CompetitionRegistry
 from myexception import LogicException
 from history import History
+from historyreplay import HistoryReplay
 from gameschedule import GameSchedule
+from chatuser import Chatuser
+from gameevent import GameEvent
+from player import Player
+from storage import Storage, PickleStorage
+from sqlitestorage import SqliteStorage
+from writebehind import WriteBehind
 
 class DataModel():
     """Main data storage class"""
-    competitions : list[Competition]
+    competitions : CompetitionRegistry
     chat : ChatCommunity
     history: History
     schedule: GameSchedule
 
+    storage: Storage
+
     no_save: bool
 
+    #data parts marked for the write-behind persistence
+    (COMPETITIONS, COMPETITION, CHAT, USER, PENDING_OPERATIONS) = range(5)
+
     def get_open_competitions_number(self) -> int:
         '''returns the number of open competitions, accepting new registrations'''
-        return sum(1 for x in self.competitions if x.status == Competition.OPEN)
+        return self.competitions.count(Competition.OPEN)
 
     def get_open_or_full_competitions_number(self) -> int:
         '''returns the number of open competitions, accepting new registrations, or fully staffed'''
-        return sum(1 for x in self.competitions if x.status in (Competition.OPEN, Competition.FULL))
+        return self.competitions.count(Competition.OPEN, Competition.FULL)
 
     def is_single_competition_open(self) -> bool:
         '''returns True if there is only one competition in open status, accepting new registrations'''
@@ -37,59 +53,206 @@ class DataModel():
     def get_single_competition_open_or_full(self) -> Competition:
         if not self.is_single_competition_open_or_full():
             raise LogicException("0 or More than 1 competition is in open or full status")
-        return next(x for x in self.competitions if x.status in (Competition.OPEN, Competition.FULL))
+        return self.competitions.first(Competition.OPEN, Competition.FULL)
 
     def get_competition_by_id(self, id_str:str) -> Competition:
-        return next((x for x in self.competitions if x.id == id_str), None)
+        return self.competitions.get(id_str)
 
     def get_competition_by_poll_id(self, poll_id:str) -> Competition:
-        return next((x for x in self.competitions if x.poll_id == poll_id),None)
+        return self.competitions.get_by_poll_id(poll_id)
 
     def get_competition_by_start_date_and_location(self, start:datetime, location:str) -> Competition:
-        return next((x for x in self.competitions if x.description and x.description.date == start and x.description.location == location), None)
+        return self.competitions.get_by_start(start, location)
 
     def __init__(self, no_persistency:bool = False):
         self.no_save = no_persistency
         self.path = path.join(".", "data")
+        #the storage sees the copies saved by the write-behind worker, never the objects changed by the event loop
+        self.storage = None if no_persistency else \
+            DataModel.create_storage(self.path, lambda: self._saved_chat, lambda: list(self._saved_competitions.values()))
+        self.history = di[History] = History(no_persistency)
         if not no_persistency:
             try:
                 self.chat = self.load_chat()
-            except (pickle.UnpicklingError, IOError) as e:
+            except (pickle.UnpicklingError, IOError, sqlite3.Error) as e:
                 print("load_chat failed: " + str(e))
                 self.chat = ChatCommunity()
+            rebuilt = False
             try:
-                self.competitions = self.load_competitions()
-            except (pickle.UnpicklingError, IOError) as e:
+                competitions = self.load_competitions()
+                if rebuilt := self.storage.competitions_missing():
+                    #a journal tail may survive the snapshot, its competitions take precedence
+                    print("stored competitions are missing")
+                    competitions = DataModel.merge_competitions(competitions, self.replay_competitions())
+                self.competitions = CompetitionRegistry(competitions)
+                if preferences["history"]["check_on_start"]:
+                    self.check_competitions()
+            except (pickle.UnpicklingError, IOError, sqlite3.Error) as e:
                 print("load_competitions failed: " + str(e))
-                self.competitions = []
+                self.competitions = CompetitionRegistry(self.replay_competitions())
+                rebuilt = True
         else:
             self.chat = ChatCommunity()
-            self.competitions = []
-        self.history = di[History] = History(no_persistency)
-        self.schedule = di[GameSchedule] = GameSchedule(no_persistency)
+            self.competitions = CompetitionRegistry()
+        if not no_persistency:
+            self._saved_chat = DataModel._copy(self.chat)
+            self._saved_competitions = {c.id: c for c in DataModel._copy(list(self.competitions))}
+            self.write_behind = WriteBehind(float(preferences["persistence"]["write_behind_seconds"]), self._write)
+            if rebuilt:
+                self.save_competitions()
+        self.schedule = di[GameSchedule] = GameSchedule(self.storage)
+
+    @staticmethod
+    def create_storage(data_path: str, chat: Callable[[], ChatCommunity], competitions: Callable[[], list[Competition]],
+                       read_only: bool = False) -> Storage:
+        """creates the storage backend selected in the preferences; a read_only one for tools reading the data of a running bot"""
+        mode = preferences["persistence"]["mode"]
+        if mode == "sqlite":
+            return SqliteStorage(data_path, read_only)
+        compact_records = int(preferences["persistence"]["journal_compact_records"])
+        return PickleStorage(data_path, mode == "journal", compact_records, chat, competitions, read_only)
 
     def load_competitions(self) -> list[Competition]:
         """Loading the competition list. Those are in the past will be evicted"""
-        with open(path.join(self.path,'competitions.pickle'), 'rb') as f:
-            result = pickle.load(f)
-            result[:] = [x for x in result if not x.date or x.date > datetime.now()]
-            return result 
+        result = self.storage.load_competitions(self.chat)
+        result[:] = [x for x in result if not x.date or x.date > datetime.now()]
+        return result
+
+    def replay_competitions(self) -> list[Competition]:
+        """Rebuilding the future competitions from the history events, when the stored ones are lost.
+        The lists of players and the capacity are restored; the registration is taken as open, polls are not restored"""
+        result = []
+        try:
+            states = self.history.replay_upcoming()
+        except sqlite3.Error as e:
+            print("replay_competitions failed: " + str(e))
+            return result
+        for state in states:
+            capacity_max = state.capacity_max if state.capacity_max else state.capacity
+            c = Competition(GameEvent(state.game, Competition.duration_default, state.location, False, None, capacity_max, True, True))
+            for user_id, participants in state.players.items():
+                c.players.append(Player(self._replay_user(user_id), participants))
+            for user_id, participants in state.spare_players.items():
+                c.spare_players.append(Player(self._replay_user(user_id), participants))
+            c.capacity = state.capacity
+            c.status = Competition.FULL if c.capacity >= c.capacity_max else Competition.OPEN
+            result.append(c)
+        print("%s competitions rebuilt from the history" % str(len(result)))
+        return result
+
+    @staticmethod
+    def merge_competitions(loaded: list[Competition], rebuilt: list[Competition]) -> list[Competition]:
+        """the loaded competitions, and the rebuilt ones of the games not among them"""
+        games = {(c.date, c.location) for c in loaded}
+        return loaded + [c for c in rebuilt if (c.date, c.location) not in games]
+
+    def _replay_user(self, user_id: int) -> Chatuser:
+        return self.chat.find_user(user_id) or Chatuser(str(user_id), user_id, Chatuser.NEW)
+
+    def check_competitions(self) -> int:
+        """Comparing the players of the future competitions with the registrations rebuilt from the history;
+        the differences are printed, returns the number of inconsistent competitions"""
+        inconsistent = 0
+        try:
+            for c in self.competitions:
+                if not c.is_in_the_future():
+                    continue
+                state = self.history.replay(c.date, c.location)
+                if not state or (state.last_id == 0 and not c.players and not c.spare_players):
+                    continue
+                differences = HistoryReplay.compare(state, [(p.owner.user_id, p.participants) for p in c.players],
+                                                    [(p.owner.user_id, p.participants) for p in c.spare_players], c.capacity)
+                if differences:
+                    inconsistent += 1
+                    print("competition %s differs from the history: %s" % (c.id, "; ".join(differences)))
+        except sqlite3.Error as e:
+            print("check_competitions failed: " + str(e))
+        return inconsistent
 
     def load_chat(self) -> ChatCommunity:
         """Loading the chat info."""
-        with open(path.join(self.path,'chat.pickle'), 'rb') as f:
-            return pickle.load(f)
+        return self.storage.load_chat()
 
     def save_competitions(self):
         """Saving the competition info."""
         if not self.no_save:
-            with open(path.join(self.path,'competitions.pickle'), 'wb') as f:
-                # Pickle the 'data' dictionary using the highest protocol available.
-                pickle.dump(self.competitions, f, pickle.HIGHEST_PROTOCOL)
+            self.write_behind.mark(DataModel.COMPETITIONS, None, DataModel._snapshot(list(self.competitions)))
+
+    def save_competition(self, c: Competition):
+        """Saving the changes of a single competition."""
+        if not self.no_save:
+            self.write_behind.mark(DataModel.COMPETITION, c.id, DataModel._snapshot(c))
+
+    def remove_competition(self, c: Competition):
+        """Removing the competition from the list, and saving the change."""
+        self.competitions.remove(c)
+        if not self.no_save:
+            self.write_behind.mark(DataModel.COMPETITION, c.id, None)
 
     def save_chat(self):
         """Saving the chat info."""
         if not self.no_save:
-            with open(path.join(self.path,'chat.pickle'), 'wb') as f:
-                # Pickle the 'data' dictionary using the highest protocol available.
-                pickle.dump(self.chat, f, pickle.HIGHEST_PROTOCOL)
+            self.write_behind.mark(DataModel.CHAT, None, DataModel._snapshot(self.chat))
+
+    def save_user(self, user: Chatuser):
+        """Saving the changes of a single chat user."""
+        if not self.no_save:
+            self.write_behind.mark(DataModel.USER, user.user_id, DataModel._snapshot(user))
+
+    def save_pending_operations(self):
+        """Saving the list of pending operations on chat users."""
+        if not self.no_save:
+            self.write_behind.mark(DataModel.PENDING_OPERATIONS, None, DataModel._snapshot(self.chat.pending_operations))
+
+    def flush(self):
+        """Writing all pending changes now."""
+        if not self.no_save:
+            self.write_behind.flush()
+
+    def close(self):
+        """Writing all pending changes and stopping the write-behind worker and the history writer."""
+        if not self.no_save:
+            self.write_behind.close()
+        self.history.close()
+
+    @staticmethod
+    def _snapshot(value: object) -> bytes:
+        """serializes the data in the event loop thread, where it is changed, so the worker never sees it half-changed"""
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _copy(value: object) -> object:
+        return pickle.loads(DataModel._snapshot(value))
+
+    def _write(self, dirty: dict):
+        """Writing the dirty parts into the storage; called from the write-behind worker.
+        The snapshots are applied to the saved copies first: whole parts, then the entries marked since"""
+        parts = {part for part, _ in dirty}
+        if DataModel.COMPETITIONS in parts:
+            self._saved_competitions = {c.id: c for c in pickle.loads(dirty[(DataModel.COMPETITIONS, None)])}
+        if DataModel.CHAT in parts:
+            self._saved_chat = pickle.loads(dirty[(DataModel.CHAT, None)])
+        for (part, key), value in dirty.items():
+            if part == DataModel.COMPETITION:
+                if value:
+                    self._saved_competitions[key] = pickle.loads(value)
+                else:
+                    self._saved_competitions.pop(key, None)
+            elif part == DataModel.USER:
+                self._saved_chat.add_or_replace(pickle.loads(value))
+            elif part == DataModel.PENDING_OPERATIONS:
+                self._saved_chat.pending_operations = pickle.loads(value)
+        if DataModel.COMPETITIONS in parts:
+            self.storage.save_competitions(self._saved_competitions.values())
+        if DataModel.CHAT in parts:
+            self.storage.save_chat(self._saved_chat)
+        for (part, key), value in dirty.items():
+            if part == DataModel.COMPETITION and DataModel.COMPETITIONS not in parts:
+                if value:
+                    self.storage.save_competition(self._saved_competitions[key])
+                else:
+                    self.storage.remove_competition(key)
+            elif part == DataModel.USER and DataModel.CHAT not in parts:
+                self.storage.save_user(self._saved_chat.find_user(key))
+        if DataModel.PENDING_OPERATIONS in parts and DataModel.CHAT not in parts:
+            self.storage.save_pending_operations(self._saved_chat)
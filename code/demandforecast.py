@@ -0,0 +1,160 @@
+"""registration demand analytics for capacity planning"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import math
+import multiprocessing
+import numpy as np
+from historyevent import RegistrationEvent
+from historyquery import iter_events
+
+#points of the registration velocity curve, hours after the registration opening
+VELOCITY_HOURS = (1, 2, 4, 8, 12, 24, 48)
+#bins of the cancellation curve, hours before the game
+CANCELLATION_HOURS = (0, 2, 6, 12, 24, 48, math.inf)
+
+@dataclass
+class GameSlot:
+    """weekly game of the schedule ([game.*] in schedule.toml)"""
+    name: str
+    day_of_week: int        #as datetime.weekday() and GameSchedule: 0 for Monday, 1 for Tuesday, etc.
+    start: str              #HH:MM
+    facility: str
+    capacity: int
+    capacity_options: list[int]
+    open_days_before: int
+
+@dataclass
+class SlotForecast:
+    """demand observed for the games of a slot, and the settings recommended for it"""
+    slot: GameSlot
+    games: int
+    velocity: list[float]       #median share of the final registrations reached at VELOCITY_HOURS after the opening
+    fill: float                 #median share of the capacity taken when the game started
+    spare_depth: float          #median of the longest spare queue, in attendees
+    cancellations: list[float]  #cancelled attendees per game, in CANCELLATION_HOURS bins before the game
+    demand: float               #75th percentile of the peak demand, main list and spare queue together
+    recommended_capacity: int
+    recommended_open_days_before: int
+
+def load_events(db_path: str) -> dict[str, np.ndarray]:
+    """reads all registration events into arrays: times in seconds, locations as codes into the 'locations' array"""
+    times, games, locations, attendees, events, capacities = [], [], [], [], [], []
+    codes = {}
+    for row in iter_events(db_path):
+        if row[3] is None or row[7] is None:
+            continue
+        times.append(row[1])
+        games.append(row[3])
+        locations.append(codes.setdefault(row[4] or '', len(codes)))
+        attendees.append(row[5] or 0)
+        events.append(row[7])
+        capacities.append(row[8] if row[8] is not None else np.nan)
+    seconds = lambda values: np.array(values, dtype='datetime64[us]').astype(np.int64) / 1e6
+    return {
+        'time': seconds(times), 'game': seconds(games), 'location': np.array(locations, dtype=np.int64),
+        'attendees': np.array(attendees, dtype=np.int64), 'event': np.array(events, dtype=np.int64),
+        'capacity': np.array(capacities, dtype=np.float64), 'locations': np.array(list(codes), dtype=object)}
+
+def _running(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """cumulative sums restarting at every group start"""
+    total = np.cumsum(values)
+    before = np.r_[0, total[starts[1:] - 1]]
+    return total - np.repeat(before, counts)
+
+def analyze(db_path: str, slots: list[GameSlot]) -> list[SlotForecast]:
+    """computes the forecast of every slot; runs in a worker process"""
+    data = load_events(db_path)
+    return [analyze_slot(data, s) for s in slots]
+
+def analyze_slot(data: dict[str, np.ndarray], slot: GameSlot) -> SlotForecast:
+    locations = list(data['locations'])
+    start_minutes = int(slot.start[0:2]) * 60 + int(slot.start[3:5])
+    day = np.floor_divide(data['game'], 86400)
+    #1970-01-01 was a Thursday, weekday 3
+    selected = ((day + 3) % 7 == slot.day_of_week) & \
+        (np.floor_divide(data['game'] % 86400, 60) == start_minutes) & \
+        (data['location'] == (locations.index(slot.facility) if slot.facility in locations else -1))
+    e = {k: v[selected] for k, v in data.items() if k != 'locations'}
+    if not len(e['time']):
+        return SlotForecast(slot, 0, [], 0.0, 0.0, [], 0.0, slot.capacity, slot.open_days_before)
+
+    code, attendees = e['event'], e['attendees']
+    main = np.select([np.isin(code, (RegistrationEvent.REGISTER, RegistrationEvent.UPDATE_ATTENDEES, RegistrationEvent.PROMOTE)),
+                      np.isin(code, (RegistrationEvent.UNREGISTER, RegistrationEvent.DEMOTE))], [attendees, -attendees], 0)
+    spare = np.select([np.isin(code, (RegistrationEvent.REGISTER_SPARE, RegistrationEvent.UPDATE_ATTENDEES_SPARE, RegistrationEvent.DEMOTE)),
+                       np.isin(code, (RegistrationEvent.UNREGISTER_SPARE, RegistrationEvent.PROMOTE))], [attendees, -attendees], 0)
+
+    #events grouped by game, in time order
+    game_ids, inverse = np.unique(e['game'], return_inverse=True)
+    order = np.lexsort((e['time'], inverse))
+    gid, t, main, spare = inverse[order], e['time'][order], main[order], spare[order]
+    counts = np.bincount(gid, minlength=len(game_ids))
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    running_main = _running(main, starts, counts)
+    running_spare = _running(spare, starts, counts)
+    opened = t[starts]
+    final = running_main[starts + counts - 1]
+    capacity = np.fmax.reduceat(e['capacity'][order], starts)
+    capacity = np.where(np.isnan(capacity), slot.capacity, capacity)
+    peak_spare = np.maximum.reduceat(np.maximum(running_spare, 0), starts)
+    peak_demand = np.maximum.reduceat(running_main + np.maximum(running_spare, 0), starts)
+
+    #registrations reached at the given hours after the opening, found by binary search over (game, time since opening)
+    since_opening = t - np.repeat(opened, counts)
+    hours = np.array(VELOCITY_HOURS, dtype=np.float64) * 3600
+    span = max(float(since_opening.max()), float(hours[-1])) + 1
+    keys = gid * span + since_opening
+    positions = np.searchsorted(keys, (np.arange(len(game_ids)) * span)[:, None] + hours[None, :], side='right') - 1
+    reached = np.where(positions >= starts[:, None], running_main[np.maximum(positions, 0)], 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(final[:, None] > 0, reached / final[:, None], np.nan)
+    velocity = np.nanmedian(share, axis=0) if np.any(final > 0) else np.zeros(len(VELOCITY_HOURS))
+
+    cancelled = code == RegistrationEvent.UNREGISTER
+    before = (e['game'][cancelled] - e['time'][cancelled]) / 3600
+    histogram = np.histogram(before, bins=np.array(CANCELLATION_HOURS), weights=attendees[cancelled])[0] / len(game_ids)
+
+    fill = float(np.median(np.where(capacity > 0, final / capacity, 0)))
+    demand = float(np.percentile(peak_demand, 75))
+    options = sorted(slot.capacity_options) if slot.capacity_options else []
+    fitting = [o for o in options if o >= demand]
+    recommended_capacity = fitting[0] if fitting else (options[-1] if options else math.ceil(demand))
+    #registrations come slowly and the games are not filled: give one more day for the registration;
+    #the games are filled within the first hours: the opening time does not limit the demand, the capacity does
+    open_days = slot.open_days_before
+    if fill < 0.9 and velocity[VELOCITY_HOURS.index(24)] < 0.5:
+        open_days += 1
+    return SlotForecast(slot, len(game_ids), [float(v) for v in velocity], fill, float(np.median(peak_spare)),
+                        [float(h) for h in histogram], demand, int(recommended_capacity), open_days)
+
+class DemandForecast:
+    """runs the analysis in a worker process, so the event loop is not stalled by it"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._executor = None
+
+    async def run(self, slots: list[GameSlot]) -> list[SlotForecast]:
+        if not self._executor:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        return await asyncio.get_running_loop().run_in_executor(self._executor, analyze, self.db_path, slots)
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+def slots_from_config(schedule: dict) -> list[GameSlot]:
+    """the weekly games of schedule.toml, with the capacity of their facility when not set for the game"""
+    auto = schedule["schedule"]["auto_registration"]
+    slots = []
+    for name, entry in schedule["game"].items():
+        facility = schedule["facility"].get(entry["facility"], {})
+        try:
+            capacity = int(entry["capacity"])
+        except (ValueError, KeyError):
+            capacity = int(facility.get("capacity", 0))
+        slots.append(GameSlot(name, int(entry["day_of_week"]), entry["start"], entry["facility"], capacity,
+                              list(facility.get("capacity_options", [])), int(auto["registration_window_days_open"])))
+    return slots
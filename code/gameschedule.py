@@ -1,28 +1,27 @@
 """next game date helper"""
 import asyncio
 import pickle
+import sqlite3
 from datetime import datetime, timedelta
-from os import path
 from threading import Timer
 from kink import di
 from config import schedule, messages
 from gameevent import GameEvent
 from notifier import RegistrationNotifier
 from maineventloop import run_in_main_event_loop
+from storage import Storage
 
 class GameSchedule:
     """next game date helper class"""
     events: list[GameEvent]
 
-    def __init__(self, no_persistency: bool = False):
+    def __init__(self, storage: Storage = None):
         self.events = []
-        self.no_persistency = no_persistency
-        if not no_persistency:
-            self._path = path.join(".", "data")
+        self.storage = storage
+        if storage:
             try:
-                with open(path.join(self._path,'schedule.pickle'), 'rb') as f:
-                    self.events = pickle.load(f)
-            except (pickle.UnpicklingError, IOError) as e:
+                self.events = storage.load_schedule()
+            except (pickle.UnpicklingError, IOError, sqlite3.Error) as e:
                 print("load schedule failed: " + str(e))
         self.update_from_config(True)
         self._timer_update_schedule = Timer(86400, self.update_from_config)
@@ -102,9 +101,8 @@ class GameSchedule:
             self.save()
 
     def save(self):
-        if not self.no_persistency:
-            with open(path.join(self._path,'schedule.pickle'), 'wb') as f:
-                pickle.dump(self.events, f, pickle.HIGHEST_PROTOCOL)
+        if self.storage:
+            self.storage.save_schedule(self.events)
 
     def get_next_game(self, index: int) -> GameEvent:
         #not a pythonic way
@@ -1,53 +1,123 @@
 """historical info logic"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime
-import sqlite3
 from os import path
-import pickle
-from historyevent import RegistrationEvent, PastCompetitionSummary
+import sqlite3
+from typing import Callable
+from config import preferences
+from demandforecast import DemandForecast, GameSlot, SlotForecast
+from historyevent import RegistrationEvent, PastCompetitionSummary, UserStatistics, GameStatistics
+from historyquery import HistoryQuery
+from historyreplay import HistoryReplay, GameState
+from historywriter import HistoryWriter
 
 class History:
-    """class to store (and retrieve when needed) summary and details about game and user events"""
+    """class to store (and retrieve when needed) summary and details about game and user events;
+    queries wait for the events added so far, and run in the query thread, owning the read connection,
+    so the async callers do not block the event loop while the writer commits or archives"""
     summary:PastCompetitionSummary
 
     def __init__(self, no_persistency: bool = False):
+        self._writer = None
+        self._query = None
+        self._forecast = None
+        self._executor = None
         if not no_persistency:
             self._path = path.join(".", "data")
+            h = preferences["history"]
+            self._writer = HistoryWriter(path.join(self._path,'history.db'),
+                float(h["commit_latency_seconds"]), int(h["commit_batch_size"]),
+                int(h["archive_after_months"]), bool(h["vacuum_after_archive"]), float(h["maintenance_hours"]),
+                int(h["checkpoint_events"]))
+            self._query = HistoryQuery(path.join(self._path,'history.db'))
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-query")
+            self._forecast = DemandForecast(path.join(self._path,'history.db'))
             try:
-                with open(path.join(self._path,'summary.pickle'), 'rb') as f:
-                    self.summary = pickle.load(f)
-            except (pickle.UnpicklingError, IOError) as e:
+                self.summary = self._executor.submit(self._query.summary).result()
+            except sqlite3.Error as e:
                 print("load history summary failed: " + str(e))
+                self.summary = None
+            if not self.summary:
                 self.summary = PastCompetitionSummary(max_capacity = 0, date = datetime.min)
-            self._init_db()
         else:
             self.summary = PastCompetitionSummary(max_capacity = 13, date = datetime.now()) # for testing purposes
 
-    def __del__(self):
-        if self._conn:
-            self._conn.close()
-
-    def _init_db(self):
-        self._conn = sqlite3.connect(path.join(self._path,'history.db'))
-        try:
-            self._conn.execute('''CREATE TABLE REGISTRATION_EVENTS
-                (TIME INT PRIMARY KEY     NOT NULL,
-                USER_ID           INT     NULL,
-                GAME              INT     NULL,
-                LOCATION          TEXT    NULL,
-                ATTENDEES         INT     NULL,
-                REMAINING         INT     NULL,
-                EVENT             INT     NULL);''')
-        except sqlite3.OperationalError:
-            pass
-
     def add_event(self, event:RegistrationEvent):
-        if self._conn:
-            self._conn.execute(
-                "INSERT INTO REGISTRATION_EVENTS (TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT) VALUES (?,?,?,?,?,?,?)",
-                (event.time, event.user_id, event.game, event.location, event.attendees, event.remaining, event.event))
-            self._conn.commit()
+        if self._writer:
+            self._writer.put(event)
+
+    def flush(self):
+        """waits until all events added so far are stored"""
+        if self._writer:
+            self._writer.flush()
+
+    def close(self):
+        """stores all events added so far and stops the writer"""
+        if self._writer:
+            self._writer.close()
+        if self._executor:
+            self._executor.submit(self._query.close)
+            self._executor.shutdown()
+            self._executor = None
+        if self._forecast:
+            self._forecast.close()
+
+    def _reader(self, query: Callable[[HistoryQuery], object]) -> Callable[[], object]:
+        def read():
+            self.flush()
+            return query(self._query)
+        return read
+
+    def _read(self, query: Callable[[HistoryQuery], object]) -> object:
+        """runs the query in the query thread and waits for it; not for the event loop"""
+        return self._executor.submit(self._reader(query)).result()
+
+    async def _read_async(self, query: Callable[[HistoryQuery], object]) -> object:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._reader(query))
+
+    async def user_statistics(self, user_id: int) -> UserStatistics:
+        """statistics of the user, including the events added so far; None if the user has no events"""
+        if not self._query:
+            return None
+        return await self._read_async(lambda q: q.user_statistics(user_id))
+
+    async def game_statistics(self, game: datetime, location: str) -> GameStatistics:
+        if not self._query:
+            return None
+        return await self._read_async(lambda q: q.game_statistics(game, location))
+
+    async def recent_games(self, limit: int) -> list[GameStatistics]:
+        if not self._query:
+            return []
+        return await self._read_async(lambda q: q.recent_games(limit))
+
+    async def game_events(self, game: datetime, location: str) -> list[RegistrationEvent]:
+        """all events of the game, read from the archive partition if the game is out of the hot window"""
+        if not self._query:
+            return []
+        return await self._read_async(lambda q: q.game_events(game, location))
+
+    def replay(self, game: datetime, location: str) -> GameState:
+        """registrations of the game rebuilt from its events"""
+        if not self._query:
+            return None
+        return self._read(lambda q: HistoryReplay(q.connection(), q.db_path).replay(game, location))
+
+    def replay_upcoming(self) -> list[GameState]:
+        """registrations of the future games rebuilt from their events"""
+        if not self._query:
+            return []
+        return self._read(lambda q: HistoryReplay(q.connection(), q.db_path).upcoming())
+
+    async def forecast(self, slots: list[GameSlot]) -> list[SlotForecast]:
+        """demand forecast of the slots, computed in a worker process"""
+        if not self._forecast:
+            return []
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.flush)
+        return await self._forecast.run(slots)
 
     def save_summary(self):
-        if self._conn:
-            with open(path.join(self._path,'summary.pickle'), 'wb') as f:
-                pickle.dump(self.summary, f, pickle.HIGHEST_PROTOCOL)
+        if self._writer:
+            self._writer.put(replace(self.summary))
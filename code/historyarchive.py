@@ -0,0 +1,93 @@
+"""monthly archive partitions of the history database"""
+from datetime import datetime
+import logging
+from os import path, makedirs
+import sqlite3
+from historyevent import to_db
+
+class HistoryArchive:
+    """moves registration events older than the hot window out of history.db into one database file per month;
+    the rollup tables keep the aggregates of the moved events, so statistics do not need the archives"""
+
+    FOLDER = "history"
+
+    def __init__(self, conn: sqlite3.Connection, db_path: str, hot_months: int, vacuum: bool):
+        self.conn = conn
+        self.folder = HistoryArchive.folder_of(db_path)
+        self.hot_months = hot_months
+        self.vacuum = vacuum
+        self._logger = logging.getLogger("main")
+
+    @staticmethod
+    def folder_of(db_path: str) -> str:
+        return path.join(path.dirname(db_path), HistoryArchive.FOLDER)
+
+    @staticmethod
+    def file_name(month: str) -> str:
+        return "events-" + month + ".db"
+
+    @staticmethod
+    def month_bounds(month: str) -> (str, str):
+        """the first and the next after the last timestamps of the month 'YYYY-MM', as stored in the database"""
+        year, m = int(month[0:4]), int(month[5:7])
+        start = datetime(year, m, 1)
+        end = datetime(year + m // 12, m % 12 + 1, 1)
+        return to_db(start), to_db(end)
+
+    def boundary(self, now: datetime = None) -> str:
+        """events before the start of the oldest hot month are archived"""
+        now = now or datetime.now()
+        months = now.year * 12 + now.month - 1 - self.hot_months
+        return to_db(datetime(months // 12, months % 12 + 1, 1))
+
+    def run(self, now: datetime = None) -> int:
+        """archives every complete month out of the hot window, returns the number of moved events"""
+        if self.hot_months <= 0:
+            return 0
+        boundary = self.boundary(now)
+        months = [r[0] for r in self.conn.execute(
+            "SELECT DISTINCT SUBSTR(TIME,1,7) FROM REGISTRATION_EVENTS WHERE TIME<? ORDER BY 1", (boundary,))]
+        moved = sum(self._archive_month(month) for month in months)
+        if moved:
+            self._logger.info("history: %s events of %s month(s) archived", str(moved), str(len(months)))
+            if self.vacuum:
+                self.conn.execute("VACUUM")
+        return moved
+
+    def _archive_month(self, month: str) -> int:
+        makedirs(self.folder, exist_ok=True)
+        name = HistoryArchive.file_name(month)
+        start, end = HistoryArchive.month_bounds(month)
+        conn = self.conn
+        conn.execute("ATTACH DATABASE ? AS ARCHIVE", (path.join(self.folder, name),))
+        try:
+            #with WAL the transaction is atomic per database file only: the copy is idempotent by ID,
+            #so if the events were copied but not deleted, the next run completes the move
+            conn.execute("BEGIN")
+            try:
+                conn.execute('''CREATE TABLE IF NOT EXISTS ARCHIVE.REGISTRATION_EVENTS
+                    (ID         INTEGER PRIMARY KEY,
+                    TIME        TEXT    NOT NULL,
+                    USER_ID     INT     NULL,
+                    GAME        TEXT    NULL,
+                    LOCATION    TEXT    NULL,
+                    ATTENDEES   INT     NULL,
+                    REMAINING   INT     NULL,
+                    EVENT       INT     NULL,
+                    CAPACITY    INT     NULL);''')
+                conn.execute('''CREATE INDEX IF NOT EXISTS ARCHIVE.REGISTRATION_EVENTS_GAME
+                    ON REGISTRATION_EVENTS (GAME, LOCATION, TIME)''')
+                conn.execute('''INSERT OR IGNORE INTO ARCHIVE.REGISTRATION_EVENTS
+                    SELECT ID,TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY
+                    FROM main.REGISTRATION_EVENTS WHERE TIME>=? AND TIME<?''', (start, end))
+                moved = conn.execute("DELETE FROM main.REGISTRATION_EVENTS WHERE TIME>=? AND TIME<?", (start, end)).rowcount
+                conn.execute('''INSERT OR REPLACE INTO ARCHIVE_PARTITIONS (MONTH,FILE,EVENTS,FIRST_GAME,LAST_GAME,ARCHIVED)
+                    SELECT ?, ?, COUNT(*), MIN(GAME), MAX(GAME), ? FROM ARCHIVE.REGISTRATION_EVENTS''',
+                    (month, name, to_db(datetime.now())))
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE ARCHIVE")
+        return moved
@@ -1,6 +1,15 @@
 """history events"""
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+
+def to_db(value: datetime) -> str:
+    """timestamps are kept in the history database as fixed width ISO strings, so they compare and sort as text"""
+    return value.isoformat(sep=' ', timespec='microseconds') if value is not None else None
+
+def from_db(value) -> datetime:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
 
 @dataclass
 class RegistrationEvent:
@@ -12,6 +21,7 @@ class RegistrationEvent:
     attendees: int  #1 - only this user, 2 - user and one guest, etc
     remaining: int  #if 2 attendees were registered and then 1 was de-registered, 1 will remain
     event:     int  #1 - registered, 2 - unregistered, etc
+    capacity:  int = None   #maximum number of players of the game at the moment of the event
 
     REGISTER = 1
     UNREGISTER = 2
@@ -20,6 +30,7 @@ class RegistrationEvent:
     REGISTER_SPARE = 5
     UNREGISTER_SPARE = 6
     UPDATE_ATTENDEES_SPARE = 7
+    DEMOTE = 8
 
 @dataclass
 class PastCompetitionSummary:
@@ -27,3 +38,41 @@ class PastCompetitionSummary:
     max_capacity: int
     date: datetime
 
+
+@dataclass
+class UserStatistics:
+    """registration statistics of a user"""
+    user_id: int
+    games: int              #games the user registered for, main list or spare
+    attended: int           #past games the user remained in the main list of
+    guest_games: int        #past games the user attended with guests
+    registrations: int
+    cancellations: int
+    late_cancellations: int #deregistrations from the main list in the day of the game
+
+    @property
+    def late_cancel_rate(self) -> float:
+        return self.late_cancellations / self.games if self.games else 0.0
+
+    @property
+    def guest_frequency(self) -> float:
+        return self.guest_games / self.attended if self.attended else 0.0
+
+@dataclass
+class GameStatistics:
+    """registration statistics of a game"""
+    game: datetime
+    location: str
+    capacity: int
+    attendees: int
+    spare_attendees: int
+    first_registration: datetime
+    full_time: datetime     #None if the game has never been full
+
+    @property
+    def fill_rate(self) -> float:
+        return self.attendees / self.capacity if self.capacity else 0.0
+
+    @property
+    def time_to_full(self) -> timedelta:
+        return self.full_time - self.first_registration if self.full_time else None
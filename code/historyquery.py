@@ -0,0 +1,120 @@
+"""read side of the history database"""
+from datetime import datetime
+from os import path
+import sqlite3
+from typing import Iterator
+from historyarchive import HistoryArchive
+from historyevent import RegistrationEvent, UserStatistics, GameStatistics, PastCompetitionSummary, to_db, from_db
+
+class HistoryQuery:
+    """queries over the history database: events are looked up by the indexes on user, game and location,
+    statistics are read from the rollup tables; only the events of the hot window are in history.db,
+    older ones are read from the archive partitions when asked for explicitly.
+    The connection is used only in the thread that created it"""
+
+    _EVENT_COLUMNS = "TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn = None
+
+    def connection(self) -> sqlite3.Connection:
+        """read-only connection, opened on the first use"""
+        if not self._conn:
+            self._conn = sqlite3.connect("file:" + self.db_path + "?mode=ro", uri=True)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _event(row) -> RegistrationEvent:
+        return RegistrationEvent(from_db(row[0]), row[1], from_db(row[2]), row[3], row[4], row[5], row[6], row[7])
+
+    def user_events(self, user_id: int, limit: int = 100) -> list[RegistrationEvent]:
+        """the latest events of the user within the hot window, newest first"""
+        rows = self.connection().execute("SELECT " + HistoryQuery._EVENT_COLUMNS +
+            " FROM REGISTRATION_EVENTS WHERE USER_ID=? ORDER BY TIME DESC LIMIT ?", (user_id, limit))
+        return [HistoryQuery._event(r) for r in rows]
+
+    def game_events(self, game: datetime, location: str) -> list[RegistrationEvent]:
+        """events of the game, from history.db and the archive partitions having events of the game"""
+        return [HistoryQuery._event(r[1:]) for r in game_rows(self.connection(), self.db_path, to_db(game), location)]
+
+    def location_games(self, location: str) -> list[datetime]:
+        rows = self.connection().execute(
+            "SELECT DISTINCT GAME FROM REGISTRATION_EVENTS WHERE LOCATION=? ORDER BY GAME", (location,))
+        return [from_db(r[0]) for r in rows]
+
+    def user_statistics(self, user_id: int, now: datetime = None) -> UserStatistics:
+        now = now or datetime.now()
+        conn = self.connection()
+        totals = conn.execute(
+            "SELECT REGISTRATIONS,CANCELLATIONS,LATE_CANCELLATIONS FROM USER_STATS WHERE USER_ID=?", (user_id,)).fetchone()
+        if not totals:
+            return None
+        games, attended, guest_games = conn.execute(
+            '''SELECT COUNT(*), COALESCE(SUM(GAME<? AND SPARE=0 AND ATTENDEES>0),0), COALESCE(SUM(GAME<? AND SPARE=0 AND ATTENDEES>1),0)
+            FROM USER_GAMES WHERE USER_ID=?''', (to_db(now), to_db(now), user_id)).fetchone()
+        return UserStatistics(user_id, games, attended, guest_games, *totals)
+
+    @staticmethod
+    def _game(row) -> GameStatistics:
+        return GameStatistics(from_db(row[0]), row[1], row[2], row[3], row[4], from_db(row[5]), from_db(row[6]))
+
+    def game_statistics(self, game: datetime, location: str) -> GameStatistics:
+        row = self.connection().execute(
+            '''SELECT GAME,LOCATION,CAPACITY,ATTENDEES,SPARE_ATTENDEES,FIRST_EVENT,FULL_TIME FROM GAME_STATS
+            WHERE GAME=? AND LOCATION=?''', (to_db(game), location if location else '')).fetchone()
+        return HistoryQuery._game(row) if row else None
+
+    def recent_games(self, limit: int = 10, now: datetime = None) -> list[GameStatistics]:
+        """statistics of the latest past games, newest first"""
+        rows = self.connection().execute(
+            '''SELECT GAME,LOCATION,CAPACITY,ATTENDEES,SPARE_ATTENDEES,FIRST_EVENT,FULL_TIME FROM GAME_STATS
+            WHERE GAME<? ORDER BY GAME DESC LIMIT ?''', (to_db(now or datetime.now()), limit))
+        return [HistoryQuery._game(r) for r in rows]
+
+    def summary(self) -> PastCompetitionSummary:
+        row = self.connection().execute("SELECT MAX_CAPACITY,DATE FROM SUMMARY WHERE ID=1").fetchone()
+        return PastCompetitionSummary(row[0], from_db(row[1])) if row else None
+
+def iter_events(db_path: str, after_id: int = 0, chunk: int = 5000) -> Iterator[tuple]:
+    """rows (ID,TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY) of the events with ID greater than after_id,
+    from the archive partitions and then from history.db; fetched in chunks, so the memory use does not depend on the history size"""
+    conn = sqlite3.connect("file:" + db_path + "?mode=ro", uri=True)
+    try:
+        files = [path.join(HistoryArchive.folder_of(db_path), r[0])
+                 for r in conn.execute("SELECT FILE FROM ARCHIVE_PARTITIONS ORDER BY MONTH")]
+        for db in files + [None]:
+            source = sqlite3.connect("file:" + db + "?mode=ro", uri=True) if db else conn
+            try:
+                cursor = source.execute('''SELECT ID,TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY
+                    FROM REGISTRATION_EVENTS WHERE ID>? ORDER BY ID''', (after_id,))
+                while rows := cursor.fetchmany(chunk):
+                    yield from rows
+            finally:
+                if db:
+                    source.close()
+    finally:
+        conn.close()
+
+def game_rows(conn: sqlite3.Connection, db_path: str, game: str, location: str, after_id: int = 0) -> list[tuple]:
+    """rows (ID,TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY) of the game events with ID greater than after_id,
+    ordered by ID; the archive partitions having events of the game are opened read-only for the lookup"""
+    query = '''SELECT ID,TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY
+        FROM REGISTRATION_EVENTS WHERE GAME=? AND LOCATION IS ? AND ID>? ORDER BY ID'''
+    key = (game, location, after_id)
+    rows = []
+    partitions = conn.execute(
+        "SELECT FILE FROM ARCHIVE_PARTITIONS WHERE FIRST_GAME<=? AND LAST_GAME>=? ORDER BY MONTH", (game, game)).fetchall()
+    for (name,) in partitions:
+        archive = sqlite3.connect("file:" + path.join(HistoryArchive.folder_of(db_path), name) + "?mode=ro", uri=True)
+        try:
+            rows += archive.execute(query, key).fetchall()
+        finally:
+            archive.close()
+    rows += conn.execute(query, key).fetchall()
+    return rows
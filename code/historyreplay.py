@@ -0,0 +1,116 @@
+"""reconstruction of the game registrations from the history events"""
+from dataclasses import dataclass, field
+from datetime import datetime
+import json
+import sqlite3
+from historyevent import RegistrationEvent, to_db, from_db
+from historyquery import game_rows
+
+@dataclass
+class GameState:
+    """registrations of a game as folded from its events: user id to participants, in the list order"""
+    game: datetime
+    location: str
+    capacity_max: int = None
+    players: dict[int, int] = field(default_factory=dict)
+    spare_players: dict[int, int] = field(default_factory=dict)
+    last_id: int = 0        #ID of the last event folded in
+    demoted: int = 0        #length of the current run of demotions, they go to the head of the queue in their order
+
+    @property
+    def capacity(self) -> int:
+        return sum(self.players.values())
+
+    @property
+    def capacity_spare(self) -> int:
+        return sum(self.spare_players.values())
+
+    def apply(self, event_id: int, user_id: int, remaining: int, code: int, capacity: int) -> None:
+        """folds one event in, as Competition changed its lists when the event was reported"""
+        self.last_id = event_id
+        if capacity is not None:
+            self.capacity_max = capacity
+        remaining = max(remaining or 0, 0)
+        if code != RegistrationEvent.DEMOTE:
+            self.demoted = 0
+        match code:
+            case RegistrationEvent.REGISTER | RegistrationEvent.UPDATE_ATTENDEES | RegistrationEvent.UNREGISTER:
+                GameState._set(self.players, user_id, remaining)
+            case RegistrationEvent.PROMOTE:
+                self.spare_players.pop(user_id, None)
+                GameState._set(self.players, user_id, remaining)
+            case RegistrationEvent.DEMOTE:
+                self.players.pop(user_id, None)
+                self.spare_players.pop(user_id, None)
+                queue = list(self.spare_players.items())
+                queue.insert(self.demoted, (user_id, remaining))
+                self.spare_players = dict(queue)
+                self.demoted += 1
+            case RegistrationEvent.REGISTER_SPARE | RegistrationEvent.UPDATE_ATTENDEES_SPARE | RegistrationEvent.UNREGISTER_SPARE:
+                GameState._set(self.spare_players, user_id, remaining)
+
+    @staticmethod
+    def _set(players: dict[int, int], user_id: int, participants: int) -> None:
+        if participants > 0:
+            players[user_id] = participants
+        else:
+            players.pop(user_id, None)
+
+    def to_json(self) -> str:
+        return json.dumps({'capacity_max': self.capacity_max, 'players': list(self.players.items()),
+                           'spare_players': list(self.spare_players.items()), 'demoted': self.demoted})
+
+    @staticmethod
+    def from_json(game: datetime, location: str, last_id: int, value: str) -> 'GameState':
+        state = json.loads(value)
+        return GameState(game, location, state['capacity_max'], {u: n for u, n in state['players']},
+                         {u: n for u, n in state['spare_players']}, last_id, state['demoted'])
+
+class HistoryReplay:
+    """rebuilds the players, spare players and capacity of games by folding their events in the ID order;
+    the folded state is checkpointed into REPLAY_CHECKPOINTS, so a replay reads only the events after the checkpoint"""
+
+    def __init__(self, conn: sqlite3.Connection, db_path: str):
+        self.conn = conn
+        self.db_path = db_path
+
+    def replay(self, game: datetime, location: str) -> GameState:
+        """the state of the game after all its stored events"""
+        key = (to_db(game), location if location else '')
+        row = self.conn.execute("SELECT LAST_ID,STATE FROM REPLAY_CHECKPOINTS WHERE GAME=? AND LOCATION=?", key).fetchone()
+        state = GameState.from_json(game, location, row[0], row[1]) if row else GameState(game, location)
+        for r in game_rows(self.conn, self.db_path, key[0], location, state.last_id):
+            state.apply(r[0], r[2], r[6], r[7], r[8])
+        return state
+
+    def upcoming(self, now: datetime = None) -> list[GameState]:
+        """the states of the games after now having registered players"""
+        games = self.conn.execute("SELECT GAME,LOCATION FROM GAME_STATS WHERE GAME>? ORDER BY GAME",
+                                  (to_db(now or datetime.now()),)).fetchall()
+        states = [self.replay(from_db(game), location if location else None) for game, location in games]
+        return [s for s in states if s.players or s.spare_players]
+
+    def checkpoint(self, game: datetime, location: str) -> GameState:
+        """stores the current state of the game; the caller owns the transaction"""
+        state = self.replay(game, location)
+        self.conn.execute("INSERT OR REPLACE INTO REPLAY_CHECKPOINTS (GAME,LOCATION,LAST_ID,STATE) VALUES (?,?,?,?)",
+                          (to_db(game), location if location else '', state.last_id, state.to_json()))
+        return state
+
+    def events_since_checkpoint(self, game: datetime, location: str) -> int:
+        row = self.conn.execute("SELECT LAST_ID FROM REPLAY_CHECKPOINTS WHERE GAME=? AND LOCATION=?",
+                                (to_db(game), location if location else '')).fetchone()
+        return self.conn.execute("SELECT COUNT(*) FROM REGISTRATION_EVENTS WHERE GAME=? AND LOCATION IS ? AND ID>?",
+                                 (to_db(game), location, row[0] if row else 0)).fetchone()[0]
+
+    @staticmethod
+    def compare(state: GameState, players: list[tuple[int, int]], spare_players: list[tuple[int, int]], capacity: int) -> list[str]:
+        """differences between the replayed state and the lists of (user id, participants) kept by the competition"""
+        result = []
+        if list(state.players.items()) != players:
+            result.append("players %s, history %s" % (str(players), str(list(state.players.items()))))
+        if list(state.spare_players.items()) != spare_players:
+            result.append("spare players %s, history %s" % (str(spare_players), str(list(state.spare_players.items()))))
+        if state.capacity != capacity:
+            result.append("capacity %s, history %s" % (str(capacity), str(state.capacity)))
+        return result
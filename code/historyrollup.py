@@ -0,0 +1,96 @@
+"""rollup tables of the history database, maintained incrementally with every written event"""
+import sqlite3
+from historyevent import RegistrationEvent, to_db
+
+class HistoryRollup:
+    """keeps per user and per game aggregates next to REGISTRATION_EVENTS, so statistics queries
+    do not scan the events; applied in the same transaction as the events they are built from"""
+
+    TABLES = ('USER_STATS', 'USER_GAMES', 'GAME_STATS')
+
+    #event code: (sign of the main list change, sign of the spare list change, player is spare after the event)
+    EFFECTS = {
+        RegistrationEvent.REGISTER: (1, 0, False),
+        RegistrationEvent.UPDATE_ATTENDEES: (1, 0, False),
+        RegistrationEvent.UNREGISTER: (-1, 0, False),
+        RegistrationEvent.PROMOTE: (1, -1, False),
+        RegistrationEvent.DEMOTE: (-1, 1, True),
+        RegistrationEvent.REGISTER_SPARE: (0, 1, True),
+        RegistrationEvent.UPDATE_ATTENDEES_SPARE: (0, 1, True),
+        RegistrationEvent.UNREGISTER_SPARE: (0, -1, True),
+    }
+
+    _UPSERT_USER = '''INSERT INTO USER_STATS (USER_ID,REGISTRATIONS,CANCELLATIONS,LATE_CANCELLATIONS,LAST_EVENT)
+        VALUES (?,?,?,?,?) ON CONFLICT(USER_ID) DO UPDATE SET
+        REGISTRATIONS=REGISTRATIONS+excluded.REGISTRATIONS,
+        CANCELLATIONS=CANCELLATIONS+excluded.CANCELLATIONS,
+        LATE_CANCELLATIONS=LATE_CANCELLATIONS+excluded.LATE_CANCELLATIONS,
+        LAST_EVENT=excluded.LAST_EVENT'''
+
+    _UPSERT_USER_GAME = '''INSERT INTO USER_GAMES (USER_ID,GAME,LOCATION,ATTENDEES,SPARE) VALUES (?,?,?,?,?)
+        ON CONFLICT(USER_ID,GAME,LOCATION) DO UPDATE SET ATTENDEES=excluded.ATTENDEES, SPARE=excluded.SPARE'''
+
+    _UPSERT_GAME = '''INSERT INTO GAME_STATS (GAME,LOCATION,CAPACITY,ATTENDEES,SPARE_ATTENDEES,PEAK_ATTENDEES,FIRST_EVENT,FULL_TIME)
+        VALUES (?,?,?,?,?,?,?,?) ON CONFLICT(GAME,LOCATION) DO UPDATE SET
+        CAPACITY=COALESCE(excluded.CAPACITY,CAPACITY),
+        ATTENDEES=ATTENDEES+excluded.ATTENDEES,
+        SPARE_ATTENDEES=SPARE_ATTENDEES+excluded.SPARE_ATTENDEES,
+        PEAK_ATTENDEES=MAX(PEAK_ATTENDEES,ATTENDEES+excluded.ATTENDEES),
+        FULL_TIME=COALESCE(FULL_TIME, CASE WHEN ATTENDEES+excluded.ATTENDEES >= COALESCE(excluded.CAPACITY,CAPACITY)
+            THEN excluded.FIRST_EVENT END)'''
+
+    @staticmethod
+    def apply(conn: sqlite3.Connection, events: list[RegistrationEvent]) -> None:
+        """adds the events into the rollups; the caller owns the transaction"""
+        users, user_games, games = [], [], []
+        for e in events:
+            effect = HistoryRollup.EFFECTS.get(e.event, None)
+            if not effect or e.game is None or e.user_id is None:
+                continue
+            main, spare, is_spare = effect
+            location = e.location if e.location else ''
+            game, event_time = to_db(e.game), to_db(e.time)
+            cancelled = e.event in (RegistrationEvent.UNREGISTER, RegistrationEvent.UNREGISTER_SPARE)
+            #deregistration from the main list in the day of the game, see [admin] user_deregistered_in_the_day
+            late = e.event == RegistrationEvent.UNREGISTER and e.time.date() == e.game.date()
+            registered = e.event in (RegistrationEvent.REGISTER, RegistrationEvent.REGISTER_SPARE)
+            users.append((e.user_id, int(registered), int(cancelled), int(late), event_time))
+            user_games.append((e.user_id, game, location, max(e.remaining, 0), int(is_spare)))
+            attendees = main * e.attendees
+            full_time = event_time if e.capacity and attendees >= e.capacity else None
+            games.append((game, location, e.capacity, attendees, spare * e.attendees, max(attendees, 0), event_time, full_time))
+        #the tables are independent, so each one gets its rows in one call, keeping the order of the events
+        conn.executemany(HistoryRollup._UPSERT_USER, users)
+        conn.executemany(HistoryRollup._UPSERT_USER_GAME, user_games)
+        conn.executemany(HistoryRollup._UPSERT_GAME, games)
+
+    @staticmethod
+    def rebuild(conn: sqlite3.Connection) -> None:
+        """fills the rollups from the events already stored, as if they were applied one by one"""
+        for table in HistoryRollup.TABLES:
+            conn.execute("DELETE FROM " + table)
+        events = '''SELECT ID, TIME, USER_ID, GAME, COALESCE(LOCATION,'') AS L, ATTENDEES, REMAINING, EVENT, CAPACITY FROM REGISTRATION_EVENTS
+            WHERE USER_ID IS NOT NULL AND GAME IS NOT NULL AND EVENT BETWEEN 1 AND 8'''
+        conn.execute('''INSERT INTO USER_STATS (USER_ID,REGISTRATIONS,CANCELLATIONS,LATE_CANCELLATIONS,LAST_EVENT)
+            SELECT USER_ID, SUM(EVENT IN (1,5)), SUM(EVENT IN (2,6)), SUM(EVENT=2 AND DATE(TIME)=DATE(GAME)), MAX(TIME)
+            FROM (''' + events + ''') GROUP BY USER_ID''')
+        conn.execute('''INSERT INTO USER_GAMES (USER_ID,GAME,LOCATION,ATTENDEES,SPARE)
+            SELECT USER_ID, GAME, L, MAX(REMAINING,0), EVENT IN (5,6,7,8) FROM
+            (SELECT USER_ID, GAME, L, REMAINING, EVENT, ROW_NUMBER() OVER (PARTITION BY USER_ID,GAME,L ORDER BY ID DESC) AS N FROM (''' + events + '''))
+            WHERE N=1''')
+        #the capacity in effect at an event is the latest one reported so far: events are grouped by the number
+        #of reported capacities up to them, so every group starts with its capacity (the first group may have none)
+        conn.execute('''INSERT INTO GAME_STATS (GAME,LOCATION,CAPACITY,ATTENDEES,SPARE_ATTENDEES,PEAK_ATTENDEES,FIRST_EVENT,FULL_TIME)
+            SELECT GAME, L, MAX(CASE WHEN CAPACITY_GROUP=LAST_GROUP THEN CAPACITY END), SUM(MAIN), SUM(SPARE),
+            MAX(MAX(RUNNING),0), MIN(TIME), MIN(CASE WHEN RUNNING>=CURRENT_CAPACITY THEN TIME END) FROM
+            (SELECT GAME, L, TIME, CAPACITY, MAIN, SPARE, CAPACITY_GROUP, RUNNING,
+                MAX(CAPACITY) OVER (PARTITION BY GAME,L,CAPACITY_GROUP) AS CURRENT_CAPACITY,
+                MAX(CAPACITY_GROUP) OVER (PARTITION BY GAME,L) AS LAST_GROUP FROM
+                (SELECT GAME, L, TIME, CAPACITY, MAIN, SPARE,
+                    COUNT(CAPACITY) OVER W AS CAPACITY_GROUP, SUM(MAIN) OVER W AS RUNNING FROM
+                    (SELECT ID, GAME, L, TIME, CAPACITY,
+                    CASE WHEN EVENT IN (1,3,4) THEN ATTENDEES WHEN EVENT IN (2,8) THEN -ATTENDEES ELSE 0 END AS MAIN,
+                    CASE WHEN EVENT IN (5,7,8) THEN ATTENDEES WHEN EVENT IN (4,6) THEN -ATTENDEES ELSE 0 END AS SPARE
+                    FROM (''' + events + '''))
+                WINDOW W AS (PARTITION BY GAME,L ORDER BY ID)))
+            GROUP BY GAME, L''')
@@ -0,0 +1,154 @@
+"""versioned schema of the history database"""
+from datetime import datetime
+import logging
+from os import path
+import pickle
+import sqlite3
+import time
+from historyevent import to_db
+from historyrollup import HistoryRollup
+
+class HistorySchema:
+    """brings history.db to the current schema version, one migration at a time;
+    the version is kept in the SCHEMA_VERSION table, a database without it is either empty (version 0)
+    or has the REGISTRATION_EVENTS table created before versioning (version 1)"""
+
+    VERSION = 4
+    CHUNK = 5000
+
+    def __init__(self, conn: sqlite3.Connection, data_path: str = None):
+        self.conn = conn
+        self.data_path = data_path
+        self._logger = logging.getLogger("main")
+
+    def _tables(self) -> set:
+        return {r[0] for r in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+    def version(self) -> int:
+        tables = self._tables()
+        if 'SCHEMA_VERSION' in tables:
+            row = self.conn.execute("SELECT MAX(VERSION) FROM SCHEMA_VERSION").fetchone()
+            return row[0] if row and row[0] is not None else 0
+        return 1 if 'REGISTRATION_EVENTS' in tables else 0
+
+    def upgrade(self) -> None:
+        """applies the missing migrations, each one in its own transaction"""
+        migrations = {1: self._create_v1, 2: self._migrate_v2, 3: self._migrate_v3, 4: self._migrate_v4}
+        current = self.version()
+        for v in range(current + 1, HistorySchema.VERSION + 1):
+            started = time.monotonic()
+            self.conn.execute("BEGIN")
+            try:
+                migrations[v]()
+                self.conn.execute("CREATE TABLE IF NOT EXISTS SCHEMA_VERSION (VERSION INT NOT NULL, APPLIED TEXT NOT NULL)")
+                self.conn.execute("INSERT INTO SCHEMA_VERSION (VERSION, APPLIED) VALUES (?,?)", (v, to_db(datetime.now())))
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+            if current:
+                self._logger.info("history.db upgraded to version %s in %.1f seconds", str(v), time.monotonic() - started)
+
+    def _create_v1(self) -> None:
+        """the layout used before versioning"""
+        self.conn.execute('''CREATE TABLE REGISTRATION_EVENTS
+            (TIME INT PRIMARY KEY     NOT NULL,
+            USER_ID           INT     NULL,
+            GAME              INT     NULL,
+            LOCATION          TEXT    NULL,
+            ATTENDEES         INT     NULL,
+            REMAINING         INT     NULL,
+            EVENT             INT     NULL,
+            CAPACITY          INT     NULL);''')
+
+    def _migrate_v2(self) -> None:
+        """autoincrement key instead of the time, which clashed for simultaneous events; timestamps as fixed width
+        ISO strings; covering indexes; rollup tables. Rows are copied in chunks, and the rollups are rebuilt"""
+        conn = self.conn
+        for index in ('REGISTRATION_EVENTS_USER_ID', 'REGISTRATION_EVENTS_GAME', 'REGISTRATION_EVENTS_LOCATION'):
+            conn.execute("DROP INDEX IF EXISTS " + index)
+        for table in HistoryRollup.TABLES:
+            conn.execute("DROP TABLE IF EXISTS " + table)
+        conn.execute("ALTER TABLE REGISTRATION_EVENTS RENAME TO REGISTRATION_EVENTS_V1")
+        conn.execute('''CREATE TABLE REGISTRATION_EVENTS
+            (ID         INTEGER PRIMARY KEY AUTOINCREMENT,
+            TIME        TEXT    NOT NULL,
+            USER_ID     INT     NULL,
+            GAME        TEXT    NULL,
+            LOCATION    TEXT    NULL,
+            ATTENDEES   INT     NULL,
+            REMAINING   INT     NULL,
+            EVENT       INT     NULL,
+            CAPACITY    INT     NULL);''')
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(REGISTRATION_EVENTS_V1)")}
+        capacity = "CAPACITY" if "CAPACITY" in columns else "NULL"
+        #timestamps were stored by str(datetime), which omits zero microseconds; the rows are copied by ranges of rowid,
+        #inside the database, so the memory use does not depend on the table size
+        last = conn.execute("SELECT MAX(rowid) FROM REGISTRATION_EVENTS_V1").fetchone()[0] or 0
+        for start in range(0, last, HistorySchema.CHUNK):
+            conn.execute('''INSERT INTO REGISTRATION_EVENTS (TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY)
+                SELECT CASE WHEN LENGTH(TIME)=19 THEN TIME||'.000000' ELSE TIME END, USER_ID,
+                CASE WHEN LENGTH(GAME)=19 THEN GAME||'.000000' ELSE GAME END, LOCATION,ATTENDEES,REMAINING,EVENT,''' + capacity + '''
+                FROM REGISTRATION_EVENTS_V1 WHERE rowid>? AND rowid<=? ORDER BY rowid''', (start, start + HistorySchema.CHUNK))
+        conn.execute("DROP TABLE REGISTRATION_EVENTS_V1")
+        conn.execute("CREATE INDEX REGISTRATION_EVENTS_TIME ON REGISTRATION_EVENTS (TIME)")
+        conn.execute("CREATE INDEX REGISTRATION_EVENTS_USER_ID ON REGISTRATION_EVENTS (USER_ID, TIME, EVENT, ATTENDEES, REMAINING)")
+        conn.execute("CREATE INDEX REGISTRATION_EVENTS_GAME ON REGISTRATION_EVENTS (GAME, LOCATION, TIME)")
+        conn.execute("CREATE INDEX REGISTRATION_EVENTS_LOCATION ON REGISTRATION_EVENTS (LOCATION, GAME)")
+        conn.execute('''CREATE TABLE USER_STATS
+            (USER_ID            INT     PRIMARY KEY NOT NULL,
+            REGISTRATIONS       INT     NOT NULL DEFAULT 0,
+            CANCELLATIONS       INT     NOT NULL DEFAULT 0,
+            LATE_CANCELLATIONS  INT     NOT NULL DEFAULT 0,
+            LAST_EVENT          TEXT    NULL);''')
+        conn.execute('''CREATE TABLE USER_GAMES
+            (USER_ID            INT     NOT NULL,
+            GAME                TEXT    NOT NULL,
+            LOCATION            TEXT    NOT NULL,
+            ATTENDEES           INT     NOT NULL,
+            SPARE               INT     NOT NULL,
+            PRIMARY KEY (USER_ID, GAME, LOCATION)) WITHOUT ROWID;''')
+        conn.execute('''CREATE TABLE GAME_STATS
+            (GAME               TEXT    NOT NULL,
+            LOCATION            TEXT    NOT NULL,
+            CAPACITY            INT     NULL,
+            ATTENDEES           INT     NOT NULL DEFAULT 0,
+            SPARE_ATTENDEES     INT     NOT NULL DEFAULT 0,
+            PEAK_ATTENDEES      INT     NOT NULL DEFAULT 0,
+            FIRST_EVENT         TEXT    NOT NULL,
+            FULL_TIME           TEXT    NULL,
+            PRIMARY KEY (GAME, LOCATION)) WITHOUT ROWID;''')
+        HistoryRollup.rebuild(conn)
+
+    def _migrate_v3(self) -> None:
+        """registry of the monthly archive partitions, and the past competition summary kept before in summary.pickle"""
+        self.conn.execute('''CREATE TABLE ARCHIVE_PARTITIONS
+            (MONTH      TEXT    PRIMARY KEY NOT NULL,
+            FILE        TEXT    NOT NULL,
+            EVENTS      INT     NOT NULL,
+            FIRST_GAME  TEXT    NULL,
+            LAST_GAME   TEXT    NULL,
+            ARCHIVED    TEXT    NOT NULL);''')
+        self.conn.execute('''CREATE TABLE SUMMARY
+            (ID             INTEGER PRIMARY KEY CHECK (ID=1),
+            MAX_CAPACITY    INT     NOT NULL,
+            DATE            TEXT    NULL);''')
+        if self.data_path:
+            try:
+                with open(path.join(self.data_path, 'summary.pickle'), 'rb') as f:
+                    summary = pickle.load(f)
+                self.conn.execute("INSERT INTO SUMMARY (ID,MAX_CAPACITY,DATE) VALUES (1,?,?)",
+                                  (summary.max_capacity, to_db(summary.date)))
+            except FileNotFoundError:
+                pass
+            except (pickle.UnpicklingError, IOError, AttributeError) as e:
+                self._logger.error("history summary was not imported: %s", str(e))
+
+    def _migrate_v4(self) -> None:
+        """checkpoints of the game states folded from the events, see HistoryReplay"""
+        self.conn.execute('''CREATE TABLE REPLAY_CHECKPOINTS
+            (GAME       TEXT    NOT NULL,
+            LOCATION    TEXT    NOT NULL,
+            LAST_ID     INT     NOT NULL,
+            STATE       TEXT    NOT NULL,
+            PRIMARY KEY (GAME, LOCATION)) WITHOUT ROWID;''')
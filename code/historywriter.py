@@ -0,0 +1,142 @@
+"""group-commit writer of history events"""
+import logging
+from os import path
+import queue
+import sqlite3
+import threading
+import time
+from historyarchive import HistoryArchive
+from historyevent import RegistrationEvent, PastCompetitionSummary, to_db
+from historyreplay import HistoryReplay
+from historyrollup import HistoryRollup
+from historyschema import HistorySchema
+
+class HistoryWriter:
+    """writes registration events from a dedicated thread: events are queued by the event loop,
+    and the thread commits them in batches, at most max_latency seconds after the first queued one;
+    between the batches, every maintenance_hours the thread moves old events into the monthly archives;
+    a game gets its replay checkpoint after every checkpoint_events events of it"""
+    _STOP = object()
+    _INSERT = "INSERT INTO REGISTRATION_EVENTS (TIME,USER_ID,GAME,LOCATION,ATTENDEES,REMAINING,EVENT,CAPACITY) VALUES (?,?,?,?,?,?,?,?)"
+
+    def __init__(self, db_path: str, max_latency: float, batch_size: int,
+                 archive_months: int = 0, vacuum: bool = False, maintenance_hours: float = 24, checkpoint_events: int = 0):
+        self.db_path = db_path
+        self.max_latency = max_latency
+        self.batch_size = batch_size
+        self.archive_months = archive_months
+        self.vacuum = vacuum
+        self.maintenance_interval = maintenance_hours * 3600
+        self.checkpoint_events = checkpoint_events
+        self._since_checkpoint = {}     #(game, location): events stored after the checkpoint of the game
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._logger = logging.getLogger("main")
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def put(self, item: RegistrationEvent | PastCompetitionSummary) -> None:
+        self._queue.put(item)
+
+    def flush(self) -> None:
+        """waits until every event queued so far is committed"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """commits the queued events and stops the thread"""
+        if self._thread:
+            self._queue.put(HistoryWriter._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        HistorySchema(conn, path.dirname(self.db_path)).upgrade()
+        return conn
+
+    def _run(self) -> None:
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            self._logger.error("history database cannot be opened, events will not be stored: %s", str(e))
+            conn = None
+        self._ready.set()
+        archive = HistoryArchive(conn, self.db_path, self.archive_months, self.vacuum) if conn and self.archive_months > 0 else None
+        next_maintenance = time.monotonic()
+        stop = False
+        while not stop:
+            try:
+                if archive:
+                    batch = [self._queue.get(timeout=max(next_maintenance - time.monotonic(), 0))]
+                else:
+                    batch = [self._queue.get()]
+            except queue.Empty:
+                try:
+                    archive.run()
+                except (sqlite3.Error, OSError) as e:
+                    self._logger.error("history archiving failed: %s", str(e))
+                next_maintenance = time.monotonic() + self.maintenance_interval
+                continue
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.batch_size and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            events = [e for e in batch if e is not HistoryWriter._STOP]
+            stop = len(events) != len(batch)
+            if stop:
+                #drain everything queued before the stop request
+                while True:
+                    try:
+                        e = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(e)
+                    if e is not HistoryWriter._STOP:
+                        events.append(e)
+            try:
+                if conn:
+                    self._write(conn, events)
+            except sqlite3.Error as e:
+                self._logger.error("history writer failed to store %s items: %s", str(len(events)), str(e))
+            for _ in batch:
+                self._queue.task_done()
+        if conn:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, items: list) -> None:
+        events = [e for e in items if isinstance(e, RegistrationEvent)]
+        summaries = [s for s in items if isinstance(s, PastCompetitionSummary)]
+        if not events and not summaries:
+            return
+        with conn:
+            conn.executemany(HistoryWriter._INSERT,
+                [(to_db(e.time), e.user_id, to_db(e.game), e.location, e.attendees, e.remaining, e.event, e.capacity) for e in events])
+            HistoryRollup.apply(conn, events)
+            if self.checkpoint_events > 0:
+                self._checkpoint(conn, events)
+            if summaries:
+                conn.execute("INSERT OR REPLACE INTO SUMMARY (ID,MAX_CAPACITY,DATE) VALUES (1,?,?)",
+                             (summaries[-1].max_capacity, to_db(summaries[-1].date)))
+        self.commits += 1
+
+    def _checkpoint(self, conn: sqlite3.Connection, events: list[RegistrationEvent]) -> None:
+        """checkpoints the games having checkpoint_events events or more since their previous checkpoint"""
+        counts = {}
+        for e in events:
+            if e.game is not None:
+                key = (e.game, e.location)
+                counts[key] = counts.get(key, 0) + 1
+        replay = HistoryReplay(conn, self.db_path)
+        for key, n in counts.items():
+            #after a restart, the events since the checkpoint are counted once, the batch is already among them
+            since = self._since_checkpoint[key] + n if key in self._since_checkpoint else replay.events_since_checkpoint(*key)
+            if since >= self.checkpoint_events:
+                replay.checkpoint(*key)
+                since = 0
+            self._since_checkpoint[key] = since
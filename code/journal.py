@@ -0,0 +1,90 @@
+"""append-only journal of data changes on top of a pickled snapshot"""
+import os
+import pickle
+from typing import Callable
+
+class Journal:
+    """keeps a pickled snapshot plus the log of small change records appended after it;
+    the snapshot is rewritten (compacted) once the log grows beyond the threshold"""
+    PUT, REMOVE = range(2)
+
+    snapshot_path: str
+    journal_path: str
+    compact_records: int
+    records: int
+
+    def __init__(self, snapshot_path: str, compact_records: int, state: Callable[[], object]):
+        self.snapshot_path = snapshot_path
+        self.journal_path = path_without_extension(snapshot_path) + ".journal"
+        self.compact_records = compact_records
+        self.records = 0
+        self._state = state
+        self._file = None
+
+    def load(self, default: Callable[[], object], apply: Callable[[object, tuple], None], read_only: bool = False) -> object:
+        """loads the snapshot (or creates the default object if there is none yet) and replays the journal tail;
+        a broken tail is cut off, unless read_only: readers of the files of a running bot may see a record being written"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                result = pickle.load(f)
+        except FileNotFoundError:
+            result = default()
+        self.records = 0
+        valid_size = 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                while True:
+                    try:
+                        record = pickle.load(f)
+                    except EOFError:
+                        break
+                    except (pickle.UnpicklingError, ValueError, AttributeError, ImportError, IndexError):
+                        #the tail may be broken by a crash in the middle of a write, the rest is dropped
+                        print("journal %s is truncated at %s" % (self.journal_path, str(valid_size)))
+                        break
+                    apply(result, record)
+                    self.records += 1
+                    valid_size = f.tell()
+            if not read_only and valid_size != os.path.getsize(self.journal_path):
+                os.truncate(self.journal_path, valid_size)
+        except FileNotFoundError:
+            pass
+        return result
+
+    def append(self, operation: int, key, value = None) -> None:
+        """appends a single change record, compacting the journal when it grows too long"""
+        if self.records >= self.compact_records:
+            self.compact()
+            return
+        if not self._file:
+            self._file = open(self.journal_path, 'ab')
+        pickle.dump((operation, key, value), self._file, pickle.HIGHEST_PROTOCOL)
+        self._file.flush()
+        self.records += 1
+
+    def compact(self) -> None:
+        """rewrites the snapshot with the full state and starts an empty journal"""
+        write_atomically(self.snapshot_path, self._state())
+        if self._file:
+            self._file.close()
+            self._file = None
+        with open(self.journal_path, 'wb'):
+            pass
+        self.records = 0
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+def path_without_extension(file_path: str) -> str:
+    return os.path.splitext(file_path)[0]
+
+def write_atomically(file_path: str, data: object) -> None:
+    """pickles the object into a temporary file and moves it over the target, so a crash never leaves a half-written file"""
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
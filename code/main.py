@@ -13,6 +13,7 @@ from testchatconversation import TestChatConversation
 from chatconfiguration import ChatConfiguration
 from notifier import RegistrationNotifier
 from maineventloop import set_main_event_loop, run_in_main_event_loop, run_until_complete
+from translate import close_translations, prefetch_translations, compile_catalogs
 
 def configure_logging(logtofile:bool):
     # Enable logging
@@ -50,10 +51,24 @@ def normal_run() -> None:
     data = DataModel()
     ChatConfiguration().update_chat_users(data.chat)
     data.save_chat()
+    languages = {u.language_code for u in data.chat.users} | {preferences["language"]["override_user_language"]}
+    if preferences["translation"]["prefetch"]:
+        #in the background, the start does not wait for the translation service
+        prefetch_translations(languages)
+    compile_catalogs(languages)
     conversation = ChatConversation(credentials["telegram"]["bot"]["token"], credentials["telegram"]["chat"]["id"], data)
     di[RegistrationNotifier] = conversation
     # run the bot until the user presses Ctrl-C
-    run_until_complete(conversation.run())
+    try:
+        run_until_complete(conversation.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        try:
+            run_until_complete(conversation.stop())
+        finally:
+            data.close()
+            close_translations()
     
 def test_run() -> None:
     """entry point for a test run, with automated actions and no real user data"""
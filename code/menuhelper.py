@@ -1,29 +1,39 @@
 """menu helper class"""
 from copy import deepcopy
-from typing import List, Dict
-from translate import _
+from typing import List, Dict, Sequence
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from translate import catalog
 
 class MenuHelper:
     '''Telegram menu with localization on the fly'''
-    translation_memo = {}
+    keyboard_cache = {}     #(menu name, language, variant): (catalog the menu was translated with, keyboard)
 
     @classmethod
-    def get_menu(cls, l:str, entry: List[List[Dict[str, str]]], entry_name:str) -> List[List[Dict[str, str]]]:
-        if not l:
-            return entry
-        if entry_name:
-            cached_name = entry_name + "_" + l
-            if cached_name in cls.translation_memo:
-                return cls.translation_memo[cached_name]
-        result = []
-        for e in entry:
-            target = deepcopy(e)
-            for t in target:
-                t['text'] = _(t['text'], l)
-            result.append(target)
-        if entry_name:
-            cls.translation_memo[cached_name] = result
-        return result
+    def get_keyboard(cls, l:str, entry: List[List[Dict[str, str]]], entry_name:str, skip: tuple = ()) -> InlineKeyboardMarkup:
+        """the translated menu without the rows listed in skip, as a ready keyboard; it is built once per
+        (menu, language, variant) and shared: keyboards and their buttons are immutable, dynamic rows are added
+        by composing a new keyboard of the cached rows (see compose), while the catalog of the language is current"""
+        texts = catalog(l if l else "en")
+        key = (entry_name, l, skip)
+        cached = cls.keyboard_cache.get(key, None)
+        if cached and cached[0] is texts:
+            return cached[1]
+        keyboard = InlineKeyboardMarkup(tuple(tuple(MenuHelper.button(texts.get(b['text']), b['callback_data']) for b in row)
+                                              for i, row in enumerate(entry) if i not in skip))
+        cls.keyboard_cache[key] = (texts, keyboard)
+        return keyboard
+
+    @staticmethod
+    def button(text: str, callback_data: str) -> InlineKeyboardButton:
+        return InlineKeyboardButton(text, callback_data=callback_data)
+
+    @staticmethod
+    def compose(keyboard: InlineKeyboardMarkup, head: Sequence = (), tail: Sequence = ()) -> InlineKeyboardMarkup:
+        """the keyboard with dynamic rows of buttons before its rows, and before its last row; cached rows are reused as they are"""
+        rows = keyboard.inline_keyboard
+        if tail:
+            return InlineKeyboardMarkup(tuple(head) + rows[:-1] + tuple(tail) + rows[-1:])
+        return InlineKeyboardMarkup(tuple(head) + rows)
 
     @classmethod
     def remove_menu_entry(cls, menu: List[List[Dict[str, str]]], callback_data_to_remove:int) -> List[List[Dict[str, str]]]:
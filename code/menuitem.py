@@ -1,25 +1,19 @@
 """Telegram menu localization classes"""
-from translate import _
+from translate import catalog
 
 class MenuItemLocalized:
     """localized menu item"""
     text:str
-    localized:dict
     #key:int
 
     def __init__(self, text): #, key:int = None):
         self.text = text
-        self.localized = {}
         #self.key = key
 
     def get_text(self, language:str) -> str:
         if not language or language == "en":
             return self.text
-        localized = self.localized.get(language, None)
-        if not localized:
-            localized = _(self.text, language)
-            self.localized[language] = localized
-        return localized
+        return catalog(language).get(self.text)
 
 class MenuItem:
     """menu item holder"""
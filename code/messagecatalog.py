@@ -0,0 +1,45 @@
+"""compiled per-language catalog of the translated texts"""
+import re
+from datetime import datetime
+from typing import Callable
+
+#English names, independent of the locale of the process
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+MONTHS = ('January', 'February', 'March', 'April', 'May', 'June',
+          'July', 'August', 'September', 'October', 'November', 'December')
+
+class MessageCatalog:
+    """texts of one language resolved to their final strings, so rendering is a single dictionary lookup;
+    templates are checked when compiled: a translation whose % placeholders differ from the English source
+    would fail to format, the source is kept instead. Texts not compiled yet are added on their first use"""
+    PLACEHOLDER = re.compile(r"%[-+ #0]*\d*(?:\.\d+)?[sdifr%]")
+
+    def __init__(self, language: str, lookup: Callable[[str], str], texts: list[str]):
+        self.language = language
+        self._lookup = lookup
+        self.texts = {}
+        for t in texts:
+            self.get(t)
+        self.weekdays = tuple(self.get(d) for d in WEEKDAYS)
+        self.months = tuple(self.get(m) for m in MONTHS)
+
+    def get(self, text: str) -> str:
+        result = self.texts.get(text, None)
+        if result is None:
+            result = self.texts[text] = self._compile(text)
+        return result
+
+    def _compile(self, text: str) -> str:
+        translated = self._lookup(text)
+        if not translated:
+            return text
+        if '%' in text or '%' in translated:
+            if MessageCatalog.PLACEHOLDER.findall(text) != MessageCatalog.PLACEHOLDER.findall(translated):
+                return text
+        return translated
+
+    def weekday(self, d: datetime) -> str:
+        return self.weekdays[d.weekday()]
+
+    def month(self, d: datetime) -> str:
+        return self.months[d.month - 1]
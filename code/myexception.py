@@ -3,3 +3,6 @@ class LogicException (Exception):
     """invalid logic exception (e.g. state of the object called)"""
     def __init__(self, message: str):
         pass
+
+class TranslationException (Exception):
+    """the translation service failed or is not reachable"""
@@ -1,6 +1,6 @@
 """Game player"""
 from chatuser import Chatuser
-from translate import _
+from translate import catalog
 from config import messages
 
 class Player:
@@ -26,6 +26,6 @@ class Player:
     
     def __str__(self):
         if self.participants != 1:
-            return self.__name__() + " +" + _(messages["role"]["with_guests"]) % str(self.participants-1)
+            return self.__name__() + " +" + catalog().get(messages["role"]["with_guests"]) % str(self.participants-1)
         return self.__name__()
         
\ No newline at end of file
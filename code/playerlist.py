@@ -0,0 +1,91 @@
+"""ordered list of game players with constant time lookup and removal"""
+from typing import Iterator
+from player import Player
+
+class PlayerList:
+    """ordered collection of players keyed by user id; every change is reflected in the index shared
+    by all lists of the same competition, mapping user id to (player, list the player is in)"""
+    _players: dict[int, Player]
+    _index: dict
+
+    def __init__(self, index: dict, players = None):
+        self._players = {}
+        self._index = index
+        for p in players or []:
+            self.append(p)
+
+    def __getstate__(self):
+        return {'_players': self._players}
+
+    def __setstate__(self, state):
+        self._players = state['_players']
+        self._index = {}
+
+    def attach(self, index: dict) -> None:
+        """makes the list report its players into the index (after unpickling)"""
+        self._index = index
+        for user_id, p in self._players.items():
+            index[user_id] = (p, self)
+
+    def get(self, user_id: int) -> Player:
+        return self._players.get(user_id, None)
+
+    def append(self, p: Player) -> None:
+        self._players[p.owner.user_id] = p
+        self._index[p.owner.user_id] = (p, self)
+
+    def prepend(self, players: list[Player]) -> None:
+        """puts the players in front of the list, keeping their order"""
+        existing = self._players
+        self._players = {}
+        for p in players:
+            self.append(p)
+        for user_id, p in existing.items():
+            if user_id not in self._players:
+                self._players[user_id] = p
+
+    def insert(self, i: int, p: Player) -> None:
+        if i == 0:
+            self.prepend([p])
+            return
+        items = list(self._players.values())
+        items.insert(i, p)
+        self._players = {}
+        for x in items:
+            self.append(x)
+
+    def remove(self, p: Player) -> None:
+        user_id = p.owner.user_id
+        if user_id not in self._players:
+            raise ValueError("player is not in the list")
+        del self._players[user_id]
+        if self._index.get(user_id, (None, None))[1] is self:
+            del self._index[user_id]
+
+    def pop(self) -> Player:
+        """removes and returns the last player"""
+        user_id, p = self._players.popitem()
+        if self._index.get(user_id, (None, None))[1] is self:
+            del self._index[user_id]
+        return p
+
+    def clear(self) -> None:
+        for user_id in self._players:
+            if self._index.get(user_id, (None, None))[1] is self:
+                del self._index[user_id]
+        self._players.clear()
+
+    def __contains__(self, p: Player) -> bool:
+        return p.owner.user_id in self._players
+
+    def __iter__(self) -> Iterator[Player]:
+        return iter(self._players.values())
+
+    def __reversed__(self) -> Iterator[Player]:
+        return reversed(self._players.values())
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    def __bool__(self) -> bool:
+        return bool(self._players)
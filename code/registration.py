@@ -1,15 +1,68 @@
 """registration helper"""
+import re
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from config import registration
 from menuitem import MenuItem
 from chatconstants import ChatConstants
+from chatuser import Chatuser
+from translate import catalog
+
+class WizardButton:
+    """button of a wizard step compiled from its definition, e.g. "(forward) racket (enable if value)(hide if registered)" """
+    TRAIT = re.compile(r"\(([^)]*)\)")
+    #trait: statuses of the users not seeing the button
+    HIDE = {
+        'hide if registered': (Chatuser.TRUSTED, Chatuser.ADMIN),
+        'hide if not registered': (Chatuser.NEW, Chatuser.REMOVED, Chatuser.RESTRICTED)
+    }
+    #trait: text put before the caption
+    PREFIX = {
+        'forward': '[Forward]',
+        'backward': '[Backward]'
+    }
+    ENABLE_IF_VALUE = 'enable if value'
+
+    def __init__(self, definition: str):
+        self.prefix = None
+        self.hidden_for = set()
+        self.needs_value = False    #disabled until the user enters the value of the step
+        for trait in WizardButton.TRAIT.findall(definition):
+            trait = trait.strip()
+            if trait in WizardButton.HIDE:
+                self.hidden_for.update(WizardButton.HIDE[trait])
+            elif trait in WizardButton.PREFIX:
+                self.prefix = WizardButton.PREFIX[trait]
+            elif trait == WizardButton.ENABLE_IF_VALUE:
+                self.needs_value = True
+            else:
+                raise LookupError("Unsupported button trait: " + definition)
+        self.name = WizardButton.TRAIT.sub("", definition).strip()
+        self.target: MenuItem = None
+
+class WizardLayout:
+    """buttons of a wizard step in one language for one user status; the buttons enabled by a value are
+    prebuilt in both states, so a render only picks the keyboard matching the value of the user"""
+    def __init__(self, enabled: InlineKeyboardMarkup, disabled: InlineKeyboardMarkup):
+        self.enabled = enabled
+        self.disabled = disabled
+        self.conditional = enabled is not disabled     #some button waits for the value
+
+    def keyboard(self, value: str) -> InlineKeyboardMarkup:
+        return self.enabled if value else self.disabled
 
 class Registration():
-    """registration helper class to build menu dynamically from toml definition"""
+    """registration helper class to build menu dynamically from toml definition;
+    the steps are compiled once into a graph indexed by key and by name, with the buttons resolved to their targets"""
     def __init__(self, start_key:int):
         self.menu = []
+        self.by_key = {}
+        self.by_name = {}
+        self.buttons = {}       #step key: rows of WizardButton
+        self.layouts = {}       #(step key, language, user status): (catalog the layout was translated with, WizardLayout)
         self.parameters = []
         self.current_key = start_key
         self.__build()
+        self.__link()
 
     def __build(self):
         for entry in registration.items():
@@ -22,11 +75,11 @@ class Registration():
                 p = values.get("parameter", None)
                 m = MenuItem(
                     name,
-                    values["caption"], 
-                    values.get("message", None), 
-                    values.get("values", None), 
-                    values.get("buttons", None), 
-                    key, 
+                    values["caption"],
+                    values.get("message", None),
+                    values.get("values", None),
+                    values.get("buttons", None),
+                    key,
                     predefined_key,
                     p,
                     values.get("command", None))
@@ -34,14 +87,40 @@ class Registration():
                     for v in m.values:
                         v.key = self.__get_next_key()
                 self.menu.append(m)
+                self.by_key[key] = m
+                self.by_name[name] = m
                 if p:
                     self.parameters.append((name, p))
 
+    def __link(self):
+        """a list in the buttons of a step is a row, names out of the lists make one row"""
+        for m in self.menu:
+            rows = []
+            row = []
+            for item in m.buttons or []:
+                if type(item) is list:
+                    rows.append([self.__compile_button(m, x) for x in item])
+                elif type(item) is str:
+                    row.append(self.__compile_button(m, item))
+                else:
+                    raise LookupError("Unsupported button definition of step %s: %s" % (m.name, str(item)))
+            if row:
+                rows.append(row)
+            self.buttons[m.key] = [r for r in rows if r]
+
+    def __compile_button(self, m: MenuItem, definition: str) -> WizardButton:
+        """a button without its target is a configuration error, the bot does not start with it"""
+        b = WizardButton(definition)
+        b.target = self.by_name.get(b.name, None)
+        if not b.target:
+            raise LookupError("Button of step %s has no target: %s" % (m.name, definition))
+        return b
+
     def __get_next_key(self) -> int:
         key = self.current_key
         self.current_key += 1
         return key
-    
+
     def __find_key(self, key) -> int:
         for c in ChatConstants.codes:
             if c[1] == key:
@@ -49,10 +128,43 @@ class Registration():
         raise LookupError("Key is not a supported command: " + key)
 
     def get_menu(self, key: int) -> MenuItem:
-        return next((x for x in self.menu if x.key == key), None)
-    
+        return self.by_key.get(key, None)
+
     def get_menu_by_name(self, name: str) -> MenuItem:
-        return next((x for x in self.menu if x.name == name), None)
+        return self.by_name.get(name, None)
+
+    def get_layout(self, key: int, language: str, status: int) -> WizardLayout:
+        """the buttons of the step for the user status, built once per language while its catalog is current"""
+        texts = catalog(language if language else "en")
+        cache_key = (key, language, status)
+        cached = self.layouts.get(cache_key, None)
+        if cached and cached[0] is texts:
+            return cached[1]
+        m = self.by_key[key]
+        rows = []
+        if m.parameter:
+            rows.append(tuple(InlineKeyboardButton(v.get_text(language), callback_data=m.parameter + "#" + v.text) for v in m.values))
+        enabled = []
+        disabled = []
+        for row in self.buttons[m.key]:
+            visible = [b for b in row if status not in b.hidden_for]
+            if not visible:
+                continue
+            enabled.append(tuple(Registration.__button(texts, b, language, True) for b in visible))
+            disabled.append(tuple(Registration.__button(texts, b, language, False) for b in visible))
+        enabled = InlineKeyboardMarkup(tuple(rows + enabled))
+        disabled = InlineKeyboardMarkup(tuple(rows + disabled)) \
+            if any(b.needs_value and status not in b.hidden_for for r in self.buttons[m.key] for b in r) else enabled
+        layout = WizardLayout(enabled, disabled)
+        self.layouts[cache_key] = (texts, layout)
+        return layout
+
+    @staticmethod
+    def __button(texts, b: WizardButton, language: str, enabled: bool) -> InlineKeyboardButton:
+        text = b.target.caption.get_text(language)
+        if b.prefix:
+            text = texts.get(b.prefix) + " " + text
+        return InlineKeyboardButton(text, callback_data=str(b.target.key if enabled or not b.needs_value else -1))
 
     def handle_input(self, level: str, value: str):
         pass
@@ -0,0 +1,224 @@
+"""SQLite storage of the bot data"""
+from datetime import datetime
+import json
+import sqlite3
+import threading
+from os import path
+from typing import Iterable
+from competition import Competition
+from chatcommunity import ChatCommunity
+from chatuser import Chatuser
+from gameevent import GameEvent
+from pendingoperation import PendingOperation
+from player import Player
+from storage import Storage
+
+class SqliteStorage(Storage):
+    """storage in a single SQLite database, every change is written as a few rows in one transaction"""
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS COMPETITIONS
+            (ID               TEXT    PRIMARY KEY NOT NULL,
+            STATUS            INT     NOT NULL,
+            POLL_ID           TEXT    NULL,
+            POLL_MESSAGE_ID   INT     NULL,
+            CAPACITY          INT     NOT NULL,
+            CAPACITY_MAX      INT     NOT NULL,
+            LOCATION          TEXT    NULL,
+            DATE              TEXT    NULL,
+            DURATION          INT     NULL,
+            DESCRIPTION_ID    TEXT    NULL);
+        CREATE INDEX IF NOT EXISTS COMPETITIONS_POLL_ID ON COMPETITIONS (POLL_ID);
+        CREATE INDEX IF NOT EXISTS COMPETITIONS_DATE_LOCATION ON COMPETITIONS (DATE, LOCATION);
+        CREATE TABLE IF NOT EXISTS PLAYERS
+            (COMPETITION_ID   TEXT    NOT NULL,
+            USER_ID           INT     NOT NULL,
+            PARTICIPANTS      INT     NOT NULL,
+            SPARE             INT     NOT NULL,
+            POSITION          INT     NOT NULL,
+            PRIMARY KEY (COMPETITION_ID, USER_ID));
+        CREATE INDEX IF NOT EXISTS PLAYERS_USER_ID ON PLAYERS (USER_ID);
+        CREATE TABLE IF NOT EXISTS CHAT_USERS
+            (USER_ID          INT     PRIMARY KEY NOT NULL,
+            NAME              TEXT    NULL,
+            FULL_NAME         TEXT    NULL,
+            STATUS            INT     NOT NULL,
+            LANGUAGE_CODE     TEXT    NULL,
+            REGISTRATION_INFO TEXT    NULL,
+            PENDING           INT     NOT NULL);
+        CREATE INDEX IF NOT EXISTS CHAT_USERS_NAME ON CHAT_USERS (NAME);
+        CREATE TABLE IF NOT EXISTS PENDING_OPERATIONS
+            (USER_ID          INT     NOT NULL,
+            OPERATION         INT     NOT NULL,
+            DATE              TEXT    NOT NULL,
+            MESSAGE_ID        INT     NULL,
+            PRIMARY KEY (USER_ID, OPERATION));
+        CREATE TABLE IF NOT EXISTS SCHEDULE_EVENTS
+            (ID               TEXT    PRIMARY KEY NOT NULL,
+            DATE              TEXT    NOT NULL,
+            DURATION          INT     NOT NULL,
+            LOCATION          TEXT    NOT NULL,
+            AUTO_REGISTRATION INT     NOT NULL,
+            REGISTRATION_START TEXT   NULL,
+            CAPACITY          INT     NOT NULL,
+            VALID             INT     NOT NULL,
+            OPENED            INT     NOT NULL,
+            SCHEDULED         INT     NOT NULL);
+        CREATE INDEX IF NOT EXISTS SCHEDULE_EVENTS_DATE ON SCHEDULE_EVENTS (DATE);
+    '''
+
+    def __init__(self, data_path: str, read_only: bool = False):
+        self._lock = threading.Lock()
+        if read_only:
+            #for readers of the database of a running bot: no schema upgrade, no settings changed
+            self._conn = sqlite3.connect("file:" + path.join(data_path, 'data.db') + "?mode=ro", uri=True, check_same_thread=False)
+            return
+        #writes come from the write-behind worker, the lock keeps transactions of different threads apart
+        self._conn = sqlite3.connect(path.join(data_path, 'data.db'), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SqliteStorage.SCHEMA)
+
+    def __del__(self):
+        if getattr(self, "_conn", None):
+            self._conn.close()
+
+    def empty(self) -> bool:
+        return not any(self._conn.execute("SELECT 1 FROM CHAT_USERS UNION ALL SELECT 1 FROM COMPETITIONS LIMIT 1"))
+
+    def competitions_missing(self) -> bool:
+        return not any(self._conn.execute("SELECT 1 FROM COMPETITIONS LIMIT 1"))
+
+    # Loading
+    def load_chat(self) -> ChatCommunity:
+        chat = ChatCommunity()
+        for row in self._conn.execute(
+            "SELECT USER_ID,NAME,FULL_NAME,STATUS,LANGUAGE_CODE,REGISTRATION_INFO,PENDING FROM CHAT_USERS ORDER BY ROWID"):
+            user = Chatuser(row[1], row[0], row[3], row[2], row[4])
+            if row[5]:
+                user.registration_info = json.loads(row[5])
+            if row[6]:
+                chat.add_pending(user)
+            else:
+                chat.add(user)
+        chat.pending_operations = [PendingOperation(row[0], row[1], from_db(row[2]), row[3]) for row in
+            self._conn.execute("SELECT USER_ID,OPERATION,DATE,MESSAGE_ID FROM PENDING_OPERATIONS ORDER BY DATE")]
+        return chat
+
+    def load_competitions(self, chat: ChatCommunity) -> list[Competition]:
+        events = {e.id: e for e in self._load_events("SELECT * FROM SCHEDULE_EVENTS WHERE ID IN " \
+                                                     "(SELECT DESCRIPTION_ID FROM COMPETITIONS)")}
+        result = []
+        by_id = {}
+        for row in self._conn.execute(
+            "SELECT ID,STATUS,POLL_ID,POLL_MESSAGE_ID,CAPACITY,CAPACITY_MAX,LOCATION,DATE,DURATION,DESCRIPTION_ID " \
+            "FROM COMPETITIONS ORDER BY DATE"):
+            c = Competition(events.get(row[9], None))
+            c.id_value = row[0]
+            c.status = row[1]
+            c.poll_id = row[2] if row[2] else ''
+            c.poll_message_id = row[3] if row[3] else 0
+            c.capacity = row[4]
+            c.capacity_max = row[5]
+            c.location = row[6]
+            c.date = from_db(row[7])
+            c.duration = row[8]
+            result.append(c)
+            by_id[c.id] = c
+        for row in self._conn.execute(
+            "SELECT COMPETITION_ID,USER_ID,PARTICIPANTS,SPARE FROM PLAYERS ORDER BY COMPETITION_ID,SPARE,POSITION"):
+            c = by_id.get(row[0], None)
+            if not c:
+                continue
+            owner = chat.find_user(row[1])
+            if not owner:
+                owner = Chatuser(None, row[1], Chatuser.NEW)
+            (c.spare_players if row[3] else c.players).append(Player(owner, row[2]))
+        return result
+
+    def load_schedule(self) -> list[GameEvent]:
+        return self._load_events("SELECT * FROM SCHEDULE_EVENTS WHERE SCHEDULED = 1 ORDER BY DATE")
+
+    def _load_events(self, query: str) -> list[GameEvent]:
+        return [GameEvent(from_db(row[1]), row[2], row[3], bool(row[4]), from_db(row[5]), row[6], bool(row[7]), bool(row[8]))
+                for row in self._conn.execute(query)]
+
+    # Saving
+    def save_chat(self, chat: ChatCommunity):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM CHAT_USERS")
+            self._conn.executemany(SqliteStorage._UPSERT_USER, [self._user_row(u, False) for u in chat.users])
+            self._conn.executemany(SqliteStorage._UPSERT_USER, [self._user_row(u, True) for u in chat.pending_users])
+            self._write_pending_operations(chat)
+
+    def save_user(self, user: Chatuser):
+        with self._lock, self._conn:
+            self._conn.execute(SqliteStorage._UPSERT_USER, self._user_row(user, False))
+
+    def save_pending_operations(self, chat: ChatCommunity):
+        with self._lock, self._conn:
+            self._write_pending_operations(chat)
+
+    def save_competitions(self, competitions: Iterable[Competition]):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM PLAYERS")
+            self._conn.execute("DELETE FROM COMPETITIONS")
+            for c in competitions:
+                self._write_competition(c)
+
+    def save_competition(self, c: Competition):
+        with self._lock, self._conn:
+            self._write_competition(c)
+
+    def remove_competition(self, c_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM PLAYERS WHERE COMPETITION_ID = ?", (c_id,))
+            self._conn.execute("DELETE FROM COMPETITIONS WHERE ID = ?", (c_id,))
+
+    def save_schedule(self, events: list[GameEvent]):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE SCHEDULE_EVENTS SET SCHEDULED = 0")
+            self._conn.executemany(SqliteStorage._UPSERT_EVENT, [self._event_row(e, True) for e in events])
+            self._conn.execute("DELETE FROM SCHEDULE_EVENTS WHERE SCHEDULED = 0 AND ID NOT IN " \
+                               "(SELECT DESCRIPTION_ID FROM COMPETITIONS WHERE DESCRIPTION_ID IS NOT NULL)")
+
+    _UPSERT_USER = "INSERT OR REPLACE INTO CHAT_USERS (USER_ID,NAME,FULL_NAME,STATUS,LANGUAGE_CODE,REGISTRATION_INFO,PENDING) " \
+        "VALUES (?,?,?,?,?,?,?)"
+    _UPSERT_EVENT = "INSERT INTO SCHEDULE_EVENTS " \
+        "(ID,DATE,DURATION,LOCATION,AUTO_REGISTRATION,REGISTRATION_START,CAPACITY,VALID,OPENED,SCHEDULED) " \
+        "VALUES (?,?,?,?,?,?,?,?,?,?) ON CONFLICT(ID) DO UPDATE SET " \
+        "DURATION=excluded.DURATION,AUTO_REGISTRATION=excluded.AUTO_REGISTRATION,REGISTRATION_START=excluded.REGISTRATION_START," \
+        "CAPACITY=excluded.CAPACITY,VALID=excluded.VALID,OPENED=excluded.OPENED,SCHEDULED=MAX(SCHEDULED,excluded.SCHEDULED)"
+
+    def _user_row(self, user: Chatuser, pending: bool) -> tuple:
+        return (user.user_id, user.name, getattr(user, "full_name", None), user.status, getattr(user, "language_code", None),
+                json.dumps(user.registration_info, ensure_ascii=False) if user.registration_info else None, int(pending))
+
+    def _event_row(self, e: GameEvent, scheduled: bool) -> tuple:
+        return (e.id, to_db(e.date), e.duration, e.location, int(e.auto_registration), to_db(e.registration_start),
+                e.capacity, int(e.valid), int(e.opened), int(scheduled))
+
+    def _write_pending_operations(self, chat: ChatCommunity):
+        self._conn.execute("DELETE FROM PENDING_OPERATIONS")
+        self._conn.executemany("INSERT OR REPLACE INTO PENDING_OPERATIONS (USER_ID,OPERATION,DATE,MESSAGE_ID) VALUES (?,?,?,?)",
+            [(o.user_id, o.operation, to_db(o.date), o.message_id) for o in chat.pending_operations])
+
+    def _write_competition(self, c: Competition):
+        if c.description:
+            self._conn.execute(SqliteStorage._UPSERT_EVENT, self._event_row(c.description, False))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO COMPETITIONS " \
+            "(ID,STATUS,POLL_ID,POLL_MESSAGE_ID,CAPACITY,CAPACITY_MAX,LOCATION,DATE,DURATION,DESCRIPTION_ID) " \
+            "VALUES (?,?,?,?,?,?,?,?,?,?)",
+            (c.id, c.status, c.poll_id, c.poll_message_id, c.capacity, c.capacity_max, c.location, to_db(c.date), c.duration,
+             c.description.id if c.description else None))
+        self._conn.execute("DELETE FROM PLAYERS WHERE COMPETITION_ID = ?", (c.id,))
+        rows = [(c.id, p.owner.user_id, p.participants, 0, i) for i, p in enumerate(c.players)]
+        rows.extend((c.id, p.owner.user_id, p.participants, 1, i) for i, p in enumerate(c.spare_players))
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO PLAYERS (COMPETITION_ID,USER_ID,PARTICIPANTS,SPARE,POSITION) VALUES (?,?,?,?,?)", rows)
+
+def to_db(value: datetime) -> str:
+    return value.isoformat() if value else None
+
+def from_db(value: str) -> datetime:
+    return datetime.fromisoformat(value) if value else None
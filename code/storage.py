@@ -0,0 +1,137 @@
+"""persistent storage of the bot data"""
+from abc import ABC, abstractmethod
+import pickle
+from os import path
+from typing import Callable, Iterable
+from competition import Competition
+from chatcommunity import ChatCommunity
+from chatuser import Chatuser
+from gameevent import GameEvent
+from journal import Journal, write_atomically
+
+class Storage(ABC):
+    """abstract storage backend, keeping competitions, chat users with their pending operations and the game schedule"""
+    @abstractmethod
+    def load_chat(self) -> ChatCommunity:
+        raise NotImplementedError
+    @abstractmethod
+    def load_competitions(self, chat: ChatCommunity) -> list[Competition]:
+        raise NotImplementedError
+    @abstractmethod
+    def competitions_missing(self) -> bool:
+        """True if there is no stored state of the competitions, e.g. the snapshot file is lost"""
+        raise NotImplementedError
+    @abstractmethod
+    def load_schedule(self) -> list[GameEvent]:
+        raise NotImplementedError
+    @abstractmethod
+    def save_chat(self, chat: ChatCommunity):
+        raise NotImplementedError
+    @abstractmethod
+    def save_user(self, user: Chatuser):
+        raise NotImplementedError
+    @abstractmethod
+    def save_pending_operations(self, chat: ChatCommunity):
+        raise NotImplementedError
+    @abstractmethod
+    def save_competitions(self, competitions: Iterable[Competition]):
+        raise NotImplementedError
+    @abstractmethod
+    def save_competition(self, c: Competition):
+        raise NotImplementedError
+    @abstractmethod
+    def remove_competition(self, c_id: str):
+        raise NotImplementedError
+    @abstractmethod
+    def save_schedule(self, events: list[GameEvent]):
+        raise NotImplementedError
+
+class PickleStorage(Storage):
+    """storage in pickle files, either rewritten on every change, or journaled; a read_only storage does not change the files"""
+    def __init__(self, data_path: str, journaled: bool, compact_records: int,
+                 chat: Callable[[], ChatCommunity], competitions: Callable[[], list[Competition]], read_only: bool = False):
+        self.path = data_path
+        self.journaled = journaled
+        self.read_only = read_only
+        self._chat = chat
+        self._competitions = competitions
+        self.competitions_journal = Journal(path.join(self.path,'competitions.pickle'), compact_records, competitions)
+        self.chat_journal = Journal(path.join(self.path,'chat.pickle'), compact_records, chat)
+
+    def load_chat(self) -> ChatCommunity:
+        if self.journaled:
+            return self.chat_journal.load(ChatCommunity, PickleStorage._apply_chat_record, self.read_only)
+        with open(path.join(self.path,'chat.pickle'), 'rb') as f:
+            return pickle.load(f)
+
+    def load_competitions(self, chat: ChatCommunity) -> list[Competition]:
+        if self.journaled:
+            return self.competitions_journal.load(list, PickleStorage._apply_competition_record, self.read_only)
+        with open(path.join(self.path,'competitions.pickle'), 'rb') as f:
+            return pickle.load(f)
+
+    def competitions_missing(self) -> bool:
+        return not path.exists(path.join(self.path,'competitions.pickle'))
+
+    def load_schedule(self) -> list[GameEvent]:
+        with open(path.join(self.path,'schedule.pickle'), 'rb') as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _apply_competition_record(competitions: list[Competition], record: tuple) -> None:
+        operation, key, value = record
+        i = next((i for i, x in enumerate(competitions) if x.id == key), -1)
+        if operation == Journal.PUT:
+            if i == -1:
+                competitions.append(value)
+            else:
+                competitions[i] = value
+        elif i != -1:
+            competitions.pop(i)
+
+    @staticmethod
+    def _apply_chat_record(chat: ChatCommunity, record: tuple) -> None:
+        _, key, value = record
+        if key is None:
+            chat.pending_operations = value
+            return
+        chat.add_or_replace(value)
+
+    def save_chat(self, chat: ChatCommunity):
+        if self.journaled:
+            self.chat_journal.compact()
+            return
+        write_atomically(path.join(self.path,'chat.pickle'), chat)
+
+    def save_user(self, user: Chatuser):
+        if self.journaled:
+            self.chat_journal.append(Journal.PUT, user.user_id, user)
+        else:
+            self.save_chat(self._chat())
+
+    def save_pending_operations(self, chat: ChatCommunity):
+        if self.journaled:
+            self.chat_journal.append(Journal.PUT, None, chat.pending_operations)
+        else:
+            self.save_chat(chat)
+
+    def save_competitions(self, competitions: Iterable[Competition]):
+        if self.journaled:
+            self.competitions_journal.compact()
+            return
+        write_atomically(path.join(self.path,'competitions.pickle'), list(competitions))
+
+    def save_competition(self, c: Competition):
+        if self.journaled:
+            self.competitions_journal.append(Journal.PUT, c.id, c)
+        else:
+            self.save_competitions(self._competitions())
+
+    def remove_competition(self, c_id: str):
+        if self.journaled:
+            self.competitions_journal.append(Journal.REMOVE, c_id)
+        else:
+            self.save_competitions(self._competitions())
+
+    def save_schedule(self, events: list[GameEvent]):
+        write_atomically(path.join(self.path,'schedule.pickle'), events)
@@ -0,0 +1,34 @@
+"""one-shot migration of the pickled bot data into the SQLite storage"""
+import pickle
+import sys
+from os import path
+from chatcommunity import ChatCommunity
+from sqlitestorage import SqliteStorage
+from storage import PickleStorage
+
+def migrate_pickle_to_sqlite(data_path: str, force: bool = False) -> bool:
+    """copies chat users, pending operations, competitions and the schedule from data/*.pickle (and their journals)
+    into data/data.db; pickle files are kept untouched, so the migration can be repeated with force"""
+    target = SqliteStorage(data_path)
+    if not target.empty() and not force:
+        print("migration skipped: %s already contains data" % path.join(data_path, 'data.db'))
+        return False
+    chat = ChatCommunity()
+    competitions = []
+    source = PickleStorage(data_path, True, sys.maxsize, lambda: chat, lambda: competitions)
+    chat = source.load_chat()
+    competitions = source.load_competitions(chat)
+    try:
+        events = source.load_schedule()
+    except (pickle.UnpicklingError, IOError) as e:
+        print("load schedule failed: " + str(e))
+        events = []
+    target.save_chat(chat)
+    target.save_competitions(competitions)
+    target.save_schedule(events)
+    print("migrated: %s users, %s pending operations, %s competitions, %s scheduled events" % \
+          (str(len(chat.users) + len(chat.pending_users)), str(len(chat.pending_operations)), str(len(competitions)), str(len(events))))
+    return True
+
+if __name__ == "__main__":
+    migrate_pickle_to_sqlite(path.join(".", "data"), "--force" in sys.argv)
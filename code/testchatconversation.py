@@ -57,7 +57,7 @@ class TestChatConversation:
             await event.edit('Thank you for clicking {}!'.format(event.data))
         """
 
-        self.chat.users.clear()
+        self.chat.clear()
         self.conversation = ChatConversation(credentials["telegram"]["bot"]["token"], self.chat_id, self.data)
 
         #client.start(phone=your_phone_callback,password=your_password_callback,code_callback=your_code_callback)
@@ -88,7 +88,7 @@ class TestChatConversation:
         self.competition.competition_date = n.start
         self.competition.capacity_max_past = 9
 
-        self.chat.users.clear()
+        self.chat.clear()
         user = self.chat.find_user(self.user_id)
         assert not user
 
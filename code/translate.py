@@ -1,16 +1,90 @@
 """on the fly translation with JSON storage of translated pairs"""
-from os import walk, path
-import json
-import deepl
-from config import credentials
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, Future
+import logging
+from os import path
+import threading
+from config import credentials, preferences, messages, registration
+from messagecatalog import MessageCatalog, WEEKDAYS, MONTHS
+from myexception import TranslationException
+from translationstore import TranslationStore
+from translatorbackend import TranslatorBackend, DeepLBackend, DictionaryBackend, LocalBackend, LanguageCache
 
 __translator = None
+__catalogs = {}     #language as asked for: compiled catalog
 
-def _(s:str , language:str = None) -> str:
+def _translator() -> 'MyTranslator':
     global __translator
     if not __translator:
         __translator = MyTranslator()
-    return __translator.translate(s, language)
+    return __translator
+
+def _(s:str , language:str = None) -> str:
+    return _translator().translate(s, language)
+
+async def _a(s:str , language:str = None) -> str:
+    """translation for async handlers: a cache miss does not block the event loop"""
+    return await _translator().translate_async(s, language)
+
+def catalog(language: str = None) -> MessageCatalog:
+    """the compiled texts of the language, for the render paths"""
+    result = __catalogs.get(language, None)
+    if not result:
+        result = __catalogs[language] = _translator().compile(language)
+        #the texts missing in the catalog are requested once it is stored, so their arrival drops it
+        _translator().prefetch_missing()
+    return result
+
+def compile_catalogs(languages: set) -> None:
+    """compiles the catalogs before the bot starts serving"""
+    for l in languages | {None}:
+        catalog(l)
+
+def invalidate_catalogs(language: str = None) -> None:
+    """drops the compiled catalogs of the language (of all languages if not set), they are compiled again on the next use;
+    called when translations are added, and to be called when the English texts change"""
+    for l, c in list(__catalogs.items()):
+        if not language or c.language == language:
+            __catalogs.pop(l, None)
+
+def close_translations() -> None:
+    """writes the pairs translated so far into the translation files"""
+    if __translator:
+        __translator.close()
+
+def config_texts() -> list[str]:
+    """the user facing texts of messages.toml and registration.toml, and the weekday and month names"""
+    result = {}
+    def collect(value, key = None):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                collect(v, k)
+        elif isinstance(value, list):
+            for v in value:
+                collect(v, key)
+        #buttons of the registration wizard are step names, not texts
+        elif isinstance(value, str) and value and key != "buttons":
+            result[value] = True
+    collect(messages)
+    collect({k: v for k, v in registration.items() if k != "access"})
+    for name in WEEKDAYS + MONTHS:
+        result[name] = True
+    return list(result)
+
+def prefetch_translations(languages: set) -> Future:
+    """translates the missing config texts into the languages in the background, the bot starts serving meanwhile;
+    the future has the number of characters sent"""
+    t = _translator()
+    return t.prefetch_later(config_texts(), set(languages) | {t.default_language})
+
+def create_backend(name: str, storage_path: str) -> TranslatorBackend:
+    """the translation service selected in the preferences"""
+    match name:
+        case "deepl":
+            return DeepLBackend(credentials["translation"]["deepl_auth_key"], credentials["translation"]["formality"])
+        case "dictionary":
+            return DictionaryBackend(storage_path)
+    return LocalBackend()
 
 class CachedTranslation():
     language:str
@@ -21,49 +95,189 @@ class CachedTranslation():
 
 class MyTranslator():
     def __init__(self):
-        self.translator = deepl.Translator(credentials["translation"]["deepl_auth_key"])
+        t = preferences["translation"]
         self.default_language = credentials["telegram"]["chat"]["language"]
-        self.formality = credentials["translation"]["formality"]
-        if self.formality and self.formality != "default":
-            self.formality = "prefer_" + self.formality
-        self.supported_languages = ["en"]
-        for l in self.translator.get_target_languages():
-            self.supported_languages.append(l.code.lower())
-        self.cached_translations = {}
         self.storage_path = path.join(".", "translations")
+        self.backend = create_backend(t["backend"], self.storage_path)
+        self.store = TranslationStore(self.storage_path, float(t["flush_seconds"]), int(t["compact_records"]))
+        self.cached_translations = self.store.load()
+        self._logger = logging.getLogger("main")
+        self.timeout = float(t["timeout_seconds"])
+        self._executor = ThreadPoolExecutor(max_workers=int(t["threads"]), thread_name_prefix="translate")
+        self._inflight = {}     #(text, language): future of the translation requested and not finished yet
+        self._config_texts = frozenset(config_texts())
+        self.prefetch_batch_size = int(t["prefetch_batch_size"])
+        self.prefetch_max_characters = int(t["prefetch_max_characters"])
+        self._prefetch_sent = 0
+        self._prefetch_lock = threading.Lock()
+        self._prefetched_languages = set()  #languages whose missing config texts are requested in batches, once in a run
+        self._missing = set()       #languages with config texts missing in the catalogs compiled, not prefetched yet
+        self._closing = False
+        #the start does not wait for the service: the languages come from the file cache, and are updated in the background
+        self._languages = LanguageCache(path.join(self.storage_path, "languages.json"), self.backend, float(t["languages_ttl_hours"]) * 3600)
+        languages, fresh = self._languages.read()
+        self._set_languages(languages)
+        if not fresh:
+            self._executor.submit(self._refresh_languages)
+
+    def _set_languages(self, languages: list[str]) -> None:
+        """the languages of the service, and those having translation files"""
+        self.supported_languages = frozenset(["en", self.default_language] + languages + list(self.cached_translations))
+
+    def _refresh_languages(self) -> None:
+        try:
+            self._set_languages(self._languages.refresh())
+            invalidate_catalogs()
+        except (TranslationException, IOError) as e:
+            self._logger.warning("supported languages of the translation service are not updated: %s", str(e))
+
+    def _prefetch_languages(self, languages: set) -> set:
+        languages = {l if l in self.supported_languages else self.default_language for l in languages if l}
+        languages.discard('en')
+        return languages - self._prefetched_languages
+
+    def prefetch_later(self, texts: list[str], languages: set) -> Future:
+        """the prefetch in the thread pool; a language is prefetched once in a run"""
+        languages = self._prefetch_languages(languages)
+        self._prefetched_languages.update(languages)
+        return self._executor.submit(self.prefetch, texts, languages)
 
-        self.deserialize()
-
-    def deserialize(self):
-        filenames = next(walk(self.storage_path))[2]
-        for f in filenames:
-            try:
-                i = f.index(".json")
-                lang = f[:i]
-                if len(lang) != 2:
-                    continue
-                fn = path.join(self.storage_path, f)
-                with open(fn, 'r', encoding="utf-8") as f:
-                    self.cached_translations[lang] = json.load(f)
-            except (IOError) as e:
-                print("translate failed to read: %s, %s" % (f, str(e)))
-
-    def dump(self, language: str, entry:dict):
-        fn = path.join(self.storage_path, language + ".json")
-        with open(fn, 'w', encoding="utf-8") as f:
-            json.dump(entry, f, indent=4, ensure_ascii=False)
+    def prefetch_missing(self) -> None:
+        """one prefetch of the config texts missing in the catalogs compiled so far"""
+        if self._missing:
+            languages, self._missing = self._missing, set()
+            self.prefetch_later(config_texts(), languages)
+
+    def prefetch(self, texts: list[str], languages: set) -> int:
+        """translates the texts missing in the cache, prefetch_batch_size texts per request, and at most
+        prefetch_max_characters characters sent in the run; returns the number of characters sent.
+        The catalog of a language is compiled again, once, when the prefetch of the language ends"""
+        try:
+            return self._prefetch(texts, languages)
+        finally:
+            for language in languages:
+                invalidate_catalogs(language)
+
+    def _prefetch(self, texts: list[str], languages: set) -> int:
+        sent = 0
+        for language in sorted(languages):
+            entry = self.cached_translations.setdefault(language, {})
+            missing = [x for x in texts if not entry.get(x, None)]
+            done = 0
+            for i in range(0, len(missing), self.prefetch_batch_size):
+                if self._closing:
+                    return sent
+                batch = missing[i:i + self.prefetch_batch_size]
+                size = sum(len(x) for x in batch)
+                with self._prefetch_lock:
+                    if self._prefetch_sent + size > self.prefetch_max_characters:
+                        self._logger.warning("translation prefetch stopped by the budget of %s characters, %s: %s of %s texts left",
+                                             str(self.prefetch_max_characters), language, str(len(missing) - done), str(len(missing)))
+                        return sent
+                    self._prefetch_sent += size
+                try:
+                    results = self.backend.translate(batch, language)
+                except TranslationException as e:
+                    self._logger.error("translation prefetch failed, %s: %s", language, str(e))
+                    return sent
+                for text, result in zip(batch, results):
+                    self._add(language, text, result)
+                sent += size
+                done += len(batch)
+                self._logger.info("translation prefetch, %s: %s of %s texts", language, str(done), str(len(missing)))
+        return sent
+
+    def _language(self, language: str) -> str:
+        return language if language and language in self.supported_languages else self.default_language
+
+    def _add(self, language: str, text: str, translated: str) -> str:
+        """puts the result of the backend into the cache; a text the backend cannot translate stays in English,
+        and is kept in the memory only, so it is not requested again"""
+        self.cached_translations.setdefault(language, {})[text] = translated or text
+        if translated and self.backend.persistent:
+            self.store.add(language, text, translated)
+        return translated or text
+
+    def _translate_missing(self, text: str, language: str) -> str:
+        """requests the translation and stores it into the cache"""
+        return self._add(language, text, self.backend.translate([text], language)[0])
 
     def translate(self, text:str, language:str) -> str:
-        if not language or language not in self.supported_languages:
-            language = self.default_language
+        language = self._language(language)
+        if language == 'en':
+            return text
+        translated = self.cached_translations.get(language, {}).get(text, None)
+        if translated:
+            return translated
+        try:
+            return self._translate_missing(text, language)
+        except TranslationException as e:
+            self._logger.error("translation into %s failed: %s", language, str(e))
+            return text
+
+    def compile(self, language: str) -> MessageCatalog:
+        """the catalog of the config texts in the language; a text missing in the translations stays in English
+        until the prefetch of the language, requested after the compile by prefetch_missing, ends"""
+        target = self._language(language)
+        if target == 'en':
+            return MessageCatalog(target, lambda text: text, config_texts())
+        cached = self.cached_translations.setdefault(target, {})
+        return MessageCatalog(target, lambda text: cached.get(text, None) or self.translate_later(text, target), config_texts())
+
+    def translate_later(self, text: str, language: str) -> str:
+        """requests the translation without waiting for it, returns None; a config text is left to the prefetch
+        of the language, sending the missing texts in batches"""
+        if text in self._config_texts:
+            if language not in self._prefetched_languages:
+                self._missing.add(language)
+        else:
+            self._request(text, language)
+        return None
+
+    def _request(self, text: str, language: str) -> Future:
+        """the translation in the thread pool, shared by the concurrent requests of the same text"""
+        key = (text, language)
+        future = self._inflight.get(key, None)
+        if not future:
+            future = self._executor.submit(self._translate_missing, text, language)
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    async def translate_async(self, text: str, language: str) -> str:
+        """a cache miss is translated in the thread pool, and concurrent requests of the same text share the request;
+        after timeout seconds (if set) the English text is returned, the translation still goes into the cache"""
+        language = self._language(language)
         if language == 'en':
             return text
-        dict_entry = self.cached_translations.get(language, dict())
-        translated = dict_entry.get(text, None)
-        if not translated:
-            translated = self.translator.translate_text(text, 
-                        source_lang='en', target_lang=language, split_sentences='off', preserve_formatting=True, formality=self.formality).text
-            dict_entry[text] = translated
-            self.dump(language, dict_entry)
-        return translated
+        translated = self.cached_translations.get(language, {}).get(text, None)
+        if translated:
+            return translated
+        future = asyncio.wrap_future(self._request(text, language))
+        try:
+            if self.timeout > 0:
+                return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            return await future
+        except asyncio.TimeoutError:
+            self._logger.warning("translation into %s is late, answered in English: %s", language, text)
+        except TranslationException:
+            pass
+        return text
+
+    def _done(self, key: tuple, future: Future) -> None:
+        """called in the thread of the translation"""
+        self._inflight.pop(key, None)
+        if future.cancelled():
+            return
+        if future.exception():
+            self._logger.error("translation into %s failed: %s", key[1], str(future.exception()))
+        elif future.result() != key[0]:
+            invalidate_catalogs(key[1])
+
+    def close(self) -> None:
+        """waits for the translations requested so far, and writes them into the translation files;
+        the prefetch stops after its current request"""
+        self._closing = True
+        self._executor.shutdown()
+        self.store.close()
 
@@ -0,0 +1,108 @@
+"""persistence of the translated pairs; run from the root folder to merge the journals into the JSON files:
+python code/translationstore.py"""
+import json
+import os
+from os import path
+from writebehind import WriteBehind
+
+class TranslationStore:
+    """keeps the human editable <language>.json files, and appends the pairs translated since the last compaction
+    into <language>.journal, one JSON pair per line; new pairs are written in batches by the write-behind worker.
+    Compaction merges the journal into the JSON file read again from the disk, and the entries of the file win,
+    so entries edited by hand while the bot was running are not overwritten by machine translations"""
+
+    def __init__(self, storage_path: str, flush_seconds: float = 0, compact_records: int = 0):
+        self.storage_path = storage_path
+        self.compact_records = compact_records
+        self.records = {}       #language: pairs in the journal
+        self._write_behind = WriteBehind(flush_seconds, self._write)
+
+    def _file(self, language: str, extension: str) -> str:
+        return path.join(self.storage_path, language + extension)
+
+    def languages(self) -> set:
+        result = set()
+        for f in next(os.walk(self.storage_path))[2]:
+            language, extension = path.splitext(f)
+            if len(language) == 2 and extension in (".json", ".journal"):
+                result.add(language)
+        return result
+
+    def _read_json(self, language: str) -> dict:
+        try:
+            with open(self._file(language, ".json"), 'r', encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _read_journal(self, language: str) -> dict:
+        result = {}
+        try:
+            with open(self._file(language, ".journal"), 'r', encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        text, translated = json.loads(line)
+                    except ValueError:
+                        #the last line may be broken by a crash in the middle of a write
+                        continue
+                    result[text] = translated
+        except FileNotFoundError:
+            pass
+        self.records[language] = len(result)
+        return result
+
+    def load(self) -> dict[str, dict]:
+        """the pairs of every language: journal entries overridden by the JSON file"""
+        result = {}
+        for language in self.languages():
+            try:
+                entry = self._read_journal(language)
+                entry.update(self._read_json(language))
+                result[language] = entry
+            except (IOError, ValueError) as e:
+                print("translate failed to read: %s, %s" % (language, str(e)))
+        return result
+
+    def add(self, language: str, text: str, translated: str) -> None:
+        """queues the new pair for the journal of the language"""
+        self._write_behind.mark(language, text, translated)
+
+    def _write(self, dirty: dict) -> None:
+        """appends the queued pairs to the journals; called from the write-behind worker"""
+        pairs = {}
+        for (language, text), translated in dirty.items():
+            pairs.setdefault(language, []).append((text, translated))
+        for language, entries in pairs.items():
+            with open(self._file(language, ".journal"), 'a', encoding="utf-8") as f:
+                for e in entries:
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+            self.records[language] = self.records.get(language, 0) + len(entries)
+            if self.compact_records and self.records[language] >= self.compact_records:
+                self.compact(language)
+
+    def compact(self, language: str = None) -> None:
+        """merges the journal into the JSON file, of the given language or of all languages"""
+        for l in [language] if language else self.languages():
+            journal = self._read_journal(l)
+            if not journal:
+                continue
+            entry = self._read_json(l)
+            for text, translated in journal.items():
+                entry.setdefault(text, translated)
+            tmp = self._file(l, ".json.tmp")
+            with open(tmp, 'w', encoding="utf-8") as f:
+                json.dump(entry, f, indent=4, ensure_ascii=False)
+            os.replace(tmp, self._file(l, ".json"))
+            os.remove(self._file(l, ".journal"))
+            self.records[l] = 0
+
+    def flush(self) -> None:
+        self._write_behind.flush()
+
+    def close(self) -> None:
+        """writes the queued pairs, and compacts the journals"""
+        self._write_behind.close()
+        self.compact()
+
+if __name__ == "__main__":
+    TranslationStore(path.join(".", "translations")).compact()
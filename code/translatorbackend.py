@@ -0,0 +1,99 @@
+"""translation services used by the translator"""
+from abc import ABC, abstractmethod
+import json
+import os
+from os import path
+import time
+import deepl
+from myexception import TranslationException
+
+class TranslatorBackend(ABC):
+    """translates English texts; persistent is False if the results are not worth keeping in the translation files"""
+    name = ""
+    persistent = True
+
+    @abstractmethod
+    def target_languages(self) -> list[str]:
+        """lowercase codes of the languages the texts can be translated into"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def translate(self, texts: list[str], language: str) -> list[str]:
+        """translations of the texts, None for a text it cannot translate"""
+        raise NotImplementedError
+
+class DeepLBackend(TranslatorBackend):
+    """DeepL service; the client does not connect until the first request"""
+    name = "deepl"
+
+    def __init__(self, auth_key: str, formality: str):
+        self.translator = deepl.Translator(auth_key)
+        self.formality = "prefer_" + formality if formality and formality != "default" else formality
+
+    def target_languages(self) -> list[str]:
+        try:
+            return [l.code.lower() for l in self.translator.get_target_languages()]
+        except deepl.DeepLException as e:
+            raise TranslationException(str(e)) from e
+
+    def translate(self, texts: list[str], language: str) -> list[str]:
+        try:
+            results = self.translator.translate_text(texts, source_lang='en', target_lang=language,
+                split_sentences='off', preserve_formatting=True, formality=self.formality)
+        except deepl.DeepLException as e:
+            raise TranslationException(str(e)) from e
+        return [r.text for r in results]
+
+class DictionaryBackend(TranslatorBackend):
+    """no service: only the translations kept in the translation files are used, other texts stay in English"""
+    name = "dictionary"
+
+    def __init__(self, storage_path: str):
+        self.storage_path = storage_path
+
+    def target_languages(self) -> list[str]:
+        return sorted({path.splitext(f)[0] for f in next(os.walk(self.storage_path))[2]
+                       if len(path.splitext(f)[0]) == 2 and path.splitext(f)[1] in (".json", ".journal")})
+
+    def translate(self, texts: list[str], language: str) -> list[str]:
+        return [None] * len(texts)
+
+class LocalBackend(TranslatorBackend):
+    """stand-in for tests and offline runs: texts are returned as they are, the translation files are still used"""
+    name = "local"
+    persistent = False
+
+    def target_languages(self) -> list[str]:
+        return []
+
+    def translate(self, texts: list[str], language: str) -> list[str]:
+        return list(texts)
+
+class LanguageCache:
+    """the target languages of a backend kept in a file, so the start does not wait for the service;
+    the list is requested again when it is older than ttl seconds"""
+
+    def __init__(self, file_path: str, backend: TranslatorBackend, ttl: float):
+        self.file_path = file_path
+        self.backend = backend
+        self.ttl = ttl
+
+    def read(self) -> (list[str], bool):
+        """the cached languages, and whether they are still fresh"""
+        try:
+            with open(self.file_path, 'r', encoding="utf-8") as f:
+                cached = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return [], False
+        if cached.get("backend", None) != self.backend.name:
+            return [], False
+        return cached["languages"], time.time() - cached["time"] < self.ttl
+
+    def refresh(self) -> list[str]:
+        """requests the languages from the backend and writes them into the file"""
+        languages = self.backend.target_languages()
+        tmp = self.file_path + ".tmp"
+        with open(tmp, 'w', encoding="utf-8") as f:
+            json.dump({"backend": self.backend.name, "time": time.time(), "languages": languages}, f, indent=4)
+        os.replace(tmp, self.file_path)
+        return languages
@@ -0,0 +1,107 @@
+"""concurrent processing of the incoming updates"""
+import asyncio
+from collections import deque
+import logging
+import time
+from typing import Awaitable, Callable
+
+class DispatchMetrics:
+    """time the updates waited from their arrival to the start of their processing"""
+    def __init__(self):
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.running = 0
+
+    def add(self, wait: float) -> None:
+        self.count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def __str__(self) -> str:
+        average = self.total_wait / self.count if self.count else 0
+        return "updates %s, running %s, wait average %.3fs, max %.3fs" % (str(self.count), str(self.running), average, self.max_wait)
+
+class UpdateDispatcher:
+    """runs the updates of different users concurrently, at most max_concurrent of them at a time;
+    the updates of one user are processed one after another in their arrival order.
+    With max_pending set, the reader of the incoming updates waits (wait_room) while that many are not processed,
+    so the updates are kept in the bounded incoming queue instead"""
+
+    def __init__(self, process: Callable[[object], Awaitable], max_concurrent: int, slow_wait_seconds: float = 0, metrics_log_updates: int = 0,
+                 max_pending: int = 0):
+        self._process = process
+        self._semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+        self._pending = {}      #user key: deque of (update, arrival time) not processed yet
+        self._tasks = set()
+        self.max_pending = max_pending
+        self.outstanding = 0    #submitted and not processed updates
+        self._room = asyncio.Event()
+        self._room.set()
+        self.slow_wait_seconds = slow_wait_seconds
+        self.metrics_log_updates = metrics_log_updates
+        self.metrics = DispatchMetrics()
+        self.logger = logging.getLogger("main")
+
+    @staticmethod
+    def key(update) -> object:
+        """updates are ordered per user, or per chat if the update has no user"""
+        user = getattr(update, "effective_user", None)
+        if user:
+            return ('user', user.id)
+        chat = getattr(update, "effective_chat", None)
+        if chat:
+            return ('chat', chat.id)
+        return ('update', id(update))
+
+    def submit(self, update) -> None:
+        """queues the update after the updates of the same user, it is processed in the background"""
+        key = UpdateDispatcher.key(update)
+        self.outstanding += 1
+        if self.max_pending and self.outstanding >= self.max_pending:
+            self._room.clear()
+        pending = self._pending.get(key, None)
+        if pending is not None:
+            pending.append((update, time.monotonic()))
+            return
+        self._pending[key] = deque([(update, time.monotonic())])
+        task = asyncio.create_task(self._run(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: object) -> None:
+        pending = self._pending[key]
+        try:
+            while pending:
+                update, arrived = pending[0]
+                async with self._semaphore:
+                    self._started(time.monotonic() - arrived)
+                    try:
+                        await self._process(update)
+                    except Exception as e:
+                        self.logger.error("update processing failed: %s", str(e))
+                    finally:
+                        self.metrics.running -= 1
+                pending.popleft()
+                self.outstanding -= 1
+                if not self.max_pending or self.outstanding < self.max_pending:
+                    self._room.set()
+        finally:
+            del self._pending[key]
+
+    def _started(self, wait: float) -> None:
+        self.metrics.add(wait)
+        self.metrics.running += 1
+        if self.slow_wait_seconds and wait > self.slow_wait_seconds:
+            self.logger.warning("update waited %.3fs to be processed, %s", wait, str(self.metrics))
+        if self.metrics_log_updates and self.metrics.count % self.metrics_log_updates == 0:
+            self.logger.info("dispatch: %s", str(self.metrics))
+
+    async def wait_room(self) -> None:
+        """returns when one more update can be submitted"""
+        await self._room.wait()
+
+    async def join(self) -> None:
+        """waits until the queued updates are processed"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
@@ -0,0 +1,20 @@
+"""waiting queue of spare players"""
+from player import Player
+from playerlist import PlayerList
+
+class Waitlist(PlayerList):
+    """FIFO queue of spare players waiting for a free place in the main list"""
+
+    def take_fitting(self, free: int) -> list[Player]:
+        """removes and returns, in the queue order, the players whose parties fit into the free places;
+        a party bigger than the places left is skipped and keeps its position, so the queue is walked once"""
+        taken = []
+        for p in self:
+            if free <= 0:
+                break
+            if p.participants <= free:
+                taken.append(p)
+                free -= p.participants
+        for p in taken:
+            self.remove(p)
+        return taken
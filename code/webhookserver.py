@@ -0,0 +1,138 @@
+"""webhook endpoint receiving the updates posted by Telegram; run from the root folder to post recorded updates
+(JSON files, one update per file) to the local endpoint, as Telegram would:
+python code/webhookserver.py update1.json update2.json"""
+import asyncio
+import hmac
+from http import HTTPStatus
+import json
+import logging
+import sys
+from typing import Callable
+import urllib.error
+import urllib.request
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+class WebhookServer:
+    """minimal HTTP/1.1 server on asyncio streams: accepts POST requests to the path carrying the secret token,
+    decodes the JSON body and puts the update into the queue; a body not decoded into an update is refused with 400.
+    When the queue is full the request waits for put_timeout seconds, and is then refused with 503,
+    so Telegram delivers the update again later.
+    stop() refuses new requests and waits for those being received"""
+    MAX_HEADERS = 100
+
+    def __init__(self, host: str, port: int, path: str, secret_token: str, queue: asyncio.Queue, decode: Callable[[dict], object],
+                 put_timeout: float = 5, read_timeout: float = 10, max_body: int = 1 << 20):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token
+        self.queue = queue
+        self.decode = decode
+        self.put_timeout = put_timeout
+        self.read_timeout = read_timeout
+        self.max_body = max_body
+        self.stopping = False
+        self.accepted = 0
+        self.refused = 0
+        self._server = None
+        self._connections = set()
+        self.logger = logging.getLogger("main")
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        if not self.port:
+            self.port = self._server.sockets[0].getsockname()[1]
+        self.logger.info("webhook is listening on %s:%s%s", self.host, str(self.port), self.path)
+
+    async def stop(self) -> None:
+        """no new updates are accepted; returns when the requests being received are answered"""
+        self.stopping = True
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._connections:
+            await asyncio.gather(*list(self._connections), return_exceptions=True)
+        self.logger.info("webhook is stopped, updates accepted %s, refused %s", str(self.accepted), str(self.refused))
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        try:
+            try:
+                status = await asyncio.wait_for(self._receive(reader), self.read_timeout)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                status = HTTPStatus.BAD_REQUEST
+            if status != HTTPStatus.OK:
+                self.refused += 1
+            retry = "Retry-After: 1\r\n" if status == HTTPStatus.SERVICE_UNAVAILABLE else ""
+            writer.write(("HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n%s\r\n" %
+                          (status.value, status.phrase, retry)).encode("ascii"))
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(asyncio.current_task())
+
+    async def _receive(self, reader: asyncio.StreamReader) -> HTTPStatus:
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            if len(headers) >= WebhookServer.MAX_HEADERS:
+                return HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        if target != self.path:
+            return HTTPStatus.NOT_FOUND
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()):
+            self.logger.warning("webhook request with a wrong secret token is refused")
+            return HTTPStatus.FORBIDDEN
+        if self.stopping:
+            return HTTPStatus.SERVICE_UNAVAILABLE
+        length = int(headers.get("content-length", -1))
+        if length < 0:
+            return HTTPStatus.LENGTH_REQUIRED
+        if length > self.max_body:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        body = await reader.readexactly(length)
+        try:
+            update = self.decode(json.loads(body))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.logger.warning("webhook request with a wrong update is refused: %s", str(e))
+            return HTTPStatus.BAD_REQUEST
+        if update is None:
+            self.logger.warning("webhook request without an update is refused")
+            return HTTPStatus.BAD_REQUEST
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self.queue.put(update), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning("webhook queue is full (%s updates), the update is refused", str(self.queue.qsize()))
+                return HTTPStatus.SERVICE_UNAVAILABLE
+        self.accepted += 1
+        return HTTPStatus.OK
+
+def post_update(url: str, secret_token: str, update: dict) -> int:
+    """posts the update as Telegram does, returns the HTTP status"""
+    request = urllib.request.Request(url, json.dumps(update).encode("utf-8"), method="POST",
+                                     headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret_token})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+if __name__ == "__main__":
+    from config import credentials, preferences
+    w = preferences["ingestion"]
+    for file_name in sys.argv[1:]:
+        with open(file_name, 'r', encoding="utf-8") as f:
+            print(file_name, post_update("http://%s:%s%s" % (w["listen"], str(w["port"]), w["path"]),
+                                         credentials["telegram"]["bot"]["webhook_secret"], json.load(f)))
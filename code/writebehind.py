@@ -0,0 +1,74 @@
+"""write-behind persistence: coalescing of save requests, flushed from a worker thread"""
+import logging
+import threading
+import time
+from typing import Callable
+
+class WriteBehind:
+    """collects dirty data parts and flushes them at most once per window from a worker thread;
+    a part marked several times within the window is written once, with its latest value"""
+    window: float
+    flushes: int
+
+    def __init__(self, window: float, flush: Callable[[dict], None]):
+        self.window = window
+        self.flushes = 0
+        self._flush = flush
+        self._dirty = {}
+        self._closed = False
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._logger = logging.getLogger("main")
+        self._thread = None
+        if window > 0:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def mark(self, part: str, key = None, value = None) -> None:
+        """marks the part (or the keyed entry of the part) as dirty, value is what has to be saved"""
+        with self._cond:
+            self._dirty[(part, key)] = value
+            self._cond.notify()
+        if not self._thread:
+            self.flush()
+
+    def flush(self) -> None:
+        """writes all dirty parts now; parts failed to write are kept dirty for the next attempt"""
+        with self._flush_lock:
+            with self._cond:
+                dirty, self._dirty = self._dirty, {}
+            if not dirty:
+                return
+            try:
+                self._flush(dirty)
+                self.flushes += 1
+            except Exception as e:
+                #e.g. the file cannot be written now, the parts are kept for the next flush
+                self._logger.error("write-behind flush failed, will retry: %s", str(e))
+                with self._cond:
+                    for k, v in dirty.items():
+                        self._dirty.setdefault(k, v)
+
+    def close(self) -> None:
+        """stops the worker and flushes everything left"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                deadline = time.monotonic() + self.window
+                while not self._closed and (remaining := deadline - time.monotonic()) > 0:
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            self.flush()